@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+import copy
+
+# thred操作
+import threading
+
+import ccxt
+
+
+# ###############################################################
+# REST API 計測 クラス
+#   BitMEXラッパーのメソッド毎に、処理時間のヒストグラム、呼び出し回数、
+#   エラー種別毎の回数、タイムアウト・レート制限の回数を集計する。
+#   また、最後に受信したレート制限のヘッダ(x-ratelimit-*)を保持する。
+# ###############################################################
+class ApiStats:
+
+    # ヒストグラムの区切り(ミリ秒)。最後の区切りより大きいものは "inf" に入る
+    BUCKETS_MS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+    # ==================================
+    # 初期化
+    # ==================================
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._ratelimit = {"limit": None, "remaining": None, "reset": None}
+
+    # ==================================
+    # 1回分の呼び出し結果を記録
+    #   params:
+    #       name: メソッド名
+    #       elapsed: 処理時間(秒)
+    #       error: 発生した例外（正常終了はNone）
+    # ==================================
+    def record(self, name, elapsed, error=None):
+        ms = elapsed * 1000
+        bucket = "inf"
+        for b in ApiStats.BUCKETS_MS:
+            if ms <= b:
+                bucket = b
+                break
+
+        with self._lock:
+            s = self._stats.get(name)
+            if s is None:
+                s = {
+                    "count": 0,
+                    "errors": {},
+                    "timeouts": 0,
+                    "rate_limited": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "last_ms": 0.0,
+                    "histogram": dict(
+                        [(b, 0) for b in ApiStats.BUCKETS_MS + ["inf"]]
+                    ),
+                }
+                self._stats[name] = s
+            s["count"] += 1
+            s["total_ms"] += ms
+            s["max_ms"] = max(s["max_ms"], ms)
+            s["last_ms"] = ms
+            s["histogram"][bucket] += 1
+            if error is not None:
+                key = type(error).__name__
+                s["errors"][key] = s["errors"].get(key, 0) + 1
+                if isinstance(error, ccxt.RequestTimeout):
+                    s["timeouts"] += 1
+                elif isinstance(error, ccxt.DDoSProtection):
+                    s["rate_limited"] += 1
+
+    # ==================================
+    # レート制限ヘッダの記録
+    #   params:
+    #       headers: ccxtのlast_response_headers
+    # ==================================
+    def record_ratelimit(self, headers):
+        if not headers:
+            return
+        remaining = headers.get("x-ratelimit-remaining")
+        if remaining is None:
+            return
+        with self._lock:
+            self._ratelimit = {
+                "limit": headers.get("x-ratelimit-limit"),
+                "remaining": remaining,
+                "reset": headers.get("x-ratelimit-reset"),
+            }
+
+    # ==================================
+    # スナップショット
+    #   return:
+    #       {'methods': {name: {...}}, 'ratelimit': {'limit', 'remaining', 'reset'}}
+    # ==================================
+    def snapshot(self):
+        with self._lock:
+            return {
+                "methods": copy.deepcopy(self._stats),
+                "ratelimit": dict(self._ratelimit),
+            }
+
+    # ==================================
+    # ログ出力用の要約
+    # ==================================
+    def summary(self):
+        snapshot = self.snapshot()
+        items = []
+        for name, s in sorted(snapshot["methods"].items()):
+            items.append(
+                "{}: n={}, err={}, timeout={}, ratelimit={}, "
+                "avg={:.0f}ms, max={:.0f}ms".format(
+                    name,
+                    s["count"],
+                    sum(s["errors"].values()),
+                    s["timeouts"],
+                    s["rate_limited"],
+                    s["total_ms"] / s["count"],
+                    s["max_ms"],
+                )
+            )
+        items.append("remaining={}".format(snapshot["ratelimit"]["remaining"]))
+        return " | ".join(items)
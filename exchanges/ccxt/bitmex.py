@@ -5,6 +5,12 @@ import time
 import math
 import json
 
+# thred操作
+import threading
+import queue
+import itertools
+from contextlib import contextmanager
+
 # fetch_ohlcv改良
 from datetime import datetime
 import calendar
@@ -14,6 +20,21 @@ import logging
 
 import pandas as pd
 
+# OHLCVローカルキャッシュ
+from exchanges.ccxt.ohlcv_cache import OhlcvCache
+
+# 注文バッチ
+from exchanges.ccxt.order_batch import OrderBatch, BatchOrder
+
+# REST API 計測
+from exchanges.ccxt.api_stats import ApiStats
+
+# プール共有のレート制限
+from exchanges.ccxt.throttle import SharedThrottle
+
+# 足幅変換
+from exchanges.resample import resample
+
 # ###############################################################
 # bitmex クラス
 # ###############################################################
@@ -27,19 +48,66 @@ class BitMEX:
     # 初期化
     # ==================================
     def __init__(
-        self, symbol=SYMBOL, apiKey=None, secret=None, logger=None, use_testnet=False
+        self,
+        symbol=SYMBOL,
+        apiKey=None,
+        secret=None,
+        logger=None,
+        use_testnet=False,
+        ohlcv_cache_dir=None,
+        pool_size=4,
     ):
+        self._apiKey = apiKey
+        self._secret = secret
+        self._use_testnet = use_testnet
+
+        # 全ての取引所オブジェクトで共有するレート制限
+        self._throttle = SharedThrottle()
+
         # 取引所オブジェクト(ccxt.bitmex)
-        self._exchange = ccxt.bitmex({"apiKey": apiKey, "secret": secret})
-        # TestNet利用有無
-        if use_testnet == True:
-            # for TESTNET
-            self._exchange.urls["api"] = self._exchange.urls["test"]
+        #   Puppet等が直接利用するため残しておく。ラッパーのメソッドはプールのオブジェクトを使う。
+        #   プールには含まれないが、_create_client で生成するので共有のレート制限で送信する
+        self._exchange = self._create_client()
+
+        # -------------------------------------------------------
+        # 取引所オブジェクトのプール
+        #   ccxtの取引所オブジェクトはセッションやnonceの状態を持つため、スレッド間で共有しない。
+        #   メインループ、Candle、Balance等のスレッドはそれぞれプールから取り出して並列に使う。
+        #   load_marketsの結果は self._exchange で1回だけ取得して各オブジェクトに共有する。
+        # -------------------------------------------------------
+        self._pool_size = pool_size
+        # 最後に返却されたオブジェクト(keep-alive中のセッション)を優先して使う
+        self._pool = queue.LifoQueue()
+        self._pool_count = 0
+        self._pool_lock = threading.Lock()
+        self._markets_lock = threading.Lock()
+
+        # メソッド毎の処理時間・エラー回数
+        self._stats = ApiStats()
 
         self._symbol = symbol
 
         self._logger = logger if logger is not None else logging.getLogger(__name__)
 
+        # OHLCVローカルキャッシュ(未指定の場合は使用しない)
+        self._ohlcv_cache = (
+            OhlcvCache(ohlcv_cache_dir, self._logger)
+            if ohlcv_cache_dir is not None
+            else None
+        )
+        # キャッシュ更新のロック(シンボル・タイムフレーム毎)
+        self._ohlcv_locks = {}
+        self._ohlcv_locks_lock = threading.Lock()
+
+        # 注文結果の通知先
+        self._order_listeners = []
+
+        # 注文バッチ(begin_batchを呼び出したスレッドのみ有効)
+        self._batch_local = threading.local()
+
+        # clOrdIDの連番（同じミリ秒の注文を区別する）
+        self._order_seq = itertools.count()
+
         self._logger.info("class BitMEX initialized")
 
     # ===========================================================
@@ -137,6 +205,285 @@ class BitMEX:
             order for order in open_orders if 0 < order["info"]["clOrdID"].find(clOrdID)
         ]
 
+    # ##########################################################
+    # 取引所オブジェクトのプール
+    # ##########################################################
+    # ==========================================================
+    # 取引所オブジェクト(ccxt.bitmex)の生成
+    #   レート制限はオブジェクト毎ではなく、プール全体(self._exchangeを含む)で1つの間隔を守る
+    #   （ccxtは enableRateLimit が有効な時だけ throttle を呼ぶ。古いccxtは既定で無効なので指定する）
+    # ==========================================================
+    def _create_client(self):
+        exchange = ccxt.bitmex(
+            {"apiKey": self._apiKey, "secret": self._secret, "enableRateLimit": True}
+        )
+        exchange.throttle = lambda cost=None: self._throttle.wait(
+            exchange.rateLimit, cost
+        )
+        # TestNet利用有無
+        if self._use_testnet == True:
+            # for TESTNET
+            exchange.urls["api"] = exchange.urls["test"]
+        return exchange
+
+    # ==========================================================
+    # プールから取引所オブジェクトを借りる
+    #   params:
+    #       name: 計測用のメソッド名（指定した場合、処理時間と結果をstatsに記録する）
+    #   使用例:
+    #       with bitmex.client() as exchange:
+    #           exchange.fetch_ticker(...)
+    # ==========================================================
+    @contextmanager
+    def client(self, name=None):
+        exchange = self.__acquire()
+        start = time.time()
+        error = None
+        try:
+            # load_marketsの結果を共有する
+            if getattr(exchange, "markets", {}) is None:
+                self.__share_markets(exchange)
+            yield exchange
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if name is not None:
+                self._stats.record(name, time.time() - start, error)
+                self._stats.record_ratelimit(
+                    getattr(exchange, "last_response_headers", None)
+                )
+            self._pool.put(exchange)
+
+    # ==========================================================
+    # REST API 計測結果
+    #   return:
+    #       {'methods': {name: {'count', 'errors', 'timeouts', 'rate_limited',
+    #                           'total_ms', 'max_ms', 'last_ms', 'histogram'}},
+    #        'ratelimit': {'limit', 'remaining', 'reset'}}
+    # ==========================================================
+    def stats(self):
+        return self._stats.snapshot()
+
+    # ==========================================================
+    # REST API 計測結果（ログ出力用の要約）
+    # ==========================================================
+    def stats_summary(self):
+        return self._stats.summary()
+
+    # ==========================================================
+    # 空きが無ければ生成（上限に達していたら返却を待つ）
+    # ==========================================================
+    def __acquire(self):
+        try:
+            exchange = self._pool.get_nowait()
+        except queue.Empty:
+            with self._pool_lock:
+                create = self._pool_count < self._pool_size
+                if create:
+                    self._pool_count += 1
+            exchange = self._create_client() if create else self._pool.get()
+        return exchange
+
+    # ==========================================================
+    # load_marketsの共有
+    # ==========================================================
+    def __share_markets(self, exchange):
+        with self._markets_lock:
+            if self._exchange.markets is None:
+                self._exchange.load_markets()
+        exchange.set_markets(self._exchange.markets, self._exchange.currencies)
+
+    # ##########################################################
+    # 注文結果の通知
+    # ##########################################################
+    # ==========================================================
+    # 通知先の登録
+    #   param:
+    #       callback: callback(orders) ordersはBitMEX形式の注文リスト
+    # ==========================================================
+    def add_order_listener(self, callback):
+        self._order_listeners.append(callback)
+
+    # ==========================================================
+    # 注文結果をBitMEX形式(ccxtの場合はinfo)に揃えて通知する
+    # ==========================================================
+    def __notify_orders(self, orders):
+        if len(self._order_listeners) == 0 or orders is None:
+            return
+        if isinstance(orders, dict):
+            orders = [orders]
+        orders = [
+            o["info"] if "info" in o else o
+            for o in orders
+            if isinstance(o, dict) and "orderID" in o.get("info", o)
+        ]
+        if len(orders) == 0:
+            return
+        for callback in self._order_listeners:
+            try:
+                callback(orders)
+            except Exception as e:
+                self._logger.error("■ order listener: exception={}".format(e))
+
+    # ##########################################################
+    # 注文バッチ
+    #   begin_batch() 〜 end_batch() の間に呼び出された
+    #   limit_order, limit_settle_order, amend_order, cancel_order は即時に発行せず、
+    #   BatchOrder を戻す。flush時に bulk create, bulk amend, 複数ID cancel にまとめて発行し、
+    #   それぞれの BatchOrder.result に結果を設定する。
+    # ##########################################################
+    # ==========================================================
+    # バッチ開始
+    # ==========================================================
+    def begin_batch(self):
+        if self.__batch() is None:
+            self._batch_local.batch = OrderBatch()
+
+    # ==========================================================
+    # バッチ発行（バッチは継続する）
+    #   return:
+    #       BatchOrder のリスト
+    # ==========================================================
+    def flush_batch(self):
+        batch = self.__batch()
+        if batch is None or len(batch) == 0:
+            return []
+
+        groups = batch.take()
+        self.__flush_create(groups[BatchOrder.CREATE])
+        self.__flush_amend(groups[BatchOrder.AMEND])
+        self.__flush_cancel(groups[BatchOrder.CANCEL])
+
+        orders = (
+            groups[BatchOrder.CREATE]
+            + groups[BatchOrder.AMEND]
+            + groups[BatchOrder.CANCEL]
+        )
+
+        # IDが見つからない注文はエラーをログに出す（例外にはせず、BatchOrder.result で確認する）
+        for o in groups[BatchOrder.AMEND] + groups[BatchOrder.CANCEL]:
+            if o.is_error() and o.result["error"]["message"] in [
+                "Invalid orderID",
+                "Not Found",
+            ]:
+                self._logger.error("■ batch {}: {}".format(o.kind, o))
+
+        return orders
+
+    # ==========================================================
+    # バッチ終了（残りを発行してバッチを終える）
+    #   return:
+    #       BatchOrder のリスト
+    # ==========================================================
+    def end_batch(self):
+        try:
+            return self.flush_batch()
+        finally:
+            self._batch_local.batch = None
+
+    # ==========================================================
+    # 注文に設定する「clOrdID」のID情報
+    #   ミリ秒の時刻 + 連番の下3桁（同じミリ秒の注文でも重複しない）
+    # ==========================================================
+    def __order_id(self):
+        seq = next(self._order_seq) % 1000
+        return "{}{:03d}".format(int(time.time() * 1000), seq)
+
+    # ==========================================================
+    # 現在のスレッドのバッチ（バッチ中でなければNone）
+    # ==========================================================
+    def __batch(self):
+        return getattr(self._batch_local, "batch", None)
+
+    # ==========================================================
+    # バッチ結果をBatchOrderに設定する
+    #   params:
+    #       orders: BatchOrder のリスト
+    #       results: BitMEXの応答（注文のリスト or エラー）
+    #       key: 注文と応答を対応させるキー (clOrdID or orderID)
+    #       parse: ccxtの注文形式に変換するか
+    # ==========================================================
+    def __resolve(self, orders, results, key, parse=False):
+        if isinstance(results, dict) and isinstance(results.get("error"), dict):
+            for o in orders:
+                o.resolve(results)
+            return
+
+        if isinstance(results, dict):
+            results = [results]
+
+        by_key = {r.get(key): r for r in results}
+        for o in orders:
+            r = by_key.get(o.params.get(key))
+            if r is None:
+                o.resolve({"error": {"message": "Not Found", "name": "BitMEX.batch"}})
+            elif r.get("error"):
+                o.resolve({"error": {"message": r["error"], "name": "HTTPError"}})
+            elif parse:
+                o.resolve(self._exchange.parse_order(r))
+            else:
+                o.resolve(r)
+
+    # ==========================================================
+    # bulk create
+    # ==========================================================
+    def __flush_create(self, orders):
+        if len(orders) == 0:
+            return
+        results = self.bulk_order([o.params for o in orders])
+        self.__resolve(orders, results, "clOrdID", parse=True)
+
+    # ==========================================================
+    # bulk amend
+    # ==========================================================
+    def __flush_amend(self, orders):
+        if len(orders) == 0:
+            return
+        if len(orders) == 1:
+            # 1件の場合は通常の注文更新
+            results = self.__request(
+                "amend order", "privatePutOrder", orders[0].params
+            )
+        else:
+            results = self.__request(
+                "bulk amend",
+                "privatePutOrderBulk",
+                {"orders": json.dumps([o.params for o in orders])},
+            )
+        self.__resolve(orders, results, "orderID")
+
+    # ==========================================================
+    # 複数ID cancel (orderID指定とclOrdID指定でそれぞれ1回)
+    # ==========================================================
+    def __flush_cancel(self, orders):
+        for key in ["orderID", "clOrdID"]:
+            _orders = [o for o in orders if key in o.params]
+            if len(_orders) == 0:
+                continue
+            results = self.__request(
+                "bulk cancel",
+                "privateDeleteOrder",
+                {key: ",".join([o.params[key] for o in _orders])},
+            )
+            self.__resolve(_orders, results, key)
+
+    # ==========================================================
+    # ccxt呼び出し（例外はerrorオブジェクトにして戻す）
+    #   params:
+    #       method: ccxt.bitmex のメソッド名
+    # ==========================================================
+    def __request(self, name, method, params):
+        try:
+            with self.client(name.replace(" ", "_")) as exchange:
+                ret = getattr(exchange, method)(params)
+            self._logger.debug("■ {}={}".format(name, ret))
+            self.__notify_orders(ret)
+        except Exception as e:
+            self._logger.error("■ {}: exception={}".format(name, e))
+            ret = self.__get_error(e)
+        return ret
+
     # ##########################################################
     # ccxt関数ラッパー
     # ##########################################################
@@ -152,7 +499,8 @@ class BitMEX:
         orders = None
 
         try:
-            orders = self._exchange.fetch_open_orders(symbol)
+            with self.client("open_orders") as exchange:
+                orders = exchange.fetch_open_orders(symbol)
             self._logger.debug("■ open orders={}".format(orders))
         except Exception as e:
             self._logger.error("■ open orders: exception={}".format(e))
@@ -167,28 +515,46 @@ class BitMEX:
     #       price: 価格
     #       size: orderロット数
     #   return:
-    #       order
+    #       order (バッチ中は BatchOrder)
     # ==========================================================
     def limit_order(self, side, price, size):
 
         order = None
 
         # 注文に設定する「clOrdID」のID情報を作成・取得
-        order_id = str(time.time() * 1000)
+        order_id = self.__order_id()
 
-        try:
-            order = self._exchange.create_order(
-                symbol=self._symbol,
-                type="limit",
-                side=side,
-                amount=size,
-                price=price,
-                params={
+        # バッチ中は BatchOrder を戻す
+        batch = self.__batch()
+        if batch is not None:
+            return batch.add(
+                BatchOrder.CREATE,
+                {
+                    "symbol": BitMEX.INFO_SYMBOL,
+                    "side": side.capitalize(),
+                    "orderQty": size,
+                    "price": price,
+                    "ordType": "Limit",
                     "execInst": "ParticipateDoNotInitiate",
                     "clOrdID": "{}_limit_{}".format(order_id, side),
                 },
             )
+
+        try:
+            with self.client("limit_order") as exchange:
+                order = exchange.create_order(
+                    symbol=self._symbol,
+                    type="limit",
+                    side=side,
+                    amount=size,
+                    price=price,
+                    params={
+                        "execInst": "ParticipateDoNotInitiate",
+                        "clOrdID": "{}_limit_{}".format(order_id, side),
+                    },
+                )
             self._logger.debug("■ limit order={}".format(order))
+            self.__notify_orders(order)
         except Exception as e:
             self._logger.error("■ limit order: exception={}".format(e))
             order = self.__get_error(e)
@@ -208,17 +574,19 @@ class BitMEX:
         order = None
 
         # 注文に設定する「clOrdID」のID情報を作成・取得
-        order_id = str(time.time() * 1000)
+        order_id = self.__order_id()
 
         try:
-            order = self._exchange.create_order(
-                symbol=self._symbol,
-                type="market",
-                side=side,
-                amount=size,
-                params={"clOrdID": "{}_market_{}".format(order_id, side)},
-            )
+            with self.client("market_order") as exchange:
+                order = exchange.create_order(
+                    symbol=self._symbol,
+                    type="market",
+                    side=side,
+                    amount=size,
+                    params={"clOrdID": "{}_market_{}".format(order_id, side)},
+                )
             self._logger.debug("■ market order={}".format(order))
+            self.__notify_orders(order)
         except Exception as e:
             self._logger.error("■ market order: exception={}".format(e))
             order = self.__get_error(e)
@@ -232,28 +600,46 @@ class BitMEX:
     #       price: 価格
     #       size: orderロット数
     #   return:
-    #       order
+    #       order (バッチ中は BatchOrder)
     # ==========================================================
     def limit_settle_order(self, side, price, size):
 
         order = None
 
         # 注文に設定する「clOrdID」のID情報を作成・取得
-        order_id = str(time.time() * 1000)
+        order_id = self.__order_id()
 
-        try:
-            order = self._exchange.create_order(
-                symbol=self._symbol,
-                type="limit",
-                side=side,
-                amount=size,
-                price=price,
-                params={
+        # バッチ中は BatchOrder を戻す
+        batch = self.__batch()
+        if batch is not None:
+            return batch.add(
+                BatchOrder.CREATE,
+                {
+                    "symbol": BitMEX.INFO_SYMBOL,
+                    "side": side.capitalize(),
+                    "orderQty": size,
+                    "price": price,
+                    "ordType": "Limit",
                     "execInst": "ReduceOnly,ParticipateDoNotInitiate",
                     "clOrdID": "{}_limit_settle_{}".format(order_id, side),
                 },
             )
+
+        try:
+            with self.client("limit_settle_order") as exchange:
+                order = exchange.create_order(
+                    symbol=self._symbol,
+                    type="limit",
+                    side=side,
+                    amount=size,
+                    price=price,
+                    params={
+                        "execInst": "ReduceOnly,ParticipateDoNotInitiate",
+                        "clOrdID": "{}_limit_settle_{}".format(order_id, side),
+                    },
+                )
             self._logger.debug("■ limit settle order={}".format(order))
+            self.__notify_orders(order)
         except Exception as e:
             self._logger.error("■ limit settle order: exception={}".format(e))
             order = self.__get_error(e)
@@ -273,20 +659,22 @@ class BitMEX:
         order = None
 
         # 注文に設定する「clOrdID」のID情報を作成・取得
-        order_id = str(time.time() * 1000)
+        order_id = self.__order_id()
 
         try:
-            order = self._exchange.create_order(
-                symbol=self._symbol,
-                type="market",
-                side=side,
-                amount=size,
-                params={
-                    "execInst": "ReduceOnly",
-                    "clOrdID": "{}_market_settle_{}".format(order_id, side),
-                },
-            )
+            with self.client("market_settle_order") as exchange:
+                order = exchange.create_order(
+                    symbol=self._symbol,
+                    type="market",
+                    side=side,
+                    amount=size,
+                    params={
+                        "execInst": "ReduceOnly",
+                        "clOrdID": "{}_market_settle_{}".format(order_id, side),
+                    },
+                )
             self._logger.debug("■ market settle order={}".format(order))
+            self.__notify_orders(order)
         except Exception as e:
             self._logger.error("■ market settle order: exception={}".format(e))
             order = self.__get_error(e)
@@ -299,15 +687,22 @@ class BitMEX:
     #       options: order情報 (注意：数量を変える場合はorderQtyではなく、leavesQty を使う)
     #           orderID, price, leavesQty
     #   return:
-    #       order
+    #       order (バッチ中は BatchOrder)
     # ==========================================================
     def amend_order(self, **options):
 
         order = None
 
+        # バッチ中は BatchOrder を戻す
+        batch = self.__batch()
+        if batch is not None and "orderID" in options:
+            return batch.add(BatchOrder.AMEND, options)
+
         try:
-            order = self._exchange.privatePutOrder(options)
+            with self.client("amend_order") as exchange:
+                order = exchange.privatePutOrder(options)
             self._logger.debug("■ amend order={}".format(order))
+            self.__notify_orders(order)
         except Exception as e:
             self._logger.error("■ amend order: exception={}".format(e))
             order = self.__get_error(e)
@@ -323,15 +718,27 @@ class BitMEX:
     #   param:
     #       options: order情報 (orderID or clOrdID)
     #   return:
-    #       order
+    #       order (バッチ中は BatchOrder)
     # ==========================================================
     def cancel_order(self, **options):
 
         order = None
 
+        # バッチ中は BatchOrder を戻す（1件のorderID or clOrdID指定のみ）
+        batch = self.__batch()
+        if (
+            batch is not None
+            and len(options) == 1
+            and ("orderID" in options or "clOrdID" in options)
+            and "," not in list(options.values())[0]
+        ):
+            return batch.add(BatchOrder.CANCEL, options)
+
         try:
-            order = self._exchange.privateDeleteOrder(options)
+            with self.client("cancel_order") as exchange:
+                order = exchange.privateDeleteOrder(options)
             self._logger.debug("■ cancel order={}".format(order))
+            self.__notify_orders(order)
         except Exception as e:
             self._logger.error("■ cancel order: exception={}".format(e))
             order = self.__get_error(e)
@@ -354,8 +761,10 @@ class BitMEX:
         orders = None
 
         try:
-            orders = self._exchange.privateDeleteOrderAll(options)
+            with self.client("cancel_orders") as exchange:
+                orders = exchange.privateDeleteOrderAll(options)
             self._logger.debug("■ cancel orders={}".format(orders))
+            self.__notify_orders(orders)
         except Exception as e:
             self._logger.error("■ cancel orders: exception={}".format(e))
             orders = self.__get_error(e)
@@ -374,7 +783,7 @@ class BitMEX:
     def stop_order(self, side, size, trigger_price):
 
         # 注文に設定する「clOrdID」のID情報を作成・取得
-        order_id = str(time.time() * 1000)
+        order_id = self.__order_id()
 
         if side.upper() == "BUY":
             _side = "Buy"
@@ -384,20 +793,22 @@ class BitMEX:
         order = None
 
         try:
-            order = self._exchange.privatePostOrder(
-                dict(
-                    {
-                        "symbol": BitMEX.INFO_SYMBOL,
-                        "side": _side,
-                        "orderQty": size,
-                        "stopPx": trigger_price,
-                        "ordType": "Stop",
-                        "execInst": "ReduceOnly",
-                        "clOrdID": "{}_stop_market".format(order_id),
-                    }
+            with self.client("stop_order") as exchange:
+                order = exchange.privatePostOrder(
+                    dict(
+                        {
+                            "symbol": BitMEX.INFO_SYMBOL,
+                            "side": _side,
+                            "orderQty": size,
+                            "stopPx": trigger_price,
+                            "ordType": "Stop",
+                            "execInst": "ReduceOnly",
+                            "clOrdID": "{}_stop_market".format(order_id),
+                        }
+                    )
                 )
-            )
             self._logger.debug("■ stop market order={}".format(order))
+            self.__notify_orders(order)
         except Exception as e:
             self._logger.error("■ stop market: exception={}".format(e))
             order = self.__get_error(e)
@@ -417,7 +828,7 @@ class BitMEX:
     def stop_limit_order(self, side, size, trigger_price, price):
 
         # 注文に設定する「clOrdID」のID情報を作成・取得
-        order_id = str(time.time() * 1000)
+        order_id = self.__order_id()
 
         if side.upper() == "BUY":
             _side = "Buy"
@@ -427,21 +838,23 @@ class BitMEX:
         order = None
 
         try:
-            order = self._exchange.privatePostOrder(
-                dict(
-                    {
-                        "symbol": BitMEX.INFO_SYMBOL,
-                        "side": _side,
-                        "orderQty": size,
-                        "stopPx": trigger_price,
-                        "price": price,
-                        "ordType": "StopLimit",
-                        "execInst": "ReduceOnly,ParticipateDoNotInitiate",
-                        "clOrdID": "{}_stop_limit".format(order_id),
-                    }
+            with self.client("stop_limit_order") as exchange:
+                order = exchange.privatePostOrder(
+                    dict(
+                        {
+                            "symbol": BitMEX.INFO_SYMBOL,
+                            "side": _side,
+                            "orderQty": size,
+                            "stopPx": trigger_price,
+                            "price": price,
+                            "ordType": "StopLimit",
+                            "execInst": "ReduceOnly,ParticipateDoNotInitiate",
+                            "clOrdID": "{}_stop_limit".format(order_id),
+                        }
+                    )
                 )
-            )
             self._logger.debug("■ stop limit order={}".format(order))
+            self.__notify_orders(order)
         except Exception as e:
             self._logger.error("■ stop limit: exception={}".format(e))
             order = self.__get_error(e)
@@ -460,7 +873,7 @@ class BitMEX:
     def trailing_stop_order(self, side, size, price_offset):
 
         # 注文に設定する「clOrdID」のID情報を作成・取得
-        order_id = str(time.time() * 1000)
+        order_id = self.__order_id()
 
         if side.upper() == "BUY":
             _side = "Buy"
@@ -470,21 +883,23 @@ class BitMEX:
         order = None
 
         try:
-            order = self._exchange.privatePostOrder(
-                dict(
-                    {
-                        "symbol": BitMEX.INFO_SYMBOL,
-                        "side": _side,
-                        "orderQty": size,
-                        "pegOffsetValue": price_offset,
-                        "pegPriceType": "TrailingStopPeg",
-                        "ordType": "Stop",
-                        "execInst": "ReduceOnly",
-                        "clOrdID": "{}_trailing_stop".format(order_id),
-                    }
+            with self.client("trailing_stop_order") as exchange:
+                order = exchange.privatePostOrder(
+                    dict(
+                        {
+                            "symbol": BitMEX.INFO_SYMBOL,
+                            "side": _side,
+                            "orderQty": size,
+                            "pegOffsetValue": price_offset,
+                            "pegPriceType": "TrailingStopPeg",
+                            "ordType": "Stop",
+                            "execInst": "ReduceOnly",
+                            "clOrdID": "{}_trailing_stop".format(order_id),
+                        }
+                    )
                 )
-            )
             self._logger.debug("■ trailing stop order={}".format(order))
+            self.__notify_orders(order)
         except Exception as e:
             self._logger.error("■ trailing stop: exception={}".format(e))
             order = self.__get_error(e)
@@ -503,8 +918,12 @@ class BitMEX:
         orders = None
 
         try:
-            orders = self._exchange.privatePostOrderBulk({"orders": json.dumps(params)})
+            with self.client("bulk_order") as exchange:
+                orders = exchange.privatePostOrderBulk(
+                    {"orders": json.dumps(params)}
+                )
             self._logger.debug("■ bulk orders={}".format(orders))
+            self.__notify_orders(orders)
         except Exception as e:
             self._logger.error("■ bulk orders: exception={}".format(e))
             orders = self.__get_error(e)
@@ -518,7 +937,8 @@ class BitMEX:
 
         _balance = None
         try:
-            _balance = self._exchange.fetch_balance()
+            with self.client("balance") as exchange:
+                _balance = exchange.fetch_balance()
             self._logger.debug("■ balance={}".format(_balance))
         except Exception as e:
             self._logger.error("■ balance: exception={}".format(e))
@@ -534,7 +954,8 @@ class BitMEX:
 
         _position = None
         try:
-            _position = self._exchange.private_get_position()
+            with self.client("position") as exchange:
+                _position = exchange.private_get_position()
             self._logger.debug("■ position={}".format(_position))
         except Exception as e:
             self._logger.error("■ position: exception={}".format(e))
@@ -550,7 +971,8 @@ class BitMEX:
 
         _ticker = None
         try:
-            _ticker = self._exchange.fetch_ticker(symbol=symbol)  # シンボル
+            with self.client("ticker") as exchange:
+                _ticker = exchange.fetch_ticker(symbol=symbol)  # シンボル
             self._logger.debug("■ ticker={}".format(_ticker))
         except Exception as e:
             self._logger.error("■ ticker: exception={}".format(e))
@@ -566,9 +988,10 @@ class BitMEX:
 
         _orderbook = None
         try:
-            _orderbook = self._exchange.fetch_order_book(
-                symbol=symbol, limit=limit  # シンボル  # 取得件数(未指定:100、MAX:500)
-            )
+            with self.client("orderbook") as exchange:
+                _orderbook = exchange.fetch_order_book(
+                    symbol=symbol, limit=limit  # シンボル  # 取得件数(未指定:100、MAX:500)
+                )
             self._logger.debug("■ orderbook={}".format(_orderbook))
         except Exception as e:
             self._logger.error("■ orderbook: exception={}".format(e))
@@ -577,6 +1000,28 @@ class BitMEX:
 
         return _orderbook
 
+    # ======================================
+    # 約定履歴取得
+    #   params:
+    #       since: 取得開始時刻(Unix Timeミリ秒)
+    #       limit: 取得件数(MAX:1000)
+    #   return:
+    #       ccxtの約定 [{'timestamp', 'price', 'amount', 'side', ...}, ...]（Old->New、失敗時はNone）
+    # ======================================
+    def trades(self, symbol=SYMBOL, since=None, limit=None):
+
+        _trades = None
+        try:
+            with self.client("trades") as exchange:
+                _trades = exchange.fetch_trades(symbol=symbol, since=since, limit=limit)
+            self._logger.debug("■ trades={}".format(len(_trades)))
+        except Exception as e:
+            self._logger.error("■ trades: exception={}".format(e))
+            _trades = self.__get_error(e)
+            _trades = None # Noneを戻す
+
+        return _trades
+
     # ======================================
     # ccxtのfetch_ohlcv問題に対応するローカル関数
     #  partial問題については、
@@ -619,6 +1064,20 @@ class BitMEX:
         fetch_count = 100 if limit is None else limit
         count = fetch_count
 
+        # ローカルキャッシュが有効な場合、確定足はキャッシュから読み、不足分だけを取得する
+        if self._ohlcv_cache is not None and since is None and is_reverse == False:
+            # 同じキャッシュを複数スレッドから clear / append しないように直列化する
+            with self.__ohlcv_lock(symbol, timeframe):
+                return self.__cached_ohlcv(
+                    symbol,
+                    timeframe,
+                    period[timeframe] * 1000,
+                    current_timestamp,
+                    fetch_count,
+                    is_partial,
+                    params,
+                )
+
         # 取得後に最新足を除外するため、1件多く取得
         if is_partial == False:
             count += 1
@@ -631,9 +1090,14 @@ class BitMEX:
 
         # OHLCVデータ取得
         # 引数：symbol, timeframe='1m', since=None, limit=None, params={}
-        ohlcvs = self._exchange.fetch_ohlcv(
-            symbol=symbol, timeframe=timeframe, since=since, limit=count, params=params
-        )
+        with self.client("ohlcv") as exchange:
+            ohlcvs = exchange.fetch_ohlcv(
+                symbol=symbol,
+                timeframe=timeframe,
+                since=since,
+                limit=count,
+                params=params,
+            )
 
         # for DEBUG
         # print('ohlcvs_timestamp ={} : {}'.format(ohlcvs[-1][0], datetime.fromtimestamp(ohlcvs[-1][0] / 1000)))
@@ -662,6 +1126,101 @@ class BitMEX:
 
         return ohlcvs
 
+    # ======================================
+    # キャッシュ更新のロック(シンボル・タイムフレーム毎に1つ)
+    # ======================================
+    def __ohlcv_lock(self, symbol, timeframe):
+        with self._ohlcv_locks_lock:
+            return self._ohlcv_locks.setdefault(
+                (symbol, timeframe), threading.Lock()
+            )
+
+    # ======================================
+    # キャッシュを利用したohlcv取得
+    #  確定足はローカルキャッシュから読み込み、キャッシュの最新足より新しい足だけを取引所から取得する。
+    #  キャッシュが空、またはfetch_count件の範囲より古い場合は、範囲の先頭から取得し直す。
+    #
+    #  params:
+    #       period_ms: timeframe1期間あたりのミリ秒
+    #       current_timestamp: 未確定の最新足のtimestamp(ミリ秒)
+    # ======================================
+    def __cached_ohlcv(
+        self,
+        symbol,
+        timeframe,
+        period_ms,
+        current_timestamp,
+        fetch_count,
+        is_partial,
+        params,
+    ):
+        # 必要な確定足の先頭時刻
+        window_start = current_timestamp - fetch_count * period_ms
+
+        last_ts = self._ohlcv_cache.last_timestamp(symbol, timeframe)
+        if last_ts is None or last_ts + period_ms < window_start:
+            # キャッシュが無い、もしくは範囲よりも古いので作り直す
+            self._ohlcv_cache.clear(symbol, timeframe)
+            fetch_since = window_start
+        else:
+            fetch_since = last_ts + period_ms
+
+        # 不足分を取得（1page最大500件のため、追いつくまでページングする）
+        partial = []
+        _params = dict(params)
+        _params.update({"reverse": False, "partial": True})
+        while fetch_since <= current_timestamp:
+            count = min(500, (current_timestamp - fetch_since) // period_ms + 1)
+            with self.client("ohlcv") as exchange:
+                ohlcvs = exchange.fetch_ohlcv(
+                    symbol=symbol,
+                    timeframe=timeframe,
+                    since=fetch_since,
+                    limit=count,
+                    params=_params,
+                )
+            if len(ohlcvs) == 0:
+                break
+            # 確定足はキャッシュへ、未確定足は戻り値用に保持
+            self._ohlcv_cache.append(
+                symbol, timeframe, [o for o in ohlcvs if o[0] < current_timestamp]
+            )
+            partial = [o for o in ohlcvs if o[0] == current_timestamp]
+            if len(ohlcvs) < count or ohlcvs[-1][0] >= current_timestamp:
+                break
+            # キャッシュに保存できた足の続きから取得する（末尾のNoneの足は取り直す）
+            last_ts = self._ohlcv_cache.last_timestamp(symbol, timeframe)
+            if last_ts is None or last_ts + period_ms <= fetch_since:
+                break
+            fetch_since = last_ts + period_ms
+
+        # キャッシュの先頭が範囲よりも新しい場合は、古い足を遡って取得する
+        first_ts = self._ohlcv_cache.first_timestamp(symbol, timeframe)
+        if first_ts is not None and window_start < first_ts:
+            older = []
+            fetch_since = window_start
+            while fetch_since < first_ts:
+                count = min(500, max(1, (first_ts - fetch_since) // period_ms))
+                with self.client("ohlcv") as exchange:
+                    ohlcvs = exchange.fetch_ohlcv(
+                        symbol=symbol,
+                        timeframe=timeframe,
+                        since=fetch_since,
+                        limit=count,
+                        params=_params,
+                    )
+                older += [o for o in ohlcvs if o[0] < first_ts]
+                if len(ohlcvs) < count or ohlcvs[-1][0] >= first_ts:
+                    break
+                fetch_since = ohlcvs[-1][0] + period_ms
+            self._ohlcv_cache.prepend(symbol, timeframe, older)
+
+        ohlcvs = self._ohlcv_cache.read(symbol, timeframe, count=fetch_count)
+        if is_partial == True:
+            ohlcvs = (ohlcvs + partial)[-fetch_count:]
+
+        return ohlcvs
+
     # ==========================================================
     # ローソク足取得(ccxt)
     # ==========================================================
@@ -743,19 +1302,17 @@ class BitMEX:
         if resolution not in period.keys():
             return None
 
-        # 他の分刻みに直す
-        df = (
-            ohlcv[["open", "high", "low", "close", "volume"]]
-            .resample(period[resolution], label="left", closed="left")
-            .agg(
-                {
-                    "open": "first",
-                    "high": "max",
-                    "low": "min",
-                    "close": "last",
-                    "volume": "sum",
-                }
-            )
+        # 他の分刻みに直す（pandasのresampleと同じ結果をNumPyで計算する）
+        df = resample(
+            ohlcv,
+            period[resolution],
+            {
+                "open": "first",
+                "high": "max",
+                "low": "min",
+                "close": "last",
+                "volume": "sum",
+            },
         )
         # ohlcを再度ohlcに集計するにはaggメソッド
 
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+import os
+import re
+
+# thred操作
+import threading
+
+# for logging
+import logging
+
+import numpy as np
+
+
+# ###############################################################
+# OHLCV ローカルキャッシュ クラス
+#   シンボル・タイムフレーム毎に確定足を固定長レコードのバイナリファイルへ追記保存する。
+#   読み込みは numpy.memmap で行うため、ファイル全体をメモリに読み込まない。
+#
+#   ファイル: <path>/<symbol>_<timeframe>.bin
+#   レコード: timestamp(int64, ミリ秒), open, high, low, close, volume(float64)
+#   取引所の足がNone(取引の無い足)の項目は NaN で保存し、読み込み時に None に戻す
+#   （足の抜けを作らないので、読み込んだ足は取引所から取得した足と同じく連続している）
+# ###############################################################
+class OhlcvCache:
+
+    DTYPE = np.dtype(
+        [
+            ("timestamp", "<i8"),
+            ("open", "<f8"),
+            ("high", "<f8"),
+            ("low", "<f8"),
+            ("close", "<f8"),
+            ("volume", "<f8"),
+        ]
+    )
+
+    # ==================================
+    # 初期化
+    #   param:
+    #       path: キャッシュファイルを格納するディレクトリ
+    # ==================================
+    def __init__(self, path, logger=None):
+        self._path = path
+        os.makedirs(self._path, exist_ok=True)
+
+        self._logger = logger if logger is not None else logging.getLogger(__name__)
+
+        # -------------------------------------------------------
+        # Threadのロック用オブジェクト
+        # -------------------------------------------------------
+        self._lock = threading.Lock()
+
+        self._logger.info("class OhlcvCache initialized path={}".format(self._path))
+
+    # ==================================
+    # キャッシュファイル名
+    # ==================================
+    def __file(self, symbol, timeframe):
+        name = re.sub(r"[^0-9A-Za-z]", "", symbol)  # BTC/USD -> BTCUSD
+        return os.path.join(self._path, "{}_{}.bin".format(name, timeframe))
+
+    # ==================================
+    # キャッシュをmemmapで開く（データが無ければNone）
+    # ==================================
+    def __open(self, symbol, timeframe):
+        file = self.__file(symbol, timeframe)
+        if (
+            not os.path.exists(file)
+            or os.path.getsize(file) < OhlcvCache.DTYPE.itemsize
+        ):
+            return None
+        count = os.path.getsize(file) // OhlcvCache.DTYPE.itemsize
+        return np.memmap(file, dtype=OhlcvCache.DTYPE, mode="r", shape=(count,))
+
+    # ==================================
+    # 最後に保存した確定足のtimestamp(ミリ秒)
+    #   return:
+    #       timestamp (データが無い場合はNone)
+    # ==================================
+    def last_timestamp(self, symbol, timeframe):
+        with self._lock:
+            data = self.__open(symbol, timeframe)
+            return None if data is None else int(data["timestamp"][-1])
+
+    # ==================================
+    # 最初に保存した確定足のtimestamp(ミリ秒)
+    #   return:
+    #       timestamp (データが無い場合はNone)
+    # ==================================
+    def first_timestamp(self, symbol, timeframe):
+        with self._lock:
+            data = self.__open(symbol, timeframe)
+            return None if data is None else int(data["timestamp"][0])
+
+    # ==================================
+    # 確定足の読み込み
+    #   param:
+    #       count: 取得件数（最新からcount件、未指定は全件）
+    #       since: 取得開始時刻(ミリ秒)
+    #   return:
+    #       ccxtのfetch_ohlcvと同じ形式 [[timestamp, open, high, low, close, volume], ...]
+    # ==================================
+    def read(self, symbol, timeframe, count=None, since=None):
+        with self._lock:
+            data = self.__open(symbol, timeframe)
+            if data is None:
+                return []
+            if since is not None:
+                data = data[np.searchsorted(data["timestamp"], since) :]
+            if count is not None:
+                data = data[-count:] if count > 0 else data[:0]
+            return [
+                [int(row[0])] + [None if v != v else v for v in row[1:]]
+                for row in data.tolist()
+            ]
+
+    # ==================================
+    # 確定足の追記
+    #   保存済みの最新足よりも新しい足だけを追記する。
+    #   Noneを含む足は、後に値のある足が続く場合だけ NaN で保存する。
+    #   末尾のNoneを含む足は保存しない（取引所の集計待ちの場合があるので、次回取得し直す）
+    #   param:
+    #       ohlcvs: [[timestamp, open, high, low, close, volume], ...] (Old->New)
+    #   return:
+    #       追記件数
+    # ==================================
+    def append(self, symbol, timeframe, ohlcvs):
+        with self._lock:
+            data = self.__open(symbol, timeframe)
+            last_ts = None if data is None else int(data["timestamp"][-1])
+            del data  # memmapを閉じる
+
+            # 末尾のNoneを含む足を除く
+            end = len(ohlcvs)
+            while end > 0 and None in ohlcvs[end - 1][:6]:
+                end -= 1
+
+            rows = []
+            for o in ohlcvs[:end]:
+                if last_ts is not None and o[0] <= last_ts:
+                    continue
+                rows.append(self.__row(o))
+                last_ts = o[0]
+
+            if len(rows) != 0:
+                with open(self.__file(symbol, timeframe), "ab") as f:
+                    f.write(np.array(rows, dtype=OhlcvCache.DTYPE).tobytes())
+
+            return len(rows)
+
+    # ==================================
+    # 古い確定足の追加
+    #   保存済みの最古の足よりも古い足だけを先頭に追加する。
+    #   ファイルを作り直すので、履歴を遡る場合にだけ使う（Noneを含む足は NaN で保存する）
+    #   param:
+    #       ohlcvs: [[timestamp, open, high, low, close, volume], ...] (Old->New)
+    #   return:
+    #       追加件数
+    # ==================================
+    def prepend(self, symbol, timeframe, ohlcvs):
+        with self._lock:
+            data = self.__open(symbol, timeframe)
+            first_ts = None if data is None else int(data["timestamp"][0])
+            existing = b"" if data is None else data.tobytes()
+            del data  # memmapを閉じる
+
+            rows = []
+            last_ts = None
+            for o in ohlcvs:
+                if first_ts is not None and o[0] >= first_ts:
+                    break
+                if last_ts is not None and o[0] <= last_ts:
+                    continue
+                rows.append(self.__row(o))
+                last_ts = o[0]
+
+            if len(rows) != 0:
+                file = self.__file(symbol, timeframe)
+                with open(file + ".tmp", "wb") as f:
+                    f.write(np.array(rows, dtype=OhlcvCache.DTYPE).tobytes())
+                    f.write(existing)
+                os.replace(file + ".tmp", file)
+
+            return len(rows)
+
+    # ==================================
+    # 保存するレコード（Noneは NaN にする）
+    # ==================================
+    def __row(self, o):
+        return (o[0],) + tuple([np.nan if v is None else v for v in o[1:6]])
+
+    # ==================================
+    # キャッシュ削除
+    # ==================================
+    def clear(self, symbol, timeframe):
+        with self._lock:
+            file = self.__file(symbol, timeframe)
+            if os.path.exists(file):
+                os.remove(file)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+
+# ###############################################################
+# バッチ注文 クラス
+#   BitMEX.begin_batch() 〜 BitMEX.end_batch() の間に発行された注文は、
+#   このオブジェクトとして呼び出し元に戻され、flush時に結果(result)が設定される。
+# ###############################################################
+class BatchOrder:
+
+    CREATE = "create"
+    AMEND = "amend"
+    CANCEL = "cancel"
+
+    # ==================================
+    # 初期化
+    #   param:
+    #       kind: create, amend, cancel
+    #       params: BitMEX API に渡す注文パラメータ
+    # ==================================
+    def __init__(self, kind, params):
+        self.kind = kind
+        self.params = params
+        self.result = None  # 注文結果（エラーの場合は {"error": {...}}）
+        self.done = False  # flush済みか
+
+    # ==================================
+    # 注文結果を設定
+    # ==================================
+    def resolve(self, result):
+        self.result = result
+        self.done = True
+
+    # ==================================
+    # エラーか？
+    # ==================================
+    def is_error(self):
+        return isinstance(self.result, dict) and bool(self.result.get("error"))
+
+    def __repr__(self):
+        return "BatchOrder(kind={}, params={}, result={})".format(
+            self.kind, self.params, self.result
+        )
+
+
+# ###############################################################
+# 注文バッチ クラス
+#   1回の Puppet.run の間に発行された注文を種類毎に溜めておく
+# ###############################################################
+class OrderBatch:
+
+    # ==================================
+    # 初期化
+    # ==================================
+    def __init__(self):
+        self._orders = []
+
+    # ==================================
+    # 注文を追加
+    #   return:
+    #       BatchOrder
+    # ==================================
+    def add(self, kind, params):
+        order = BatchOrder(kind, params)
+        self._orders.append(order)
+        return order
+
+    # ==================================
+    # 溜まっている注文を種類毎に取り出し、バッチを空にする
+    #   return:
+    #       {kind: [BatchOrder, ...]}
+    # ==================================
+    def take(self):
+        orders, self._orders = self._orders, []
+        groups = {BatchOrder.CREATE: [], BatchOrder.AMEND: [], BatchOrder.CANCEL: []}
+        for o in orders:
+            groups[o.kind].append(o)
+        return groups
+
+    def __len__(self):
+        return len(self._orders)
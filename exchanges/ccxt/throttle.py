@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+# thred操作
+import threading
+
+
+# ###############################################################
+# 共有レート制限 クラス
+#   ccxtの取引所オブジェクトはそれぞれ自分の前回リクエスト時刻だけで throttle するため、
+#   プールの複数オブジェクトを並列に使うと、合計でレート制限の個数倍までリクエストしてしまう。
+#   プールの全オブジェクトの throttle をこのオブジェクトに置き換え、1つの間隔で順番に送信する。
+#   使用例:
+#       exchange.throttle = lambda cost=None: throttle.wait(exchange.rateLimit, cost)
+# ###############################################################
+class SharedThrottle:
+
+    # ==================================
+    # 初期化
+    # ==================================
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next = 0.0  # 次に送信できる時刻(ミリ秒)
+
+    # ==================================
+    # 送信できるまで待つ
+    #   待ち時間はロックの外で sleep するので、他のスレッドは次の枠を予約できる
+    #   params:
+    #       rate_limit: リクエスト間隔(ミリ秒, ccxtの rateLimit)
+    #       cost: リクエストのコスト（未指定は1）
+    # ==================================
+    def wait(self, rate_limit, cost=None):
+        cost = 1 if cost is None else cost
+        with self._lock:
+            now = time.time() * 1000
+            start = max(now, self._next)
+            self._next = start + rate_limit * cost
+        if start > now:
+            time.sleep((start - now) / 1000)
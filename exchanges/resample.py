@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# ==========================================
+# OHLCV 足幅変換(resample)
+# ==========================================
+import numpy as np
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+
+# 1日(ナノ秒)
+DAY_NS = 24 * 60 * 60 * 1000 * 1000 * 1000
+
+# 集計方法
+HOW = ["first", "max", "min", "last", "sum"]
+
+
+# ==============================================================
+# 足幅変換
+#   DataFrame.resample(rule, label="left", closed="left").agg(how) と同じ結果を
+#   NumPy の reduceat で計算する。
+#   期間の区切りは pandas と同じく、最初の足の日の0時(インデックスのタイムゾーン)を起点とし、
+#   足の無い期間は OHLC が NaN、sum が 0 になる。
+#   固定長でない足幅(W, M など)・NaNを含むデータ・時刻順でないデータは pandas で計算する。
+#   params:
+#       df: DatetimeIndex の DataFrame
+#       rule: 足幅(1T, 5T, 1H, 10S など pandas の指定)
+#       how: {列名: first, max, min, last, sum}
+#   return:
+#       DataFrame
+# ==============================================================
+def resample(df, rule, how):
+    offset = to_offset(rule)
+    columns = list(how.keys())
+    values = [df[column].values for column in columns]
+    if (
+        not isinstance(offset, pd.offsets.Tick)
+        or len(df) == 0
+        or any([v.dtype.kind == "f" and np.isnan(v).any() for v in values])
+    ):
+        return _resample_pandas(df, rule, how)
+
+    # -----------------------------------------------
+    # 期間番号（タイムゾーンの時刻で計算する）
+    # -----------------------------------------------
+    index = df.index
+    wall = index.tz_localize(None) if index.tz is not None else index
+    ns = wall.values.astype("datetime64[ns]").astype(np.int64)
+    if (ns[1:] < ns[:-1]).any():
+        return _resample_pandas(df, rule, how)
+    freq = offset.nanos
+    origin = ns[0] - ns[0] % DAY_NS
+    ids = (ns - origin) // freq
+
+    first_id = ids[0]
+    count = int(ids[-1] - first_id + 1)
+    starts = np.flatnonzero(np.concatenate(([True], ids[1:] != ids[:-1])))
+    ends = np.concatenate((starts[1:], [len(ids)])) - 1
+    slots = ids[starts] - first_id
+    filled = len(starts) == count  # 足の無い期間が無いか
+
+    # -----------------------------------------------
+    # 列毎に集計
+    # -----------------------------------------------
+    data = {}
+    for column, v in zip(columns, values):
+        kind = how[column]
+        if kind == "first":
+            r = v[starts]
+        elif kind == "last":
+            r = v[ends]
+        elif kind == "max":
+            r = np.maximum.reduceat(v, starts)
+        elif kind == "min":
+            r = np.minimum.reduceat(v, starts)
+        elif kind == "sum":
+            r = np.add.reduceat(v, starts)
+        else:
+            raise ValueError("unsupported aggregation: {}".format(kind))
+
+        if filled:
+            data[column] = r
+        elif kind == "sum":
+            data[column] = np.zeros(count, dtype=r.dtype)
+            data[column][slots] = r
+        else:
+            data[column] = np.full(count, np.nan)
+            data[column][slots] = r
+
+    # -----------------------------------------------
+    # 期間の開始時刻をインデックスにする
+    # -----------------------------------------------
+    start = pd.Timestamp(origin + first_id * freq)
+    labels = pd.date_range(
+        start=start, periods=count, freq=offset, tz=index.tz, name=index.name
+    )
+    if hasattr(index, "unit") and hasattr(labels, "as_unit"):
+        labels = labels.as_unit(index.unit)
+
+    return pd.DataFrame(data, index=labels, columns=columns)
+
+
+# ==============================================================
+# 足幅変換(pandas)
+# ==============================================================
+def _resample_pandas(df, rule, how):
+    return (
+        df[list(how.keys())].resample(rule, label="left", closed="left").agg(how)
+    )
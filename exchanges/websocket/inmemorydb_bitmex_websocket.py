@@ -48,6 +48,12 @@ from exchanges.websocket.orderbook import OrderBook
 # 注文情報
 from exchanges.websocket.order import Order
 
+# 足幅変換
+from exchanges.resample import resample
+
+# オーダーフロー
+from exchanges.websocket.orderflow import OrderFlow
+
 
 # ###############################################################
 # Naive implementation of connecting to BitMEX websocket for streaming realtime data.
@@ -68,6 +74,9 @@ class BitMEXWebsocket:
     # ローソク足の刻み幅
     CANDLE_RANGE = 5
     MAX_CANDLE_LEN = int(3600 / CANDLE_RANGE)  # 1h分
+    # ギャップを取り直す約定履歴の1回の取得件数と、取得失敗時の待ち時間(秒)
+    FILL_LIMIT = 1000
+    FILL_RETRY = 60
 
     # 長期間ポジションが無いと、positionのPartialでNULLデータが取得される。
     INIT_POSITION = {
@@ -175,6 +184,8 @@ class BitMEXWebsocket:
         api_secret=None,
         logger=None,
         use_timemark=False,
+        trade_fetcher=None,
+        order_flow_window=60,
     ):
         """Connect to the websocket and initialize data stores."""
         # -------------------------------------------------------
@@ -221,11 +232,32 @@ class BitMEXWebsocket:
         # -------------------------------------------------------
         self._use_timemark = use_timemark
 
+        # -------------------------------------------------------
+        # ローソク足のギャップを取り直す約定履歴の取得関数（未指定は取り直さない）
+        #   trade_fetcher(since, limit): since(ミリ秒)以降の約定をccxtの形式で戻す
+        # -------------------------------------------------------
+        self._trade_fetcher = trade_fetcher
+
+        # -------------------------------------------------------
+        # オーダーフローの集計期間(秒)
+        # -------------------------------------------------------
+        self._order_flow_window = order_flow_window
+
         # -------------------------------------------------------
         # Threadのロック用オブジェクト
         # -------------------------------------------------------
         self._lock = threading.Lock()
 
+        # -------------------------------------------------------
+        # テーブル毎の受信通知先（再接続しても保持する）
+        # -------------------------------------------------------
+        self._listeners = {}
+
+        # -------------------------------------------------------
+        # 5秒足の確定で更新する逐次計算インジケータ（再接続しても保持する）
+        # -------------------------------------------------------
+        self._indicators = []
+
         # -------------------------------------------------------
         # ローカル変数 設定
         # -------------------------------------------------------
@@ -385,6 +417,15 @@ class BitMEXWebsocket:
             self._orderbook = None
             self._order = None
 
+    # ===========================================================
+    # 受信通知先の登録
+    #   params:
+    #       table: order, execution, trade, ...
+    #       callback: callback(action, data)　websocketスレッドから呼び出される
+    # ===========================================================
+    def add_listener(self, table, callback):
+        self._listeners.setdefault(table, []).append(callback)
+
     # ===========================================================
     # 強制終了の通知がONか？(__on_errorで設定される)
     # ===========================================================
@@ -524,6 +565,7 @@ class BitMEXWebsocket:
 
     # ===========================================================
     # candle
+    #   gap: 約定を受信できずに直前の終値で埋めた足はTrue（約定履歴で取り直すとFalseになる）
     #   params:
     #       type: 0, 1  # 0: 未確定含まない, 1: 未確定含む
     # ===========================================================
@@ -536,6 +578,117 @@ class BitMEXWebsocket:
         self.__thread_unlock()
         return candle
 
+    # ===========================================================
+    # オーダーフロー（直近 order_flow_window 秒、受信時に集計済み）
+    #   約定・板を再走査しないので、呼び出しは O(1)
+    #   return:
+    #       {buy_volume, sell_volume, trades, trade_intensity, volume_imbalance,
+    #        ofi, quotes, book_updates, quote_to_trade}
+    # ===========================================================
+    def order_flow(self):
+        self.__thread_lock()
+        try:
+            return self._order_flow.features()
+        finally:
+            self.__thread_unlock()
+
+    # ===========================================================
+    # 逐次計算インジケータの登録
+    #   5秒足の確定足で初期化し、以降は足が確定する度に update() する
+    #   未確定足を含めた値は indicator.preview(ws.candle(1)[-1])
+    #   params:
+    #       indicator: indicators.streaming.Indicator
+    #   return:
+    #       indicator
+    # ===========================================================
+    def attach(self, indicator):
+        self.__thread_lock()
+        try:
+            indicator.reset()
+            indicator.load(self._candle[:-1])
+            self._indicators.append(indicator)
+        finally:
+            self.__thread_unlock()
+        return indicator
+
+    # ===========================================================
+    # ローソク足のギャップ [[start, end), ...]（UNIX時間、秒）
+    # ===========================================================
+    def candle_gaps(self):
+        self.__thread_lock()
+        gaps = [list(g) for g in self._candle_gaps]
+        self.__thread_unlock()
+        return gaps
+
+    # ===========================================================
+    # 約定履歴でローソク足を取り直す
+    #   期間 [start, end) のギャップの足を約定から作り直し、ギャップを消す
+    #   約定の無い足は、作り直した直前の足の終値で埋め直す。
+    #   期間の後の足も、直前の足の終値から続くように始値(ギャップの足は終値まで)を直す
+    #   params:
+    #       trades: ccxtの約定 [{'timestamp'(ミリ秒), 'price', 'amount', 'side'}, ...]
+    #       start, end: 取り直す期間（UNIX時間、秒）
+    # ===========================================================
+    def fill_candle(self, trades, start, end):
+        RANGE = BitMEXWebsocket.CANDLE_RANGE
+        # 足のtimestamp毎の約定（足は mark_ts < 約定時刻 <= mark_ts + RANGE）
+        buckets = {}
+        for trade in trades:
+            ts = round(trade["timestamp"] / 1000)
+            buckets.setdefault((ts - 1) // RANGE * RANGE, []).append(trade)
+
+        self.__thread_lock()
+        try:
+            prev = None
+            changed = False  # 直前の足の終値が変わったか
+            for candle in self._candle:
+                filled = start <= candle["timestamp"] < end
+                if filled and candle["gap"] and candle["timestamp"] in buckets:
+                    fill = buckets[candle["timestamp"]]
+                    prices = [t["price"] for t in fill]
+                    first = prev["close"] if prev is not None else prices[0]
+                    candle["open"] = first
+                    candle["high"] = max(prices + [first])
+                    candle["low"] = min(prices + [first])
+                    candle["close"] = prices[-1]
+                    candle["volume"] = sum([t["amount"] for t in fill])
+                    candle["buy"] = sum(
+                        [t["amount"] for t in fill if t["side"] == "buy"]
+                    )
+                    candle["sell"] = sum(
+                        [t["amount"] for t in fill if t["side"] == "sell"]
+                    )
+                    changed = True
+                elif changed and candle["gap"]:
+                    # 約定の無い足は直前の終値で埋め直す（期間外はギャップのまま）
+                    close = prev["close"]
+                    candle["open"] = candle["high"] = close
+                    candle["low"] = candle["close"] = close
+                elif changed:
+                    # 次の実データの足(未確定足を含む)は始値だけを直す
+                    candle["open"] = prev["close"]
+                    candle["high"] = max(candle["high"], candle["open"])
+                    candle["low"] = min(candle["low"], candle["open"])
+                    changed = False
+                if filled:
+                    candle["gap"] = False
+                prev = candle
+
+            gaps = []
+            for s, e in self._candle_gaps:
+                if s < start:
+                    gaps.append([s, min(e, start)])
+                if e > end:
+                    gaps.append([max(s, end), e])
+            self._candle_gaps = gaps
+
+            # 確定足が変わったので、インジケータを初期化し直す
+            for indicator in self._indicators:
+                indicator.reset()
+                indicator.load(self._candle[:-1])
+        finally:
+            self.__thread_unlock()
+
     # ==========================================================
     # ヘルパー関数
     # ==========================================================
@@ -590,9 +743,9 @@ class BitMEXWebsocket:
     # ==========================================================
     # candleデータフレーム作成
     #   param:
-    #       candle: 5秒足配列　[['timestamp','open','high','low','close','volume','buy','sell'], [], [], ,,,,]
+    #       candle: 5秒足配列　[['timestamp','open','high','low','close','volume','buy','sell','gap'], [], [], ,,,,]
     #   return:
-    #       df: pandas.DataFrame(columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'buy', 'sell'])
+    #       df: pandas.DataFrame(columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'buy', 'sell', 'gap'])
     # ==========================================================
     def to_candleDF(self, candle):
         # ------------------------------------------------------
@@ -612,6 +765,7 @@ class BitMEXWebsocket:
                 "volume",
                 "buy",
                 "sell",
+                "gap",
             ],
         )
         # ------------------------------------------------------
@@ -652,7 +806,7 @@ class BitMEXWebsocket:
     # ==========================================================
     # ローソク足の足幅変換
     #   params:
-    #       ohlcv: pandas.DataFrame(columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'buy', 'sell'])
+    #       ohlcv: pandas.DataFrame(columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'buy', 'sell', 'gap'])
     #       resolution: 刻み幅(10s, 15s, 30s)
     # ==========================================================
     def change_candleDF(self, ohlcv, resolution="10s"):
@@ -693,21 +847,20 @@ class BitMEXWebsocket:
         if resolution not in period.keys():
             return None
 
-        # 他の秒刻みに直す
-        df = (
-            ohlcv[["open", "high", "low", "close", "volume", "buy", "sell"]]
-            .resample(period[resolution], label="left", closed="left")
-            .agg(
-                {
-                    "open": "first",
-                    "high": "max",
-                    "low": "min",
-                    "close": "last",
-                    "volume": "sum",
-                    "buy": "sum",
-                    "sell": "sum",
-                }
-            )
+        # 他の秒刻みに直す（pandasのresampleと同じ結果をNumPyで計算する）
+        df = resample(
+            ohlcv,
+            period[resolution],
+            {
+                "open": "first",
+                "high": "max",
+                "low": "min",
+                "close": "last",
+                "volume": "sum",
+                "buy": "sum",
+                "sell": "sum",
+                "gap": "max",
+            },
         )
         # ohlcを再度ohlcに集計するにはaggメソッド
 
@@ -731,6 +884,14 @@ class BitMEXWebsocket:
 
         # candle
         self._candle = []
+        # 約定を受信できずに直前の終値で埋めた期間 [[start, end), ...]（UNIX時間、秒）
+        self._candle_gaps = []
+        self._candle_backfill_at = 0  # 次にギャップを取り直す時刻（UNIX時間、秒）
+        # オーダーフロー（受信時に集計する）
+        self._order_flow = OrderFlow(self._order_flow_window)
+        # 5秒足を作り直すので、インジケータも初期化する
+        for indicator in self._indicators:
+            indicator.reset()
         """
             candleデータの構造
             {
@@ -741,7 +902,8 @@ class BitMEXWebsocket:
                 'close': 0,
                 'volume': 0,
                 'buy': 0,
-                'sell':0
+                'sell':0,
+                'gap': False
             }
         """
 
@@ -1171,6 +1333,9 @@ class BitMEXWebsocket:
                             # ----------------------------------------
                             if table == "trade":
                                 self.__init_candle_data(self.data[table])
+                            # OFIの基準の最良気配
+                            if table == "quote" and len(message["data"]) != 0:
+                                self._order_flow.reset_quote(message["data"][-1])
                     except Exception as e:
                         self.logger.error("Exception {} partial {}".format(table, e))
 
@@ -1204,6 +1369,7 @@ class BitMEXWebsocket:
                             # DB に 登録(partial)・挿入(insert)・更新(update)・削除(delete)
                             # orderbook取得
                             self._orderbook.replace(message["data"])
+                            self._order_flow.on_book(len(message["data"]), self._ts)
                         elif table in ["order"]:
                             # DB に 登録(partial)・挿入(insert)・更新(update)
                             # order取得
@@ -1224,6 +1390,13 @@ class BitMEXWebsocket:
                             if table == "trade":
                                 for trade in message["data"]:
                                     self.__update_candle_data(trade)
+                            # ----------------------------------------
+                            # オーダーフロー
+                            # ----------------------------------------
+                            if table == "trade":
+                                self._order_flow.on_trades(message["data"], self._ts)
+                            elif table == "quote":
+                                self._order_flow.on_quotes(message["data"], self._ts)
                         elif table in ["instrument", "margin", "position"]:
                             # dataは来ないはず
                             self.logger.error(
@@ -1262,6 +1435,7 @@ class BitMEXWebsocket:
                             # DB に 登録(partial)・挿入(insert)・更新(update)・削除(delete)
                             # orderbook取得
                             self._orderbook.update(message["data"])
+                            self._order_flow.on_book(len(message["data"]), self._ts)
                         elif table in ["order"]:
                             # DB に 登録(partial)・挿入(insert)・更新(update)
                             # order取得
@@ -1340,6 +1514,7 @@ class BitMEXWebsocket:
                             # DB に 登録(partial)・挿入(insert)・更新(update)・削除(delete)
                             # orderbook取得
                             self._orderbook.delete(message["data"])
+                            self._order_flow.on_book(len(message["data"]), self._ts)
                         elif table in [
                             "execution",
                             "instrument",
@@ -1373,6 +1548,15 @@ class BitMEXWebsocket:
                 else:
                     # raise Exception("Unknown action: %s" % action)
                     self.logger.error("Unknown action {}".format(action))
+
+                # -----------------------------------------------
+                # 受信通知
+                # -----------------------------------------------
+                for callback in self._listeners.get(table, []):
+                    try:
+                        callback(action, message["data"])
+                    except Exception as e:
+                        self.logger.error("listener {} {}: {}".format(table, action, e))
         except:
             self.logger.error(traceback.format_exc())
 
@@ -1450,6 +1634,7 @@ class BitMEXWebsocket:
                 "volume": trades[0]["size"],
                 "buy": trades[0]["size"] if trades[0]["side"] == "Buy" else 0,
                 "sell": trades[0]["size"] if trades[0]["side"] == "Sell" else 0,
+                "gap": False,
             }
         )
 
@@ -1487,9 +1672,15 @@ class BitMEXWebsocket:
             last_candle["sell"] += trade["size"] if trade["side"] == "Sell" else 0
         # 次の時間帯になっていたら、新しいcandleを作る
         elif (mark_ts + BitMEXWebsocket.CANDLE_RANGE) < ts:
+            # 約定の無かった時間帯はギャップとして埋める
+            while (mark_ts + 2 * BitMEXWebsocket.CANDLE_RANGE) < ts:
+                mark_ts = mark_ts + BitMEXWebsocket.CANDLE_RANGE
+                self.__append_gap_candle(mark_ts)
+                last_candle = self._candle[-1]
             # mark_tsを更新
             mark_ts = mark_ts + BitMEXWebsocket.CANDLE_RANGE
             # 新しいcandleを作成
+            self.__close_candle()
             self._candle.append(
                 {
                     "timestamp": mark_ts,
@@ -1500,6 +1691,7 @@ class BitMEXWebsocket:
                     "volume": trade["size"],
                     "buy": trade["size"] if trade["side"] == "Buy" else 0,
                     "sell": trade["size"] if trade["side"] == "Sell" else 0,
+                    "gap": False,
                 }
             )
 
@@ -1541,23 +1733,12 @@ class BitMEXWebsocket:
                         ((mark_ts + BitMEXWebsocket.CANDLE_RANGE) < ts)
                     ))
                 """
-                # 次の時間帯になっていたら、新しいcandle(空)を作る
+                # 次の時間帯になっていたら、新しいcandle(空)を作る（ギャップとして記録する）
                 if (mark_ts + BitMEXWebsocket.CANDLE_RANGE) < ts:
                     # mark_tsを更新
                     mark_ts = mark_ts + BitMEXWebsocket.CANDLE_RANGE
                     # 新しいcandleを作成
-                    self._candle.append(
-                        {
-                            "timestamp": mark_ts,
-                            "open": last_candle["close"],
-                            "high": last_candle["close"],
-                            "low": last_candle["close"],
-                            "close": last_candle["close"],
-                            "volume": 0,
-                            "buy": 0,
-                            "sell": 0,
-                        }
-                    )
+                    self.__append_gap_candle(mark_ts)
 
                 # 最大サイズ調整
                 if len(self._candle) > (BitMEXWebsocket.MAX_CANDLE_LEN * 1.5):
@@ -1570,6 +1751,83 @@ class BitMEXWebsocket:
             # unLock
             self.__thread_unlock()
 
+            # ギャップの取り直し
+            self.__backfill_candle()
+
+    # ===========================================================
+    # 最後の足の確定（新しい足を追加する直前に呼び出すこと）
+    #   逐次計算インジケータを確定した足で更新する
+    # ===========================================================
+    def __close_candle(self):
+        if len(self._candle) == 0:
+            return
+        for indicator in self._indicators:
+            try:
+                indicator.update(self._candle[-1])
+            except Exception as e:
+                self.logger.error("candle indicator Exception {}".format(e))
+
+    # ===========================================================
+    # 直前の終値で埋めた足を追加し、ギャップとして記録する（ロック取得済みで呼び出すこと）
+    # ===========================================================
+    def __append_gap_candle(self, mark_ts):
+        close = self._candle[-1]["close"]
+        self.__close_candle()
+        self._candle.append(
+            {
+                "timestamp": mark_ts,
+                "open": close,
+                "high": close,
+                "low": close,
+                "close": close,
+                "volume": 0,
+                "buy": 0,
+                "sell": 0,
+                "gap": True,
+            }
+        )
+        end = mark_ts + BitMEXWebsocket.CANDLE_RANGE
+        if len(self._candle_gaps) != 0 and self._candle_gaps[-1][1] >= mark_ts:
+            self._candle_gaps[-1][1] = end
+        else:
+            self._candle_gaps.append([mark_ts, end])
+        # 保持している足より古いギャップは捨てる
+        first = self._candle[0]["timestamp"]
+        self._candle_gaps = [g for g in self._candle_gaps if g[1] > first]
+
+    # ===========================================================
+    # ギャップの足を約定履歴(REST)で取り直す
+    #   1回の取得件数で足りない場合は、取得できた約定の足までを取り直し、残りは次回に取り直す
+    #   取得に失敗した場合は FILL_RETRY 秒後に取り直す
+    # ===========================================================
+    def __backfill_candle(self):
+        RANGE = BitMEXWebsocket.CANDLE_RANGE
+        now = datetime.now(self._tz).timestamp()
+        if self._trade_fetcher is None or now < self._candle_backfill_at:
+            return
+
+        # 足の期間が終わってから取り直す
+        for start, end in [g for g in self.candle_gaps() if g[1] + RANGE < now]:
+            try:
+                trades = self._trade_fetcher(start * 1000, BitMEXWebsocket.FILL_LIMIT)
+            except Exception as e:
+                self.logger.warning("candle backfill Exception {}".format(e))
+                trades = None
+            if trades is None:
+                self._candle_backfill_at = now + BitMEXWebsocket.FILL_RETRY
+                return
+
+            if len(trades) == BitMEXWebsocket.FILL_LIMIT:
+                # 最後の約定の足は全ての約定を取得できていない
+                ts = round(trades[-1]["timestamp"] / 1000)
+                end = min(end, (ts - 1) // RANGE * RANGE)
+            if end <= start:
+                continue
+            self.fill_candle(trades, start, end)
+            self.logger.info(
+                "candle backfill {} trades ({} - {})".format(len(trades), start, end)
+            )
+
 
 # ###############################################################
 # テスト
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+# ==========================================
+# オーダーフロー（約定・板の変化から作る短期の特徴量）
+#   websocketの受信時に1件ずつ集計し、直近 window 秒の値を O(1) で参照する。
+#   時刻は受信時刻(ローカル、秒)。取引所の時刻は変換が重いので使わない。
+# ==========================================
+import math
+import time
+
+# 集計する値の番号
+BUY_VOLUME = 0  # 買い(テイカーが買い)の約定数量
+SELL_VOLUME = 1  # 売り(テイカーが売り)の約定数量
+BUY_COUNT = 2  # 買いの約定回数
+SELL_COUNT = 3  # 売りの約定回数
+OFI = 4  # order flow imbalance（最良気配の変化）
+QUOTES = 5  # 最良気配(quote)の更新回数
+BOOK = 6  # 板(orderBookL2)の変更行数
+SIZE = 7
+
+
+# ==============================================================
+# RingAccumulator クラス
+#   時間で区切ったバケツを輪状に並べ、直近 window 秒の合計を保持する。
+#   時刻が進んだら古いバケツを合計から引いて空にする（時刻が戻った場合は最新のバケツに加える）
+#   param:
+#       window: 集計期間(秒)
+#       bucket: バケツの幅(秒)
+#       size: 集計する値の数
+# ==============================================================
+class RingAccumulator:
+    def __init__(self, window, bucket, size):
+        self.window = window
+        self.bucket = bucket
+        self._count = int(math.ceil(float(window) / bucket))
+        self._sums = [[0.0] * size for _ in range(self._count)]
+        self._totals = [0.0] * size
+        self._head = None  # 最新のバケツの番号
+
+    # ==========================================================
+    # 時刻を進める（空にするバケツは最大でバケツの数まで）
+    # ==========================================================
+    def advance(self, now):
+        head = int(now // self.bucket)
+        if self._head is None:
+            self._head = head
+            return
+        if head <= self._head:
+            return
+        steps = head - self._head
+        if steps >= self._count:
+            # 全て期間外（誤差を残さないように0にする）
+            for sums in self._sums:
+                for i in range(len(sums)):
+                    sums[i] = 0.0
+            for i in range(len(self._totals)):
+                self._totals[i] = 0.0
+        else:
+            for step in range(1, steps + 1):
+                sums = self._sums[(self._head + step) % self._count]
+                for i, value in enumerate(sums):
+                    if value != 0.0:
+                        self._totals[i] -= value
+                        sums[i] = 0.0
+        self._head = head
+
+    # ==========================================================
+    # 値を加える
+    # ==========================================================
+    def add(self, now, index, value):
+        self.advance(now)
+        self._sums[self._head % self._count][index] += value
+        self._totals[index] += value
+
+    # ==========================================================
+    # 直近 window 秒の合計
+    # ==========================================================
+    def total(self, index, now):
+        self.advance(now)
+        return self._totals[index]
+
+
+# ==============================================================
+# OrderFlow クラス
+#   約定(trade)、最良気配(quote)、板(orderBookL2)の受信データを集計する
+#   param:
+#       window: 集計期間(秒)
+#       bucket: バケツの幅(秒)
+# ==============================================================
+class OrderFlow:
+    def __init__(self, window=60, bucket=1):
+        self.window = window
+        self._ring = RingAccumulator(window, bucket, SIZE)
+        self._quote = None  # 直前の最良気配 (bidPrice, bidSize, askPrice, askSize)
+
+    # ==========================================================
+    # 約定の受信
+    #   side: Buy(テイカーが買い), Sell(テイカーが売り)
+    # ==========================================================
+    def on_trades(self, trades, now=None):
+        now = time.time() if now is None else now
+        ring = self._ring
+        for trade in trades:
+            if trade["side"] == "Buy":
+                ring.add(now, BUY_VOLUME, trade["size"])
+                ring.add(now, BUY_COUNT, 1)
+            elif trade["side"] == "Sell":
+                ring.add(now, SELL_VOLUME, trade["size"])
+                ring.add(now, SELL_COUNT, 1)
+
+    # ==========================================================
+    # 最良気配の受信
+    #   OFI (Cont, Kukanov, Stoikov) の最良気配の変化による寄与
+    #     e = (bid >= 直前のbid ? bidSize : 0) - (bid <= 直前のbid ? 直前のbidSize : 0)
+    #       - (ask <= 直前のask ? askSize : 0) + (ask >= 直前のask ? 直前のaskSize : 0)
+    # ==========================================================
+    def on_quotes(self, quotes, now=None):
+        now = time.time() if now is None else now
+        for quote in quotes:
+            current = (
+                quote.get("bidPrice"),
+                quote.get("bidSize"),
+                quote.get("askPrice"),
+                quote.get("askSize"),
+            )
+            self._ring.add(now, QUOTES, 1)
+            if None in current:
+                continue
+            if self._quote is not None:
+                bid, bid_size, ask, ask_size = self._quote
+                e = 0.0
+                e += current[1] if current[0] >= bid else 0.0
+                e -= bid_size if current[0] <= bid else 0.0
+                e -= current[3] if current[2] <= ask else 0.0
+                e += ask_size if current[2] >= ask else 0.0
+                self._ring.add(now, OFI, e)
+            self._quote = current
+
+    # ==========================================================
+    # 最良気配の初期化（partial。集計はしない）
+    # ==========================================================
+    def reset_quote(self, quote):
+        current = (
+            quote.get("bidPrice"),
+            quote.get("bidSize"),
+            quote.get("askPrice"),
+            quote.get("askSize"),
+        )
+        self._quote = current if None not in current else None
+
+    # ==========================================================
+    # 板の変更の受信
+    #   params:
+    #       count: insert, update, delete の行数
+    # ==========================================================
+    def on_book(self, count, now=None):
+        now = time.time() if now is None else now
+        self._ring.add(now, BOOK, count)
+
+    # ==========================================================
+    # 直近 window 秒の値
+    # ==========================================================
+    def total(self, index, now=None):
+        return self._ring.total(index, time.time() if now is None else now)
+
+    # ==========================================================
+    # 特徴量
+    #   buy_volume, sell_volume: 買い・売りの約定数量
+    #   trades: 約定回数、trade_intensity: 1秒あたりの約定回数
+    #   volume_imbalance: (買い - 売り) / (買い + 売り)（約定が無ければ0）
+    #   ofi: order flow imbalance（正: 買い圧力）
+    #   quotes: 最良気配の更新回数、book_updates: 板の変更行数
+    #   quote_to_trade: 板の変更行数 / 約定回数（約定が無ければNone）
+    # ==========================================================
+    def features(self, now=None):
+        now = time.time() if now is None else now
+        buy = self.total(BUY_VOLUME, now)
+        sell = self.total(SELL_VOLUME, now)
+        trades = self.total(BUY_COUNT, now) + self.total(SELL_COUNT, now)
+        book = self.total(BOOK, now)
+        return {
+            "buy_volume": buy,
+            "sell_volume": sell,
+            "trades": trades,
+            "trade_intensity": trades / self.window,
+            "volume_imbalance": (buy - sell) / (buy + sell) if buy + sell > 0 else 0.0,
+            "ofi": self.total(OFI, now),
+            "quotes": self.total(QUOTES, now),
+            "book_updates": book,
+            "quote_to_trade": book / trades if trades > 0 else None,
+        }
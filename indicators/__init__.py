@@ -1 +1,31 @@
-from .sma import Sma
+from .vectorized import (
+    sma,
+    ema,
+    wma,
+    stddev,
+    bollinger,
+    rsi,
+    true_range,
+    atr,
+    macd,
+    donchian,
+    vwap,
+)
+from .streaming import (
+    Indicator,
+    SMA,
+    EMA,
+    WMA,
+    StdDev,
+    Bollinger,
+    RSI,
+    ATR,
+    MACD,
+    Donchian,
+    VWAP,
+)
+from .doten import range_mean, doten_levels, doten_signal, Doten
+from .sweep import sma_sweep, range_mean_sweep, ema_sweep
+from .session_vwap import SessionVWAP
+from .cache import IndicatorCache, evaluate, shared_cache
+from .pipeline import IndicatorPipeline
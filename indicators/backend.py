@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+# ==========================================
+# インジケータの計算方法(backend)
+#   numpy: indicators.vectorized（常に使える）
+#   talib: TA-Lib（インストールされている場合のみ。無いインジケータは numpy で計算する）
+#   auto: 利用できる計算方法をインジケータ毎に同じデータで計測し、numpy と値が一致するもの
+#         のうち最も速いものを選ぶ（初回だけ計測して結果を保持する）
+#   引数・戻り値は indicators.vectorized と同じ
+# ==========================================
+import inspect
+import timeit
+
+import numpy as np
+
+from . import vectorized
+
+try:
+    import talib
+except ImportError:
+    talib = None
+
+# indicators.vectorized のインジケータ
+NAMES = [
+    "sma",
+    "ema",
+    "wma",
+    "stddev",
+    "bollinger",
+    "rsi",
+    "true_range",
+    "atr",
+    "macd",
+    "donchian",
+    "vwap",
+]
+
+# auto で計測する本数・回数
+SAMPLE = 10000
+NUMBER = 3
+
+# numpy と一致するとみなす相対誤差
+TOLERANCE = 1e-9
+
+
+# ==============================================================
+# TA-Lib の関数（引数・戻り値を indicators.vectorized に合わせる）
+# ==============================================================
+def _talib_functions():
+    if talib is None:
+        return {}
+    a = vectorized._as_array
+
+    def stddev(x, n, ddof=0):
+        if ddof != 0:
+            return vectorized.stddev(x, n, ddof)
+        return talib.STDDEV(a(x), n, 1.0)
+
+    def bollinger(x, n=20, k=2.0, ddof=0):
+        if ddof != 0:
+            return vectorized.bollinger(x, n, k, ddof)
+        return talib.BBANDS(a(x), n, k, k, 0)
+
+    def donchian(high, low, n=20):
+        upper, lower = talib.MAX(a(high), n), talib.MIN(a(low), n)
+        return upper, (upper + lower) / 2.0, lower
+
+    return {
+        "sma": lambda x, n: talib.SMA(a(x), n),
+        "ema": lambda x, n: talib.EMA(a(x), n),
+        "wma": lambda x, n: talib.WMA(a(x), n),
+        "stddev": stddev,
+        "bollinger": bollinger,
+        "rsi": lambda close, n=14: talib.RSI(a(close), n),
+        "true_range": lambda high, low, close: talib.TRANGE(
+            a(high), a(low), a(close)
+        ),
+        "atr": lambda high, low, close, n=14: talib.ATR(
+            a(high), a(low), a(close), n
+        ),
+        "macd": lambda close, fast=12, slow=26, signal=9: talib.MACD(
+            a(close), fast, slow, signal
+        ),
+        "donchian": donchian,
+    }
+
+
+# 計算方法毎の関数 {backend: {name: 関数}}
+BACKENDS = {"numpy": dict([(name, getattr(vectorized, name)) for name in NAMES])}
+if talib is not None:
+    BACKENDS["talib"] = _talib_functions()
+
+# auto で選んだ計算方法 {name: backend}
+_selected = {}
+
+
+# ==============================================================
+# インジケータの関数
+#   params:
+#       name: インジケータ名(sma, rsi, atr, ...)
+#       backend: numpy, talib, auto
+# ==============================================================
+def function(name, backend="auto"):
+    if name not in BACKENDS["numpy"]:
+        raise ValueError("unknown indicator: {}".format(name))
+    if backend == "auto":
+        backend = select(name)
+    if backend not in BACKENDS:
+        raise ValueError("unknown backend: {}".format(backend))
+    return BACKENDS[backend].get(name) or BACKENDS["numpy"][name]
+
+
+# ==============================================================
+# auto で使う計算方法
+#   計算方法が1つしか無ければ計測しない
+# ==============================================================
+def select(name):
+    if name in _selected:
+        return _selected[name]
+    candidates = [b for b, functions in BACKENDS.items() if name in functions]
+    choice = "numpy"
+    if len(candidates) > 1:
+        best = None
+        for backend in candidates:
+            if difference(name, backend) > TOLERANCE:
+                continue
+            elapsed = measure(name, backend)
+            if best is None or elapsed < best:
+                best, choice = elapsed, backend
+    _selected[name] = choice
+    return choice
+
+
+# ==============================================================
+# 計測用の足 {open, high, low, close, volume}
+# ==============================================================
+def sample(count, seed=0):
+    rng = np.random.RandomState(seed)
+    close = 10000.0 + np.cumsum(rng.normal(0, 10, count))
+    return {
+        "open": np.concatenate(([close[0]], close[:-1])),
+        "high": close + rng.uniform(0, 5, count),
+        "low": close - rng.uniform(0, 5, count),
+        "close": close,
+        "volume": rng.uniform(0, 100, count),
+    }
+
+
+# ==============================================================
+# 足をインジケータの引数にする（x には close、期間 n の既定値は14）
+# ==============================================================
+def arguments(name, data):
+    args, params = [], {}
+    for arg, p in inspect.signature(BACKENDS["numpy"][name]).parameters.items():
+        if arg in data:
+            args.append(data[arg])
+        elif arg == "x":
+            args.append(data["close"])
+        elif arg == "n" and p.default is inspect.Parameter.empty:
+            params["n"] = 14
+    return args, params
+
+
+# ==============================================================
+# 1回の計算時間(秒)
+# ==============================================================
+def measure(name, backend, count=SAMPLE, number=NUMBER):
+    func = function(name, backend)
+    args, params = arguments(name, sample(count))
+    return timeit.timeit(lambda: func(*args, **params), number=number) / number
+
+
+# ==============================================================
+# numpy との最大の相対誤差（NaN の位置が異なる場合は inf）
+# ==============================================================
+def difference(name, backend, count=SAMPLE):
+    args, params = arguments(name, sample(count))
+    expected = BACKENDS["numpy"][name](*args, **params)
+    actual = function(name, backend)(*args, **params)
+    if not isinstance(expected, tuple):
+        expected, actual = (expected,), (actual,)
+    diff = 0.0
+    for e, a in zip(expected, actual):
+        e, a = np.asarray(e, dtype=np.float64), np.asarray(a, dtype=np.float64)
+        if e.shape != a.shape or (np.isnan(e) != np.isnan(a)).any():
+            return float("inf")
+        mask = ~np.isnan(e)
+        if mask.any():
+            error = np.abs(e[mask] - a[mask]) / np.maximum(np.abs(e[mask]), 1.0)
+            diff = max(diff, float(error.max()))
+    return diff
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+# ==========================================
+# インジケータのキャッシュ
+#   (シンボル, タイムフレーム, インジケータ名, パラメータ, 最後の確定足のtimestamp) をキーに、
+#   計算結果を上限付きのLRUで保持する。同じ足の間の2回目以降の参照は辞書の参照だけになる。
+#   計算結果の配列は共有するので書き込み不可にする（加工する場合は copy() してから使う）
+# ==========================================
+import inspect
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from . import backend, vectorized
+
+# 足の値を受け取る引数名
+COLUMNS = ["open", "high", "low", "close", "volume"]
+
+
+# ==============================================================
+# ベクトル化インジケータの関数
+#   params:
+#       name: indicators.vectorized の関数名(sma, rsi, atr, ...)
+# ==============================================================
+def resolve(name):
+    func = getattr(vectorized, name, None) if not name.startswith("_") else None
+    if func is None or not inspect.isfunction(func):
+        raise ValueError("unknown indicator: {}".format(name))
+    return func
+
+
+# ==============================================================
+# ベクトル化インジケータの計算
+#   関数の引数名(high, low, close, volume)の列を渡し、x には source の列を渡す
+#   計算は indicators.backend が選んだ計算方法(numpy, TA-Lib)で行う
+#   params:
+#       name: indicators.vectorized の関数名(sma, rsi, atr, ...)
+#       df: ローソク足の DataFrame（列: open, high, low, close, volume）
+#       source: x に渡す列
+#       params: 関数のパラメータ(n など)
+# ==============================================================
+def evaluate(name, df, source="close", **params):
+    func = resolve(name)
+    args = []
+    for arg in inspect.signature(func).parameters:
+        if arg in COLUMNS:
+            args.append(df[arg].values)
+        elif arg == "x":
+            args.append(df[source].values)
+        else:
+            break
+    return backend.function(name)(*args, **params)
+
+
+# ==============================================================
+# 配列を書き込み不可にする（タプルの場合は各要素）
+# ==============================================================
+def _freeze(value):
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, tuple):
+        for v in value:
+            _freeze(v)
+    return value
+
+
+# ==============================================================
+# IndicatorCache クラス
+#   param:
+#       maxsize: 保持する最大件数（超えたら最も古く参照されたものから捨てる）
+# ==============================================================
+class IndicatorCache:
+
+    # ==========================================================
+    # 初期化
+    # ==========================================================
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self.clear()
+
+    # ==========================================================
+    # 全削除
+    # ==========================================================
+    def clear(self):
+        with self._lock:
+            self._data = OrderedDict()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    # ==========================================================
+    # キャッシュから取得（無ければ計算して登録する）
+    #   params:
+    #       symbol: シンボル
+    #       span: タイムフレーム
+    #       name: インジケータ名
+    #       params: パラメータ（dict）
+    #       timestamp: 最後の確定足のtimestamp
+    #       compute: 計算する関数 compute()
+    # ==========================================================
+    def get(self, symbol, span, name, params, timestamp, compute):
+        key = (symbol, span, name, tuple(sorted(params.items())), timestamp)
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+
+        # 計算中はロックしない（同時に同じキーを計算した場合は後の結果で上書きする）
+        value = _freeze(compute())
+
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    # ==========================================================
+    # 古い足の計算結果を削除する
+    #   params:
+    #       symbol: シンボル
+    #       span: タイムフレーム
+    #       timestamp: この時刻より前の確定足の計算結果を削除する（未指定は全て）
+    # ==========================================================
+    def invalidate(self, symbol, span, timestamp=None):
+        with self._lock:
+            for key in list(self._data.keys()):
+                if key[0] != symbol or key[1] != span:
+                    continue
+                if timestamp is None or key[4] is None or key[4] < timestamp:
+                    del self._data[key]
+
+    # ==========================================================
+    # 統計 {hits, misses, evictions, size, maxsize, hit_rate}
+    # ==========================================================
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hit_rate": self.hits / total if total != 0 else 0.0,
+            }
+
+    def __len__(self):
+        return len(self._data)
+
+
+# ==============================================================
+# プロセス内で共有するキャッシュ
+# ==============================================================
+shared_cache = IndicatorCache()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# ==========================================
+# ドテン君のシグナル
+#   足 i の値幅の平均(range mean)は、直前の n 本(i - n .. i - 1)の (high - low) の平均。
+#   足 i の high が open + range mean * k を超えたら買い(1)、
+#   そうでなく low が open - range mean * k を下回ったら売り(-1)、それ以外は 0。
+#   履歴全体を一括で計算する関数と、確定足毎に更新する逐次計算(Doten)がある。
+# ==========================================
+from collections import deque
+
+import numpy as np
+
+from .streaming import Indicator, field
+from .vectorized import _as_array, sma
+
+# シグナル
+BUY = 1
+SELL = -1
+NONE = 0
+
+
+# ==============================================================
+# 値幅の平均（足 i の値は、直前の n 本の (high - low) の平均。先頭 n 本は NaN）
+#   計算量: O(N)
+# ==============================================================
+def range_mean(high, low, n):
+    mean = sma(_as_array(high) - _as_array(low), n)
+    return np.concatenate(([np.nan], mean[:-1]))
+
+
+# ==============================================================
+# ドテンの価格
+#   return:
+#       (upper, lower)  upper = open + range mean * k, lower = open - range mean * k
+# ==============================================================
+def doten_levels(open, high, low, n, k):
+    width = range_mean(high, low, n) * k
+    open = _as_array(open)
+    return open + width, open - width
+
+
+# ==============================================================
+# ドテンのシグナル（1: 買い, -1: 売り, 0: なし）
+#   params:
+#       open, high, low: 足の配列（最後の足が未確定足でもよい）
+#       n: RANGE_MEAN_NUM
+#       k: DOTEN_K
+#   計算量: O(N)
+# ==============================================================
+def doten_signal(open, high, low, n, k):
+    upper, lower = doten_levels(open, high, low, n, k)
+    high, low = _as_array(high), _as_array(low)
+    with np.errstate(invalid="ignore"):
+        return np.where(high > upper, BUY, np.where(low < lower, SELL, NONE))
+
+
+# ==============================================================
+# ドテンのシグナル（逐次計算）
+#   値: 最後の確定足のシグナル。preview(未確定足) で未確定足のシグナル
+#   param:
+#       n: RANGE_MEAN_NUM
+#       k: DOTEN_K
+# ==============================================================
+class Doten(Indicator):
+    def __init__(self, n, k):
+        self.n = n
+        self.k = k
+        Indicator.__init__(self)
+
+    def _nan(self):
+        return NONE
+
+    def _reset(self):
+        self._window = deque()
+        self._sum = 0.0
+
+    def _signal(self, bar):
+        if len(self._window) < self.n:
+            return NONE
+        width = self._sum / self.n * self.k
+        open = field(bar, "open")
+        if field(bar, "high") > open + width:
+            return BUY
+        if field(bar, "low") < open - width:
+            return SELL
+        return NONE
+
+    def _update(self, bar):
+        signal = self._signal(bar)
+        r = field(bar, "high") - field(bar, "low")
+        self._window.append(r)
+        self._sum += r
+        if len(self._window) > self.n:
+            self._sum -= self._window.popleft()
+        return signal
+
+    def _preview(self, bar):
+        return self._signal(bar)
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+# ==========================================
+# インジケータのパイプライン
+#   定義ファイルの INDICATORS に書いたインジケータを依存関係の順に並べ、
+#   足が確定する度にローソク足スレッドで計算しておく（Puppet.run では計算しない）。
+#   同じ定義は1回だけ計算し、足の列から計算するものは Candle.indicator のキャッシュを共有する。
+#   定義ファイル:
+#       "INDICATORS": [
+#           {"name": "ema", "span": "1h", "period": 50},
+#           {"id": "rsi", "name": "rsi", "span": "15m", "period": 14},
+#           {"id": "rsi_ema", "name": "ema", "span": "15m", "period": 9, "source": "rsi"},
+#           {"id": "bb", "name": "bollinger", "span": "1h", "period": 20, "k": 2.0}
+#       ]
+#       name: indicators.vectorized の関数名
+#       span: タイムフレーム（マルチタイムフレームのローソク足）
+#       period: 期間（関数の n）
+#       id: 結果の名前（未指定は name, パラメータ, span を _ でつないだ名前。例: ema_50_1h）
+#       source: 足の列(open, high, low, close, volume) もしくは同じタイムフレームの他のインジケータのid
+#               （未指定は close）
+#       output: source のインジケータが複数の値を戻す場合に使う値の位置（未指定は0）
+#       その他: 関数のパラメータ(k, fast, slow など)
+# ==========================================
+import inspect
+import threading
+
+import numpy as np
+
+from . import backend
+from .cache import COLUMNS, _freeze, resolve
+
+
+# ==============================================================
+# 先頭に NaN を start 個追加する
+# ==============================================================
+def _pad(value, start):
+    return np.concatenate((np.full(start, np.nan), value))
+
+
+# ==============================================================
+# パイプラインの節点（1つのインジケータ）
+# ==============================================================
+class _Node:
+
+    __slots__ = ("id", "span", "name", "source", "output", "params", "key", "input")
+
+    def __init__(self, spec):
+        spec = dict(spec)
+        try:
+            self.name = spec.pop("name")
+            self.span = spec.pop("span")
+        except KeyError as e:
+            raise ValueError("indicator {} requires {}".format(spec, e))
+        node_id = spec.pop("id", None)
+        self.source = spec.pop("source", "close")
+        self.output = spec.pop("output", None)
+        if "period" in spec:
+            spec["n"] = spec.pop("period")
+        self.params = spec
+        self.id = (
+            node_id
+            if node_id is not None
+            else "_".join([self.name] + [str(v) for v in spec.values()] + [self.span])
+        )
+        self.key = None  # 同じ計算を判定するキー（依存関係を解決してから作る）
+        self.input = None  # source のインジケータ（足の列から計算する場合はNone）
+
+        # 関数とパラメータの確認（起動時にエラーにする）
+        names = list(inspect.signature(resolve(self.name)).parameters.keys())
+        for param in self.params:
+            if param in COLUMNS or param == "x" or param not in names:
+                raise ValueError(
+                    "indicator {}: unknown parameter {}".format(self.id, param)
+                )
+
+
+# ==============================================================
+# IndicatorPipeline クラス
+#   param:
+#       candle: マルチタイムフレーム ローソク足(modules.candle.Candle)
+#       specs: 定義ファイルの INDICATORS
+#       logger: logger
+# ==============================================================
+class IndicatorPipeline:
+
+    # ==========================================================
+    # 初期化
+    #   定義の誤り（未知の関数・パラメータ、存在しないsource、循環参照）は ValueError
+    # ==========================================================
+    def __init__(self, candle, specs, logger=None):
+        self._candle = candle
+        self._logger = logger
+
+        # -------------------------------------------------------
+        # Threadのロック用オブジェクト
+        # -------------------------------------------------------
+        self._lock = threading.Lock()
+
+        # -------------------------------------------------------
+        # 計算順 {タイムフレーム: [_Node, ...]}（同じ計算は1つにまとめる）
+        # -------------------------------------------------------
+        self._nodes = self.__build(specs)
+        self._order = {}
+        seen = set()
+        for node in self.__sort():
+            if node.key not in seen:
+                seen.add(node.key)
+                self._order.setdefault(node.span, []).append(node)
+        self.spans = list(self._order.keys())
+
+        # -------------------------------------------------------
+        # 計算結果 {id: 値}。計算し直す度に新しい dict に置き換える
+        # -------------------------------------------------------
+        self._values = {}
+        self._results = {}  # {タイムフレーム: {key: 値}}
+        self._versions = {}  # {タイムフレーム: 計算した時の Candle.version(span)}
+        for span in self.spans:
+            self.refresh(span)
+
+        # -------------------------------------------------------
+        # 足が確定したらローソク足スレッドで計算し直す
+        # -------------------------------------------------------
+        self._candle.subscribe(self.__on_bar, self.spans)
+
+        if self._logger is not None:
+            self._logger.debug(
+                "IndicatorPipeline initialized {}".format(list(self._nodes.keys()))
+            )
+
+    # ==========================================================
+    # 計算結果 {id: 値}
+    #   履歴の取り直しなどで確定足が変わっていれば計算し直す
+    #   共有するので変更しないこと（配列も書き込み不可）
+    # ==========================================================
+    def values(self):
+        for span in self.spans:
+            if self._candle.version(span) != self._versions.get(span):
+                self.refresh(span)
+        return self._values
+
+    # ==========================================================
+    # 計算し直す
+    #   params:
+    #       span: タイムフレーム
+    # ==========================================================
+    def refresh(self, span):
+        with self._lock:
+            version = self._candle.version(span)
+            if self._versions.get(span) == version:
+                return
+            results = {}
+            for node in self._order[span]:
+                results[node.key] = self.__compute(node, results)
+            self._results[span] = results
+
+            values = {}
+            for node in self._nodes.values():
+                if node.span in self._results:
+                    values[node.id] = self._results[node.span][node.key]
+            self._values = values
+            self._versions[span] = version
+
+    # ==========================================================
+    # 足の確定通知
+    # ==========================================================
+    def __on_bar(self, span, bar):
+        self.refresh(span)
+
+    # ==========================================================
+    # 1つのインジケータの計算
+    # ==========================================================
+    def __compute(self, node, results):
+        if node.input is None:
+            return self._candle.indicator(
+                node.span, node.name, node.source, **node.params
+            )
+        x = results[node.input.key]
+        if isinstance(x, tuple):
+            x = x[node.output or 0]
+        # 計算できない先頭部分(NaN)を除いて計算し、元の長さに戻す
+        valid = np.flatnonzero(~np.isnan(x))
+        start = valid[0] if len(valid) != 0 else len(x)
+        value = backend.function(node.name)(x[start:], **node.params)
+        if isinstance(value, tuple):
+            return _freeze(tuple([_pad(v, start) for v in value]))
+        return _freeze(_pad(value, start))
+
+    # ==========================================================
+    # 定義から節点を作る {id: _Node}
+    # ==========================================================
+    def __build(self, specs):
+        nodes = {}
+        for spec in specs:
+            node = _Node(spec)
+            if node.id in nodes:
+                raise ValueError("duplicate indicator id: {}".format(node.id))
+            nodes[node.id] = node
+
+        for node in nodes.values():
+            if node.source in COLUMNS:
+                continue
+            if node.source not in nodes:
+                raise ValueError(
+                    "indicator {}: unknown source {}".format(node.id, node.source)
+                )
+            node.input = nodes[node.source]
+            if node.input.span != node.span:
+                raise ValueError(
+                    "indicator {}: source {} is not {}".format(
+                        node.id, node.source, node.span
+                    )
+                )
+            if list(inspect.signature(resolve(node.name)).parameters)[0] != "x":
+                raise ValueError(
+                    "indicator {}: {} can not use an indicator as source".format(
+                        node.id, node.name
+                    )
+                )
+        return nodes
+
+    # ==========================================================
+    # 依存関係の順に並べる（source が先）。同じ計算の節点には同じ key を付ける
+    # ==========================================================
+    def __sort(self):
+        order = []
+        state = {}  # id: 1(探索中), 2(済)
+
+        def visit(node):
+            if state.get(node.id) == 2:
+                return
+            if state.get(node.id) == 1:
+                raise ValueError("circular indicator source: {}".format(node.id))
+            state[node.id] = 1
+            if node.input is not None:
+                visit(node.input)
+            source = node.input.key if node.input is not None else node.source
+            node.key = (
+                node.span,
+                node.name,
+                source,
+                node.output,
+                tuple(sorted(node.params.items())),
+            )
+            state[node.id] = 2
+            order.append(node)
+
+        for node in self._nodes.values():
+            visit(node)
+        return order
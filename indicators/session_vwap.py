@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+# ==========================================
+# セッションVWAP・TWAP（逐次計算）
+#   約定(add) もしくは確定足(update) を1件ずつ加え、セッション内・直近の期間内の
+#   VWAP(出来高加重平均価格)とTWAP(時間加重平均価格)を O(1) で参照する。
+#   時刻は全てミリ秒。セッションが替わると集計を0からやり直す。
+#
+#   約定: VWAP は約定価格、TWAP は各約定の価格を次の約定(最後の約定は参照時刻)まで保持した時間で重み付けする
+#   確定足: VWAP は典型価格(high + low + close) / 3、TWAP は典型価格の単純平均（足は等間隔）
+#   直近の期間(window)は、約定・足の時刻で期間内かを判定する（TWAPの区間は終わりの時刻で判定する）
+#   1つのオブジェクトには約定か確定足のどちらか一方だけを加えること
+# ==========================================
+from collections import deque
+
+from .streaming import NAN, Indicator, field
+
+HOUR = 60 * 60 * 1000
+
+# セッション (期間, 起点)（ミリ秒）
+SESSIONS = {
+    "day": (24 * HOUR, 0),  # UTCの日付
+    "funding": (8 * HOUR, 4 * HOUR),  # BitMEXのFunding（UTC 4時, 12時, 20時）
+}
+
+
+# ==============================================================
+# セッションの解析
+#   param:
+#       session: day, funding, [期間, 起点](ミリ秒)、None(セッションで区切らない)
+#   return:
+#       (period, offset) もしくは None
+# ==============================================================
+def _session(session):
+    if session is None:
+        return None
+    if isinstance(session, str):
+        if session not in SESSIONS:
+            raise ValueError("unknown session: {}".format(session))
+        return SESSIONS[session]
+    period, offset = session
+    if period <= 0:
+        raise ValueError("session period must be positive: {}".format(session))
+    return int(period), int(offset)
+
+
+# ==============================================================
+# 足の開始時刻(ミリ秒)
+#   websocketの5秒足(辞書)のtimestampは秒なのでミリ秒にする
+# ==============================================================
+def _timestamp(bar):
+    if isinstance(bar, dict):
+        return int(bar["timestamp"] * 1000)
+    return int(bar[0])
+
+
+# ==============================================================
+# SessionVWAP クラス
+#   値(value): 最後に加えた時点の VWAP（データが無い間は NaN）
+#   param:
+#       session: day, funding, [期間, 起点](ミリ秒)、None(セッションで区切らない)
+#       window: 直近の期間(秒)。None は期間で区切らない（セッションとの併用可）
+# ==============================================================
+class SessionVWAP(Indicator):
+    def __init__(self, session=None, window=None):
+        self.session = _session(session)
+        self.window = int(window * 1000) if window is not None else None
+        Indicator.__init__(self)
+
+    def _reset(self):
+        # 期間内のデータ (timestamp, 価格 * 数量, 数量, 価格 * 重み, 重み)（window 指定時のみ）
+        self._entries = deque()
+        self._pv = 0.0
+        self._volume = 0.0
+        self._tw = 0.0
+        self._weight = 0.0
+        self._start = None  # セッションの開始時刻
+        self._last = None  # 最後の約定 (timestamp, 価格)
+        self.timestamp = None  # 最後に加えた時刻
+
+    # ==========================================================
+    # 時刻を進める（セッションが替われば0から、期間外のデータは除く）
+    # ==========================================================
+    def _roll(self, ts):
+        start = self._session_start(ts)
+        if start is not None:
+            if self._start is None or start > self._start:
+                self._entries.clear()
+                self._pv = self._volume = self._tw = self._weight = 0.0
+                self._start = start
+                if self._last is not None:
+                    # 直前の約定価格は、セッションの開始から保持したとみなす
+                    self._last = (start, self._last[1])
+        if self.window is not None:
+            entries = self._entries
+            while len(entries) != 0 and entries[0][0] <= ts - self.window:
+                _, pv, volume, tw, weight = entries.popleft()
+                self._pv -= pv
+                self._volume -= volume
+                self._tw -= tw
+                self._weight -= weight
+            if len(entries) == 0:
+                # 誤差を残さないように0にする
+                self._pv = self._volume = self._tw = self._weight = 0.0
+
+    # セッションの開始時刻（セッションで区切らない場合は None）
+    def _session_start(self, ts):
+        if self.session is None:
+            return None
+        period, offset = self.session
+        return ts - (ts - offset) % period
+
+    def _push(self, ts, pv, volume, tw, weight):
+        self._pv += pv
+        self._volume += volume
+        self._tw += tw
+        self._weight += weight
+        if self.window is not None:
+            self._entries.append((ts, pv, volume, tw, weight))
+        self.timestamp = ts if self.timestamp is None else max(self.timestamp, ts)
+
+    # ==========================================================
+    # 約定を加える
+    #   params:
+    #       ts: 約定時刻(ミリ秒)
+    #       price: 約定価格
+    #       size: 約定数量
+    # ==========================================================
+    def add(self, ts, price, size):
+        self._roll(ts)
+        tw = weight = 0.0
+        if self._last is not None:
+            # 直前の約定価格を、この約定までの時間で重み付けする
+            weight = float(max(ts - self._last[0], 0))
+            tw = self._last[1] * weight
+        self._push(ts, price * size, size, tw, weight)
+        last = self._last[0] if self._last is not None else ts
+        self._last = (max(ts, last), price)
+        self.value = self._vwap(self._pv, self._volume)
+        return self.value
+
+    # ==========================================================
+    # 確定足を加える（Candle.attach から呼ばれる）
+    # ==========================================================
+    def _update(self, bar):
+        ts, tp, volume = self._bar(bar)
+        self._roll(ts)
+        self._push(ts, tp * volume, volume, tp, 1.0)
+        return self._vwap(self._pv, self._volume)
+
+    def _preview(self, bar):
+        ts, tp, volume = self._bar(bar)
+        pv, total = tp * volume, volume
+        if self._session_start(ts) == self._start:
+            pv, total = pv + self._pv, total + self._volume
+            for entry in self._expired(ts):
+                pv, total = pv - entry[1], total - entry[2]
+        return self._vwap(pv, total)
+
+    def _bar(self, bar):
+        tp = (field(bar, "high") + field(bar, "low") + field(bar, "close")) / 3.0
+        return _timestamp(bar), tp, field(bar, "volume")
+
+    # 期間外になるデータ（状態は変えない）
+    def _expired(self, ts):
+        if self.window is None:
+            return
+        for entry in self._entries:
+            if entry[0] > ts - self.window:
+                return
+            yield entry
+
+    def _vwap(self, pv, volume):
+        return pv / volume if volume > 0.0 else NAN
+
+    # ==========================================================
+    # VWAP
+    #   param:
+    #       now: 参照時刻(ミリ秒)。指定するとセッション・期間を now に進めてから計算する
+    # ==========================================================
+    def vwap(self, now=None):
+        if now is not None:
+            self._roll(now)
+        return self._vwap(self._pv, self._volume)
+
+    # ==========================================================
+    # TWAP
+    #   約定の場合、最後の約定価格は now（未指定は最後の約定時刻）まで保持したとみなす
+    # ==========================================================
+    def twap(self, now=None):
+        if now is not None:
+            self._roll(now)
+        tw, weight = self._tw, self._weight
+        if self._last is not None:
+            ts, price = self._last
+            if now is not None and now > ts:
+                tw, weight = tw + price * (now - ts), weight + (now - ts)
+            elif weight <= 0.0:
+                return price
+        return tw / weight if weight > 0.0 else NAN
+
+    # ==========================================================
+    # 状態（JSONに変換できる値）
+    # ==========================================================
+    def state(self):
+        return {
+            "session": list(self.session) if self.session is not None else None,
+            "window": self.window,
+            "count": self.count,
+            "entries": [list(e) for e in self._entries],
+            "sums": [self._pv, self._volume, self._tw, self._weight],
+            "start": self._start,
+            "last": list(self._last) if self._last is not None else None,
+            "timestamp": self.timestamp,
+        }
+
+    # ==========================================================
+    # 状態の復元
+    #   セッション・期間の設定が異なる状態は復元しない
+    #   return:
+    #       復元したか
+    # ==========================================================
+    def restore(self, state):
+        session = list(self.session) if self.session is not None else None
+        if state.get("session") != session or state.get("window") != self.window:
+            return False
+        self.count = state["count"]
+        self._entries = deque(tuple(e) for e in state["entries"])
+        self._pv, self._volume, self._tw, self._weight = state["sums"]
+        self._start = state["start"]
+        self._last = tuple(state["last"]) if state["last"] is not None else None
+        self.timestamp = state["timestamp"]
+        self.value = self._vwap(self._pv, self._volume)
+        return True
@@ -1,6 +0,0 @@
-# -*- coding: utf-8 -*-
-# 未実装
-
-
-class Sma:
-    pass
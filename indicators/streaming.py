@@ -0,0 +1,509 @@
+# -*- coding: utf-8 -*-
+# ==========================================
+# インジケータ（逐次計算）
+#   確定足を1本ずつ update() に渡すと、足1本あたりO(1)で値を更新する。
+#   未確定足は preview() に渡すと、状態を変えずにその足が確定した場合の値を戻す。
+#   値は indicators.vectorized と同じ定義・初期値で、計算できない間は NaN。
+#
+#   足は [timestamp, open, high, low, close, volume] の配列、
+#   もしくは {'open', 'high', 'low', 'close', 'volume'} を持つ辞書(websocketの5秒足)
+# ==========================================
+import math
+from collections import deque
+
+NAN = float("nan")
+
+# 足の配列の列番号
+FIELDS = {"timestamp": 0, "open": 1, "high": 2, "low": 3, "close": 4, "volume": 5}
+
+
+# ==============================================================
+# 足の値
+# ==============================================================
+def field(bar, name):
+    if isinstance(bar, dict):
+        return float(bar[name])
+    return float(bar[FIELDS[name]])
+
+
+# ==============================================================
+# Indicator クラス（逐次計算インジケータの基底クラス）
+#   サブクラスは _reset(), _update(bar), _preview(bar) を実装する
+# ==============================================================
+class Indicator:
+
+    # ==========================================================
+    # 初期化
+    # ==========================================================
+    def __init__(self):
+        self.reset()
+
+    # ==========================================================
+    # 状態を初期化する
+    # ==========================================================
+    def reset(self):
+        self.count = 0  # 確定足の本数
+        self.value = self._nan()  # 最後の確定足での値
+        self._reset()
+
+    # ==========================================================
+    # 確定足で更新する
+    #   return:
+    #       値
+    # ==========================================================
+    def update(self, bar):
+        self.value = self._update(bar)
+        self.count += 1
+        return self.value
+
+    # ==========================================================
+    # 未確定足を含めた値（状態は変えない）
+    # ==========================================================
+    def preview(self, bar):
+        return self._preview(bar)
+
+    # ==========================================================
+    # 確定足の履歴で更新する
+    # ==========================================================
+    def load(self, bars):
+        for bar in bars:
+            self.update(bar)
+        return self.value
+
+    def _nan(self):
+        return NAN
+
+
+# ==============================================================
+# 1つの値（終値など）から計算するインジケータの基底クラス
+#   param:
+#       source: 使用する足の値(open, high, low, close, volume)
+# ==============================================================
+class _SourceIndicator(Indicator):
+    def __init__(self, source="close"):
+        self.source = source
+        Indicator.__init__(self)
+
+    def _update(self, bar):
+        return self._push(field(bar, self.source))
+
+    def _preview(self, bar):
+        return self._peek(field(bar, self.source))
+
+
+# ==============================================================
+# 単純移動平均 SMA（窓の合計を保持する）
+# ==============================================================
+class SMA(_SourceIndicator):
+    def __init__(self, n, source="close"):
+        self.n = n
+        _SourceIndicator.__init__(self, source)
+
+    def _reset(self):
+        self._window = deque()
+        self._sum = 0.0
+
+    def _push(self, x):
+        self._window.append(x)
+        self._sum += x
+        if len(self._window) > self.n:
+            self._sum -= self._window.popleft()
+        return self._sum / self.n if len(self._window) == self.n else NAN
+
+    def _peek(self, x):
+        if len(self._window) < self.n - 1:
+            return NAN
+        total = self._sum + x
+        if len(self._window) == self.n:
+            total -= self._window[0]
+        return total / self.n
+
+
+# ==============================================================
+# 指数平滑（先頭 n 本の単純平均が初期値）
+#   param:
+#       alpha: 平滑化係数
+# ==============================================================
+class _Smooth:
+    def __init__(self, n, alpha):
+        self.n = n
+        self.alpha = alpha
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.value = NAN
+        self._sum = 0.0
+
+    def push(self, x):
+        self.value = self.peek(x)
+        self.count += 1
+        if self.count <= self.n:
+            self._sum += x
+        return self.value
+
+    def peek(self, x):
+        if self.count < self.n - 1:
+            return NAN
+        if self.count == self.n - 1:
+            return (self._sum + x) / self.n
+        return self.alpha * x + (1.0 - self.alpha) * self.value
+
+
+# ==============================================================
+# 指数移動平均 EMA（alpha = 2 / (n + 1)）
+# ==============================================================
+class EMA(_SourceIndicator):
+    def __init__(self, n, source="close"):
+        self.n = n
+        _SourceIndicator.__init__(self, source)
+
+    def _reset(self):
+        self._smooth = _Smooth(self.n, 2.0 / (self.n + 1))
+
+    def _push(self, x):
+        return self._smooth.push(x)
+
+    def _peek(self, x):
+        return self._smooth.peek(x)
+
+
+# ==============================================================
+# 加重移動平均 WMA（窓の合計と加重合計を保持する）
+# ==============================================================
+class WMA(_SourceIndicator):
+    def __init__(self, n, source="close"):
+        self.n = n
+        self._divisor = n * (n + 1) / 2.0
+        _SourceIndicator.__init__(self, source)
+
+    def _reset(self):
+        self._window = deque()
+        self._sum = 0.0  # 窓の合計
+        self._wsum = 0.0  # 窓の加重合計（窓が揃ってから使う）
+
+    def _next(self, x):
+        # 新しい足を加えた (合計, 加重合計)
+        if len(self._window) < self.n - 1:
+            return None
+        if len(self._window) == self.n - 1:
+            values = list(self._window) + [x]
+            wsum = sum([(i + 1) * v for i, v in enumerate(values)])
+            return self._sum + x, wsum
+        return (
+            self._sum + x - self._window[0],
+            self._wsum + self.n * x - self._sum,
+        )
+
+    def _push(self, x):
+        result = self._next(x)
+        self._window.append(x)
+        if len(self._window) > self.n:
+            self._window.popleft()
+        if result is None:
+            self._sum += x
+            return NAN
+        self._sum, self._wsum = result
+        return self._wsum / self._divisor
+
+    def _peek(self, x):
+        result = self._next(x)
+        return NAN if result is None else result[1] / self._divisor
+
+
+# ==============================================================
+# 標準偏差 STDDEV（基準値からの偏差の、窓の合計と2乗和を保持する）
+#   桁落ちを防ぐため、n本毎に基準値を窓の平均に取り直して合計を計算し直す
+#   （トレンドのある長い系列でも、偏差は直近2n本の値幅に収まる。ならしてO(1)）
+#   params:
+#       ddof: 0(母標準偏差、TA-Lib) 1(標本標準偏差)
+# ==============================================================
+class StdDev(_SourceIndicator):
+    def __init__(self, n, ddof=0, source="close"):
+        self.n = n
+        self.ddof = ddof
+        _SourceIndicator.__init__(self, source)
+
+    def _reset(self):
+        self._window = deque()
+        self._sum = 0.0
+        self._sq = 0.0
+        self._base = None
+        self._age = 0  # 基準値を取り直してから加えた本数
+
+    def _stats(self, x):
+        # 新しい足を加えた (本数, 合計, 2乗和)
+        base = self._base if self._base is not None else x
+        d = x - base
+        count, s1, s2 = len(self._window) + 1, self._sum + d, self._sq + d * d
+        if count > self.n:
+            old = self._window[0] - base
+            count, s1, s2 = count - 1, s1 - old, s2 - old * old
+        return count, s1, s2
+
+    def _std(self, count, s1, s2):
+        if count < self.n or self.n - self.ddof <= 0:
+            return NAN
+        var = (s2 - s1 * s1 / self.n) / (self.n - self.ddof)
+        return math.sqrt(max(var, 0.0))
+
+    def _push(self, x):
+        if self._base is None:
+            self._base = x
+        count, self._sum, self._sq = self._stats(x)
+        self._window.append(x)
+        if len(self._window) > self.n:
+            self._window.popleft()
+        self._age += 1
+        if self._age >= self.n:
+            self.__rebase()
+        return self._std(count, self._sum, self._sq)
+
+    def _peek(self, x):
+        return self._std(*self._stats(x))
+
+    def __rebase(self):
+        self._base = sum(self._window) / len(self._window)
+        d = [v - self._base for v in self._window]
+        self._sum = sum(d)
+        self._sq = sum([v * v for v in d])
+        self._age = 0
+
+
+# ==============================================================
+# ボリンジャーバンド BBANDS
+#   値: (upper, middle, lower)
+# ==============================================================
+class Bollinger(_SourceIndicator):
+    def __init__(self, n=20, k=2.0, ddof=0, source="close"):
+        self.n = n
+        self.k = k
+        self.ddof = ddof
+        _SourceIndicator.__init__(self, source)
+
+    def _nan(self):
+        return (NAN, NAN, NAN)
+
+    def _reset(self):
+        self._sma = SMA(self.n)
+        self._std = StdDev(self.n, self.ddof)
+
+    def _bands(self, middle, std):
+        return middle + self.k * std, middle, middle - self.k * std
+
+    def _push(self, x):
+        return self._bands(self._sma._push(x), self._std._push(x))
+
+    def _peek(self, x):
+        return self._bands(self._sma._peek(x), self._std._peek(x))
+
+
+# ==============================================================
+# RSI（上昇幅・下落幅の Wilder の平滑化）
+# ==============================================================
+class RSI(_SourceIndicator):
+    def __init__(self, n=14, source="close"):
+        self.n = n
+        _SourceIndicator.__init__(self, source)
+
+    def _reset(self):
+        self._gain = _Smooth(self.n, 1.0 / self.n)
+        self._loss = _Smooth(self.n, 1.0 / self.n)
+        self._prev = None
+
+    def _rsi(self, gain, loss):
+        if math.isnan(gain):
+            return NAN
+        total = gain + loss
+        return 100.0 * gain / total if total > 0.0 else 0.0
+
+    def _push(self, x):
+        if self._prev is None:
+            self._prev = x
+            return NAN
+        diff, self._prev = x - self._prev, x
+        gain = self._gain.push(max(diff, 0.0))
+        loss = self._loss.push(max(-diff, 0.0))
+        return self._rsi(gain, loss)
+
+    def _peek(self, x):
+        if self._prev is None:
+            return NAN
+        diff = x - self._prev
+        gain = self._gain.peek(max(diff, 0.0))
+        loss = self._loss.peek(max(-diff, 0.0))
+        return self._rsi(gain, loss)
+
+
+# ==============================================================
+# ATR（TRUE RANGE の Wilder の平滑化）
+# ==============================================================
+class ATR(Indicator):
+    def __init__(self, n=14):
+        self.n = n
+        Indicator.__init__(self)
+
+    def _reset(self):
+        self._smooth = _Smooth(self.n, 1.0 / self.n)
+        self._prev = None
+
+    def _true_range(self, bar):
+        high, low = field(bar, "high"), field(bar, "low")
+        return max(high - low, abs(high - self._prev), abs(low - self._prev))
+
+    def _update(self, bar):
+        if self._prev is None:
+            value = NAN
+        else:
+            value = self._smooth.push(self._true_range(bar))
+        self._prev = field(bar, "close")
+        return value
+
+    def _preview(self, bar):
+        if self._prev is None:
+            return NAN
+        return self._smooth.peek(self._true_range(bar))
+
+
+# ==============================================================
+# MACD
+#   値: (macd, signal, hist)
+# ==============================================================
+class MACD(_SourceIndicator):
+    def __init__(self, fast=12, slow=26, signal=9, source="close"):
+        self.fast = fast
+        self.slow = slow
+        self.signal = signal
+        _SourceIndicator.__init__(self, source)
+
+    def _nan(self):
+        return (NAN, NAN, NAN)
+
+    def _reset(self):
+        self._fast = _Smooth(self.fast, 2.0 / (self.fast + 1))
+        self._slow = _Smooth(self.slow, 2.0 / (self.slow + 1))
+        self._signal = _Smooth(self.signal, 2.0 / (self.signal + 1))
+
+    def _result(self, line, signal):
+        return line, signal, line - signal
+
+    def _push(self, x):
+        line = self._fast.push(x) - self._slow.push(x)
+        if math.isnan(line):
+            return self._nan()
+        return self._result(line, self._signal.push(line))
+
+    def _peek(self, x):
+        line = self._fast.peek(x) - self._slow.peek(x)
+        if math.isnan(line):
+            return self._nan()
+        return self._result(line, self._signal.peek(line))
+
+
+# ==============================================================
+# 窓の最大値(最小値)（単調キューで保持する）
+#   param:
+#       sign: 1(最大値) -1(最小値)
+# ==============================================================
+class _RollingExtreme:
+    def __init__(self, n, sign):
+        self.n = n
+        self.sign = sign
+        self.reset()
+
+    def reset(self):
+        self._queue = deque()  # [(番号, 値 * sign)]（値の降順）
+        self._count = 0
+
+    def push(self, x):
+        v = x * self.sign
+        while len(self._queue) != 0 and self._queue[-1][1] <= v:
+            self._queue.pop()
+        self._queue.append((self._count, v))
+        self._count += 1
+        if self._queue[0][0] <= self._count - 1 - self.n:
+            self._queue.popleft()
+        return self._queue[0][1] * self.sign if self._count >= self.n else NAN
+
+    def peek(self, x):
+        if self._count + 1 < self.n:
+            return NAN
+        v = x * self.sign
+        # 新しい足を加えると窓から外れる足を除いた最大値
+        for i, q in self._queue:
+            if i > self._count - self.n:
+                v = max(v, q)
+                break
+        return v * self.sign
+
+
+# ==============================================================
+# ドンチャンチャネル
+#   値: (upper, middle, lower)
+# ==============================================================
+class Donchian(Indicator):
+    def __init__(self, n=20):
+        self.n = n
+        Indicator.__init__(self)
+
+    def _nan(self):
+        return (NAN, NAN, NAN)
+
+    def _reset(self):
+        self._high = _RollingExtreme(self.n, 1)
+        self._low = _RollingExtreme(self.n, -1)
+
+    def _channel(self, upper, lower):
+        return upper, (upper + lower) / 2.0, lower
+
+    def _update(self, bar):
+        return self._channel(
+            self._high.push(field(bar, "high")), self._low.push(field(bar, "low"))
+        )
+
+    def _preview(self, bar):
+        return self._channel(
+            self._high.peek(field(bar, "high")), self._low.peek(field(bar, "low"))
+        )
+
+
+# ==============================================================
+# VWAP（典型価格の出来高加重平均）
+#   param:
+#       n: 期間（未指定は先頭からの累積）
+# ==============================================================
+class VWAP(Indicator):
+    def __init__(self, n=None):
+        self.n = n
+        Indicator.__init__(self)
+
+    def _reset(self):
+        self._window = deque()
+        self._pv = 0.0
+        self._volume = 0.0
+
+    def _next(self, bar):
+        tp = (field(bar, "high") + field(bar, "low") + field(bar, "close")) / 3.0
+        volume = field(bar, "volume")
+        pv, total = self._pv + tp * volume, self._volume + volume
+        if self.n is not None and len(self._window) == self.n:
+            old_pv, old_volume = self._window[0]
+            pv, total = pv - old_pv, total - old_volume
+        return tp * volume, volume, pv, total
+
+    def _vwap(self, count, pv, total):
+        if self.n is not None and count < self.n:
+            return NAN
+        return pv / total if total > 0.0 else NAN
+
+    def _update(self, bar):
+        item_pv, volume, self._pv, self._volume = self._next(bar)
+        if self.n is not None:
+            self._window.append((item_pv, volume))
+            if len(self._window) > self.n:
+                self._window.popleft()
+        return self._vwap(self.count + 1, self._pv, self._volume)
+
+    def _preview(self, bar):
+        _, _, pv, total = self._next(bar)
+        return self._vwap(self.count + 1, pv, total)
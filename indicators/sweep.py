@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+# ==========================================
+# インジケータのパラメータ一括計算（パラメータの最適化・バックテスト用）
+#   複数の期間・平滑化係数の値を1回の走査で計算し、2次元配列で戻す。
+#   戻り値は shape (パラメータ数, N) で、行 i はパラメータ i の値（indicators.vectorized と同じ値）。
+#   例: 期間 5..200 の SMA は累積和1回、100個の EMA はデータを1回走査するだけで計算する
+# ==========================================
+import numpy as np
+
+from .vectorized import _as_array
+
+
+# ==============================================================
+# 期間の配列（1次元の int64）
+# ==============================================================
+def _periods(periods):
+    periods = np.atleast_1d(np.asarray(periods, dtype=np.int64))
+    if (periods <= 0).any():
+        raise ValueError("period must be positive: {}".format(periods))
+    return periods
+
+
+# ==============================================================
+# 単純移動平均 SMA（期間毎）
+#   累積和1回から全ての期間を計算する
+#   params:
+#       x: 入力
+#       periods: 期間のリスト（例: range(5, 201)）
+#   計算量: O(N * 期間数)、累積和は1回
+# ==============================================================
+def sma_sweep(x, periods):
+    x = _as_array(x)
+    periods = _periods(periods)
+    c = np.concatenate(([0.0], np.cumsum(x)))
+    out = np.full((len(periods), len(x)), np.nan)
+    for i, n in enumerate(periods):
+        if n <= len(x):
+            out[i, n - 1 :] = (c[n:] - c[:-n]) / n
+    return out
+
+
+# ==============================================================
+# 値幅(high - low)の平均（期間毎）
+#   ドテン君の RANGE_MEAN_NUM の候補を一括で計算する
+# ==============================================================
+def range_mean_sweep(high, low, periods):
+    return sma_sweep(_as_array(high) - _as_array(low), periods)
+
+
+# ==============================================================
+# 指数移動平均 EMA（期間毎・平滑化係数毎）
+#   y[i] = alpha * x[i] + (1 - alpha) * y[i - 1] を全てのパラメータについて同時に計算する。
+#   漸化式を、重みが桁あふれしない長さのブロック毎に累積和で計算する（indicators.vectorized と同じ方法）
+#   params:
+#       x: 入力
+#       periods: 期間のリスト（alpha = 2 / (n + 1)、先頭 n 本の SMA が初期値。ema(x, n) と同じ値）
+#       alphas: 平滑化係数のリスト（先頭の値が初期値。periods と同時には指定しない）
+#   計算量: O(N * パラメータ数)、データの走査は1回
+# ==============================================================
+def ema_sweep(x, periods=None, alphas=None):
+    x = _as_array(x)
+    if (periods is None) == (alphas is None):
+        raise ValueError("specify either periods or alphas")
+    if periods is not None:
+        seeds = _periods(periods)
+        alpha = 2.0 / (seeds + 1.0)
+    else:
+        alpha = np.atleast_1d(np.asarray(alphas, dtype=np.float64))
+        if ((alpha <= 0.0) | (alpha > 1.0)).any():
+            raise ValueError("alpha must be in (0, 1]: {}".format(alpha))
+        seeds = np.ones(len(alpha), dtype=np.int64)
+
+    out = np.full((len(alpha), len(x)), np.nan)
+    if len(x) == 0:
+        return out
+
+    # -----------------------------------------------
+    # 初期値の位置(seeds - 1)に先頭 n 本の平均を置く
+    #   y[seed - 1] = alpha * (平均 / alpha) + beta * 0 となるように入力を置き換える
+    # -----------------------------------------------
+    c = np.concatenate(([0.0], np.cumsum(x)))
+    valid = seeds <= len(x)
+    start = np.where(valid, seeds - 1, len(x))
+    init = np.where(valid, c[np.minimum(seeds, len(x))] / seeds, 0.0)
+
+    # -----------------------------------------------
+    # ブロックの長さ毎にまとめて計算する（期間が長いほどブロックを長くできる）
+    # -----------------------------------------------
+    #   重み beta ** -k が 1e10 を超えない長さ（2のべき乗に切り下げる）
+    beta = 1.0 - alpha
+    limit = np.full(len(alpha), 4096.0)
+    decaying = beta > 0.0
+    limit[decaying] = np.minimum(23.0 / -np.log(beta[decaying]), 4096.0)
+    blocks = 2 ** np.floor(np.log2(np.maximum(limit, 1.0))).astype(np.int64)
+    for block in np.unique(blocks):
+        rows = np.flatnonzero((blocks == block) & valid)
+        if len(rows) != 0:
+            out[rows] = _smooth_rows(x, alpha[rows], start[rows], init[rows], block)
+    return out
+
+
+# ==============================================================
+# 複数の平滑化係数の指数平滑（ブロック毎に累積和で計算する）
+#   params:
+#       x: 入力
+#       alpha: 平滑化係数（行毎）
+#       start: 初期値の位置（行毎、これより前は NaN）
+#       init: 初期値（行毎）
+#       block: ブロックの長さ
+# ==============================================================
+def _smooth_rows(x, alpha, start, init, block):
+    count = len(x)
+    out = np.full((len(alpha), count), np.nan)
+    # alpha = 1 (beta = 0) の行は入力そのもの（重みは使わない）
+    flat = alpha >= 1.0
+    beta = np.where(flat, 1.0, 1.0 - alpha)
+    decay = beta[:, None] ** np.arange(1, block + 1)[None, :]
+    weight = alpha[:, None] / decay
+
+    prev = np.zeros(len(alpha))
+    first, last = int(start.min()), int(start.max())
+    for offset in range(first - first % block, count, block):
+        chunk = x[offset : offset + block]
+        m = len(chunk)
+        y = out[:, offset : offset + m]
+        if offset <= last:
+            # 初期値より前は0、初期値の位置は 平均 / alpha に置き換える
+            index = offset + np.arange(m)[None, :]
+            before = index < start[:, None]
+            value = np.where(before, 0.0, chunk[None, :])
+            value = np.where(index == start[:, None], (init / alpha)[:, None], value)
+        else:
+            before, value = None, chunk[None, :]
+        # 出力の領域で計算する y = decay * (prev + cumsum(alpha / decay * value))
+        np.multiply(weight[:, :m], value, out=y)
+        np.cumsum(y, axis=1, out=y)
+        y += prev[:, None]
+        y *= decay[:, :m]
+        if flat.any():
+            y[flat] = np.broadcast_to(value, y.shape)[flat]
+        prev = y[:, -1].copy()
+        if before is not None:
+            y[before] = np.nan
+    return out
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+# ==========================================
+# インジケータ（NumPyによるベクトル化）
+#   入力は float64 の1次元配列（list, pandas.Series, BarStore.column() の値もそのまま渡せる）
+#   出力は入力と同じ長さの numpy.ndarray で、計算できない先頭部分は NaN。
+#   TA-Lib と同じ定義・初期値で計算する（N: 本数, n: 期間）
+# ==========================================
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+
+# ==============================================================
+# float64 の配列に変換
+# ==============================================================
+def _as_array(x):
+    return np.asarray(x, dtype=np.float64)
+
+
+# ==============================================================
+# 長さ n の窓の2次元ビュー（コピーしない）
+#   return:
+#       shape (N - n + 1, n)
+# ==============================================================
+def _windows(x, n):
+    stride = x.strides[0]
+    return as_strided(x, shape=(len(x) - n + 1, n), strides=(stride, stride))
+
+
+# ==============================================================
+# 長さ n の窓の合計（累積和の差）
+# ==============================================================
+def _rolling_sum(x, n):
+    c = np.cumsum(np.concatenate(([0.0], x)))
+    return c[n:] - c[:-n]
+
+
+# ==============================================================
+# 指数平滑 y[i] = alpha * x[i] + (1 - alpha) * y[i - 1]
+#   漸化式を、重みが桁あふれしない長さのブロック毎に累積和で計算する
+#   params:
+#       x: 入力（先頭の初期値以降）
+#       alpha: 平滑化係数
+#       init: y[-1]（初期値）
+# ==============================================================
+def _smooth(x, alpha, init):
+    y = np.empty(len(x))
+    beta = 1.0 - alpha
+    if beta <= 0.0:
+        y[:] = x
+        return y
+    # ブロック内の重み beta ** -k が 1e10 を超えない長さ
+    block = int(min(max(23.0 / -np.log(beta), 1), 1024)) if beta < 1.0 else 1024
+    k = np.arange(1, block + 1)
+    decay = beta ** k
+    prev = init
+    for start in range(0, len(x), block):
+        chunk = x[start : start + block]
+        m = len(chunk)
+        d = decay[:m]
+        y[start : start + m] = d * (prev + np.cumsum(alpha * chunk / d))
+        prev = y[start + m - 1]
+    return y
+
+
+# ==============================================================
+# 先頭 n 本の単純平均を初期値とする指数平滑（TA-Lib の EMA, Wilder の平滑化）
+#   x[n - 1] に初期値を置き、以降を平滑化する
+# ==============================================================
+def _seeded_smooth(x, n, alpha):
+    out = np.full(len(x), np.nan)
+    if n <= 0 or len(x) < n:
+        return out
+    out[n - 1] = x[:n].mean()
+    out[n:] = _smooth(x[n:], alpha, out[n - 1])
+    return out
+
+
+# ==============================================================
+# 単純移動平均 SMA
+#   計算量: O(N)
+# ==============================================================
+def sma(x, n):
+    x = _as_array(x)
+    out = np.full(len(x), np.nan)
+    if 0 < n <= len(x):
+        out[n - 1 :] = _rolling_sum(x, n) / n
+    return out
+
+
+# ==============================================================
+# 指数移動平均 EMA（alpha = 2 / (n + 1)、先頭 n 本の SMA が初期値）
+#   計算量: O(N)
+# ==============================================================
+def ema(x, n):
+    return _seeded_smooth(_as_array(x), n, 2.0 / (n + 1))
+
+
+# ==============================================================
+# 加重移動平均 WMA（重み 1, 2, ..., n。新しい足ほど重い）
+#   計算量: O(N * n)
+# ==============================================================
+def wma(x, n):
+    x = _as_array(x)
+    out = np.full(len(x), np.nan)
+    if 0 < n <= len(x):
+        weights = np.arange(1, n + 1, dtype=np.float64)
+        out[n - 1 :] = _windows(x, n).dot(weights) / weights.sum()
+    return out
+
+
+# ==============================================================
+# 標準偏差 STDDEV
+#   窓毎に平均を引いてから2乗和を計算する（2パス）。
+#   累積和の差で計算すると、長い系列やトレンドのある系列では桁落ちするため使わない
+#   params:
+#       ddof: 0(母標準偏差、TA-Lib) 1(標本標準偏差、pandas の rolling().std())
+#   計算量: O(N * n)
+# ==============================================================
+def stddev(x, n, ddof=0):
+    x = _as_array(x)
+    out = np.full(len(x), np.nan)
+    if n - ddof <= 0 or len(x) < n:
+        return out
+    windows = _windows(x, n)
+    step = max(1, (1 << 20) // n)  # 一時配列が約100万要素になる本数
+    for start in range(0, len(windows), step):
+        chunk = windows[start : start + step]
+        out[n - 1 + start : n - 1 + start + len(chunk)] = np.sqrt(
+            chunk.var(axis=1, ddof=ddof)
+        )
+    return out
+
+
+# ==============================================================
+# ボリンジャーバンド BBANDS
+#   return:
+#       (upper, middle, lower)
+#   計算量: O(N)
+# ==============================================================
+def bollinger(x, n=20, k=2.0, ddof=0):
+    middle = sma(x, n)
+    width = k * stddev(x, n, ddof)
+    return middle + width, middle, middle - width
+
+
+# ==============================================================
+# RSI（Wilder の平滑化、alpha = 1 / n）
+#   計算量: O(N)
+# ==============================================================
+def rsi(close, n=14):
+    close = _as_array(close)
+    out = np.full(len(close), np.nan)
+    if len(close) <= n:
+        return out
+    diff = np.diff(close)
+    gain = _seeded_smooth(np.maximum(diff, 0.0), n, 1.0 / n)
+    loss = _seeded_smooth(np.maximum(-diff, 0.0), n, 1.0 / n)
+    total = gain + loss
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out[1:] = np.where(total > 0.0, 100.0 * gain / total, 0.0)
+    out[:n] = np.nan
+    return out
+
+
+# ==============================================================
+# TRUE RANGE（先頭は NaN）
+#   計算量: O(N)
+# ==============================================================
+def true_range(high, low, close):
+    high, low, close = _as_array(high), _as_array(low), _as_array(close)
+    out = np.full(len(close), np.nan)
+    if len(close) > 1:
+        prev = close[:-1]
+        out[1:] = np.maximum(
+            high[1:] - low[1:],
+            np.maximum(np.abs(high[1:] - prev), np.abs(low[1:] - prev)),
+        )
+    return out
+
+
+# ==============================================================
+# ATR（TRUE RANGE の Wilder の平滑化）
+#   計算量: O(N)
+# ==============================================================
+def atr(high, low, close, n=14):
+    tr = true_range(high, low, close)
+    out = np.full(len(tr), np.nan)
+    if len(tr) > n:
+        out[1:] = _seeded_smooth(tr[1:], n, 1.0 / n)
+    return out
+
+
+# ==============================================================
+# MACD
+#   macd = EMA(fast) - EMA(slow)、signal = macd の EMA(signal)、hist = macd - signal
+#   return:
+#       (macd, signal, hist)
+#   計算量: O(N)
+# ==============================================================
+def macd(close, fast=12, slow=26, signal=9):
+    close = _as_array(close)
+    line = ema(close, fast) - ema(close, slow)
+    sig = np.full(len(close), np.nan)
+    start = max(fast, slow) - 1
+    if len(close) > start:
+        sig[start:] = ema(line[start:], signal)
+    return line, sig, line - sig
+
+
+# ==============================================================
+# ドンチャンチャネル（n 本の最高値・最安値）
+#   return:
+#       (upper, middle, lower)
+#   計算量: O(N * n)
+# ==============================================================
+def donchian(high, low, n=20):
+    high, low = _as_array(high), _as_array(low)
+    upper = np.full(len(high), np.nan)
+    lower = np.full(len(low), np.nan)
+    if 0 < n <= len(high):
+        upper[n - 1 :] = _windows(high, n).max(axis=1)
+        lower[n - 1 :] = _windows(low, n).min(axis=1)
+    return upper, (upper + lower) / 2.0, lower
+
+
+# ==============================================================
+# VWAP（典型価格 (high + low + close) / 3 の出来高加重平均）
+#   params:
+#       n: 期間（未指定は先頭からの累積）
+#   出来高が0の区間は NaN
+#   計算量: O(N)
+# ==============================================================
+def vwap(high, low, close, volume, n=None):
+    high, low, close = _as_array(high), _as_array(low), _as_array(close)
+    volume = _as_array(volume)
+    pv = (high + low + close) / 3.0 * volume
+    out = np.full(len(close), np.nan)
+    if n is None:
+        num, den, start = np.cumsum(pv), np.cumsum(volume), 0
+    elif 0 < n <= len(close):
+        num, den, start = _rolling_sum(pv, n), _rolling_sum(volume, n), n - 1
+    else:
+        return out
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out[start:] = np.where(den > 0.0, num / den, np.nan)
+    return out
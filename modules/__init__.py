@@ -2,3 +2,4 @@ from modules.discord import Discord
 from modules.balance import Balance
 from modules.heartbeat import Heartbeat
 from modules.candle import Candle
+from modules.ordermanager import OrderManager
@@ -96,7 +96,7 @@ class Balance:
         else:
             # websocket 無効
             balance = (
-                self._exchange.fetch_balance()
+                self._bitmex.balance()
                 if self._config["USE"]["BALANCE"] == True
                 else 0
             )
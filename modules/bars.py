@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+# ==========================================
+# TradeBars
+# ==========================================
+import abc
+
+# thred操作
+import threading
+
+# 約定時刻の変換
+import dateutil.parser
+
+import pandas as pd
+
+# 列指向の格納領域
+from modules.candlebuilder import BarStore
+
+# from .. import Puppeteer
+
+
+# ==============================================================
+# TradeBar クラス
+#   約定から作る足（時間で区切らない足）の基底クラス。
+#   確定足は BarStore に、集計中の足は _live に持つ。
+#   足: [timestamp(最初の約定、ミリ秒), open, high, low, close, volume, notional, trades, end(最後の約定、ミリ秒)]
+#   param:
+#       threshold: 足を確定させる閾値
+#       maxlen: 保持する最大本数
+# ==============================================================
+class TradeBar(abc.ABC):
+
+    COLUMNS = [
+        "timestamp",
+        "open",
+        "high",
+        "low",
+        "close",
+        "volume",
+        "notional",
+        "trades",
+        "end",
+    ]
+
+    # ==========================================================
+    # 初期化
+    # ==========================================================
+    def __init__(self, threshold, maxlen=1000):
+        self.threshold = threshold
+        self._store = BarStore(maxlen, TradeBar.COLUMNS)
+        self._live = None
+
+    # ==========================================================
+    # 約定で足を更新
+    #   params:
+    #       ts: 約定時刻(ミリ秒)
+    #       price: 約定価格
+    #       size: 約定数量(契約数)
+    #       notional: 約定代金
+    #   return:
+    #       確定した足（確定しなければNone）
+    # ==========================================================
+    def update(self, ts, price, size, notional=0):
+        bar = self._live
+        if bar is None:
+            self._live = [ts, price, price, price, price, size, notional, 1, ts]
+        else:
+            bar[2] = max(bar[2], price)
+            bar[3] = min(bar[3], price)
+            bar[4] = price
+            bar[5] += size
+            bar[6] += notional
+            bar[7] += 1
+            bar[8] = ts
+
+        if not self._is_full(self._live):
+            return None
+        bar, self._live = self._live, None
+        self._store.append(bar)
+        return bar
+
+    # ==========================================================
+    # 足を確定させるか（サブクラスで実装）
+    # ==========================================================
+    @abc.abstractmethod
+    def _is_full(self, bar):
+        pass
+
+    # ==========================================================
+    # 確定足
+    # ==========================================================
+    def closed(self):
+        return self._store.to_list()
+
+    # ==========================================================
+    # 集計中の足（無ければNone）
+    # ==========================================================
+    def live_bar(self):
+        return list(self._live) if self._live is not None else None
+
+    # ==========================================================
+    # 最後の確定足のtimestamp
+    # ==========================================================
+    def last_timestamp(self):
+        return self._store.last_timestamp()
+
+    # ==========================================================
+    # 列データ
+    # ==========================================================
+    def column(self, name):
+        return self._store.column(name)
+
+
+# ==============================================================
+# ティックバー: 約定回数が threshold に達したら確定する
+# ==============================================================
+class TickBar(TradeBar):
+    def _is_full(self, bar):
+        return bar[7] >= self.threshold
+
+
+# ==============================================================
+# ボリュームバー: 約定数量(契約数)が threshold に達したら確定する
+#   閾値を超えた約定は分割せず、その約定を含めて確定する
+# ==============================================================
+class VolumeBar(TradeBar):
+    def _is_full(self, bar):
+        return bar[5] >= self.threshold
+
+
+# ==============================================================
+# ダラーバー: 約定代金が threshold に達したら確定する
+#   約定代金は TradeBars の NOTIONAL 指定の項目(foreignNotional: USD, homeNotional: XBT)
+# ==============================================================
+class DollarBar(TradeBar):
+    def _is_full(self, bar):
+        return bar[6] >= self.threshold
+
+
+# ==============================================================
+# レンジバー: 高値と安値の差が threshold に達したら確定する
+# ==============================================================
+class RangeBar(TradeBar):
+    def _is_full(self, bar):
+        return bar[2] - bar[3] >= self.threshold
+
+
+# ==============================================================
+# TradeBars クラス
+#   websocketの約定から、ティック・ボリューム・ダラー・レンジバーを作る
+#   定義ファイル:
+#       "TRADE_BARS": {"TICK": 500, "VOLUME": 1000000, "DOLLAR": 1000000, "RANGE": 50,
+#                      "NOTIONAL": "foreignNotional", "LIMIT": 1000}
+#       （使用しない足は未指定 もしくは null）
+#   param:
+#       puppeteer: Puppeteerオブジェクト
+# ==============================================================
+class TradeBars:
+
+    # 定義名と足の種類
+    __KINDS = {
+        "TICK": TickBar,
+        "VOLUME": VolumeBar,
+        "DOLLAR": DollarBar,
+        "RANGE": RangeBar,
+    }
+
+    # ==========================================================
+    # 初期化
+    #   param:
+    #       puppeteer: Puppeteerオブジェクト
+    # ==========================================================
+    def __init__(self, Puppeteer):
+        self._exchange = Puppeteer._exchange  # 取引所オブジェクト(ccxt.bitmex)
+        self._logger = Puppeteer._logger  # logger
+        self._config = Puppeteer._config  # 定義ファイル
+        self._ws = Puppeteer._ws  # websocket
+        self._bitmex = Puppeteer._bitmex  # ccxt.bimexラッパーオブジェクト
+        self._discord = Puppeteer._discord  # discord
+
+        config = self._config["TRADE_BARS"]
+        self._notional = config.get("NOTIONAL") or "foreignNotional"
+        maxlen = config.get("LIMIT") or 1000
+
+        # -------------------------------------------------------
+        # Threadのロック用オブジェクト
+        # -------------------------------------------------------
+        self._lock = threading.Lock()
+
+        # -------------------------------------------------------
+        # 足の種類毎の集計オブジェクト（tick, volume, dollar, range）
+        # -------------------------------------------------------
+        self._bars = {}
+        for name, cls in TradeBars.__KINDS.items():
+            if config.get(name) is not None:
+                self._bars[name.lower()] = cls(config[name], maxlen)
+
+        # -------------------------------------------------------
+        # websocketの約定を受信する
+        # -------------------------------------------------------
+        self._ws.add_listener("trade", self.__on_trade)
+
+        self._logger.debug(
+            "TradeBars initialized {}".format(
+                dict([(k, b.threshold) for k, b in self._bars.items()])
+            )
+        )
+
+    # ==========================================================
+    # 確定足
+    #   params:
+    #       kind: tick, volume, dollar, range
+    # ==========================================================
+    def closed(self, kind):
+        with self._lock:
+            return self._bars[kind].closed()
+
+    # ==========================================================
+    # 集計中の足
+    # ==========================================================
+    def live_bar(self, kind):
+        with self._lock:
+            return self._bars[kind].live_bar()
+
+    # ==========================================================
+    # 列データ
+    # ==========================================================
+    def column(self, kind, name):
+        with self._lock:
+            return self._bars[kind].column(name)
+
+    # ==========================================================
+    # 確定足のDataFrame（indexは最初の約定時刻）
+    # ==========================================================
+    def candle(self, kind):
+        df = pd.DataFrame(self.closed(kind), columns=TradeBar.COLUMNS)
+        df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms", utc=True)
+        df["end"] = pd.to_datetime(df["end"], unit="ms", utc=True)
+        return df.set_index("timestamp")
+
+    # ==========================================================
+    # websocket trade の受信
+    #   接続時の partial は過去の約定なので使わない
+    # ==========================================================
+    def __on_trade(self, action, data):
+        if action != "insert" or len(self._bars) == 0:
+            return
+        with self._lock:
+            for trade in data:
+                ts = int(dateutil.parser.parse(trade["timestamp"]).timestamp() * 1000)
+                notional = trade.get(self._notional) or 0
+                for bar in self._bars.values():
+                    bar.update(ts, trade["price"], trade["size"], notional)
@@ -3,17 +3,61 @@
 # Candle
 # ==========================================
 import time
+import bisect
 from datetime import datetime as dt, timezone as tz, timedelta as delta
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 # thred操作
 import threading
 
+# 約定時刻の変換
+import dateutil.parser
+
 # csv reader として利用
 import pandas as pd
 
+# ギャップの判定
+import numpy as np
+
+# 逐次集計
+from modules.candlebuilder import CandleBuilder, parse_span
+
+# インジケータのキャッシュ
+from indicators.cache import evaluate, shared_cache
+
+# チェックポイント
+from modules.checkpoint import (
+    Checkpoint,
+    indicator_key,
+    indicator_state,
+    restore_indicator,
+)
+
 # from .. import Puppeteer
 
 
+# ==============================================================
+# CandleSnapshot クラス
+#   公開したタイムフレームのローソク足。複数のスレッドで共有するので変更しないこと
+#   （加工する場合は df.copy() してから使う）
+#   param:
+#       span: タイムフレーム
+#       version: 最後に足が確定した時のバージョン（Candle.version と比較する）
+#       timestamp: 最後の確定足のtimestamp(ミリ秒、無ければNone)
+#       df: pandas.DataFrame
+# ==============================================================
+class CandleSnapshot:
+
+    __slots__ = ("span", "version", "timestamp", "df")
+
+    def __init__(self, span, version, timestamp, df):
+        self.span = span
+        self.version = version
+        self.timestamp = timestamp
+        self.df = df
+
+
 # ==============================================================
 # Candle クラス
 #   param:
@@ -21,7 +65,21 @@ import pandas as pd
 # ==============================================================
 class Candle:
 
-    __DIFF_TIME = 5  # 5秒
+    # 期間の区切りから足を確定させるまでの待ち時間(秒)
+    #   websocket: 区切り直前の約定の受信を待つ
+    #   REST: 取引所で確定足が作られるのを待つ（取れなければ1秒毎にリトライする）
+    __CLOSE_DELAY_WS = 0.2
+    __CLOSE_DELAY_REST = 1
+    __CLOSE_RETRY_REST = 5
+
+    # 取引所から取得できる基準足
+    __BASE = ["1m", "5m", "1h", "1d"]
+
+    # 1回で取得できる最大件数
+    __MAX_FETCH = 500
+
+    # websocketの受信がこの秒数止まっていたらRESTで確定足を取り直す
+    __WS_STALE_SEC = 10
 
     # ==========================================================
     # 初期化
@@ -42,74 +100,96 @@ class Candle:
         self._tz = tz.utc
 
         # -------------------------------------------------------
-        # 最大ロープ時間
-        # period = {'1m': 1 * 60, '5m': 5 * 60, '1h': 60 * 60, '1d': 24 * 60 * 60}
+        # Threadのロック用オブジェクト
         # -------------------------------------------------------
-        self.__max_loop_time = 24 * 60 * 60  # MAX
+        self._lock = threading.Lock()
 
         # -------------------------------------------------------
-        # マルチタイムフレーム で定義されたローソク足に基準ローソク足が設定されていなかったら　1m, 5m, 1h, 1d　を設定する
+        # タイムフレーム毎の逐次集計オブジェクト
+        #   タイムフレームは基準足(1m, 5m, 1h, 1d)の倍数なら任意（例: 7m, 45m, 8h, 1w, 2w）
+        #   定義されていない基準足は追加する。
+        #   最小の基準足(ルート)だけを取引所から取得し、上位足は下位足の確定足から集計する。
+        #   例: 1m -> 3m, 5m -> 15m -> 45m, 1h -> 4h -> 8h, 1d -> 1w -> 2w
         # -------------------------------------------------------
-        # 1d
-        if "1d" in self._config["MULTI_TIMEFRAME_CANDLE_SPAN_LIST"]:
-            self.__max_loop_time = 24 * 60 * 60  # 24時間
-        # 1h
-        for h in ["2h", "3h", "4h", "6h", "12h"]:
-            if (
-                "1h" not in self._config["MULTI_TIMEFRAME_CANDLE_SPAN_LIST"]
-                and h in self._config["MULTI_TIMEFRAME_CANDLE_SPAN_LIST"]
-            ):
-                # 2h, 3h, 4h, 6h, 12hが定義されていて、1hが未定義
-                self._config["MULTI_TIMEFRAME_CANDLE_SPAN_LIST"].insert(0, "1h")
-                self.__max_loop_time = 1 * 60 * 60  # 1時間
-                break
-        if "1h" in self._config["MULTI_TIMEFRAME_CANDLE_SPAN_LIST"]:
-            self.__max_loop_time = 1 * 60 * 60  # 1時間
-        # 5m
-        for m5 in ["10m", "15m", "30m"]:
-            if (
-                "5m" not in self._config["MULTI_TIMEFRAME_CANDLE_SPAN_LIST"]
-                and m5 in self._config["MULTI_TIMEFRAME_CANDLE_SPAN_LIST"]
-            ):
-                # 10m, 15m, 30mが定義されていて、5mが未定義
-                self._config["MULTI_TIMEFRAME_CANDLE_SPAN_LIST"].insert(0, "5m")
-                self.__max_loop_time = 5 * 60  # 5分
-                break
-        if "5m" in self._config["MULTI_TIMEFRAME_CANDLE_SPAN_LIST"]:
-            self.__max_loop_time = 5 * 60  # 5分
-        # 1m
-        for m1 in ["3m"]:
-            if (
-                "1m" not in self._config["MULTI_TIMEFRAME_CANDLE_SPAN_LIST"]
-                and m1 in self._config["MULTI_TIMEFRAME_CANDLE_SPAN_LIST"]
-            ):
-                # 3mが定義されていて、1mが未定義
-                self._config["MULTI_TIMEFRAME_CANDLE_SPAN_LIST"].insert(0, "1m")
-                self.__max_loop_time = 1 * 60  # 1分
-                break
-        if "1m" in self._config["MULTI_TIMEFRAME_CANDLE_SPAN_LIST"]:
-            self.__max_loop_time = 1 * 60  # 1分
-
-        # for DEBUG
-        # print(self._config['MULTI_TIMEFRAME_CANDLE_SPAN_LIST'])
+        self.__create_builders()
 
         # -------------------------------------------------------
-        # Threadのロック用オブジェクト
+        # 最大ループ時間（ルートの期間）
         # -------------------------------------------------------
-        self._lock = threading.Lock()
+        self.__max_loop_time = self._root.period // 1000
 
         # -------------------------------------------------------
         # マルチタイムフレーム ローソク足
-        # タイムフレーム（設定可能: 1m, 3m, 5m, 10m, 15m, 30m, 1h, 2h, 3h, 4h, 6h, 12h, 1d）
+        #   タイムフレーム毎に CandleSnapshot を公開し、参照時はロックもコピーもしない。
+        #   _snapshots: 確定足のみ（足が確定した時だけ作り直す）
+        #   _live_snapshots: 確定足 + 未確定足（未確定足の更新はコピーの最後の行を書き換えて作り直す）
+        #   バージョンは足が確定する度に増える（未確定足の更新では増えない）
         # -------------------------------------------------------
-        self._candle = {}
-        for span in self._config["MULTI_TIMEFRAME_CANDLE_SPAN_LIST"]:
-            self._candle[span] = None
+        self._snapshots = {}
+        self._live_snapshots = {}
+        self._live_ts = {}  # _live_snapshots の最後の行のtimestamp(ミリ秒、未確定足が無ければNone)
+        self._dirty = set()  # 確定足の公開し直しが必要なタイムフレーム
+        self._live_dirty = set()  # 未確定足の公開し直しが必要なタイムフレーム
+        self._version = 0
+        self._versions = {}
+        for span in self._builders.keys():
+            self._snapshots[span] = None
+            self._live_snapshots[span] = None
+            self._live_ts[span] = None
+            self._versions[span] = 0
+
+        # -------------------------------------------------------
+        # websocketの約定
+        #   websocketを使用する場合、RESTは履歴の取得(と切断時の取り直し)のみに使い、
+        #   ルートの足は約定から作る。受信した約定は溜めておき、参照時に集計する。
+        # -------------------------------------------------------
+        self._trades = deque()
+        self._trade_cutoff = 0  # この時刻(ミリ秒)以前の約定はRESTの足に含まれている
+        self._resync = False  # RESTで確定足を取り直すか
+
+        # -------------------------------------------------------
+        # 足の確定通知
+        #   _subscribers: [(タイムフレームのset or None(全て), callback), ...]
+        #   _closed: 通知待ちの確定足 [(CandleBuilder, bar), ...]
+        # -------------------------------------------------------
+        self._subscribers = []
+        self._closed = deque()
+
+        # -------------------------------------------------------
+        # 確定足で更新する逐次計算インジケータ {タイムフレーム: [Indicator, ...]}
+        # -------------------------------------------------------
+        self._indicators = {}
+
+        # -------------------------------------------------------
+        # インジケータのキャッシュ（プロセス内で共有し、足が確定したら古い結果を捨てる）
+        # -------------------------------------------------------
+        self._indicator_cache = shared_cache
+        if self._ws is not None:
+            self._ws.add_listener("trade", self.__on_trade)
+
+        # -------------------------------------------------------
+        # チェックポイント（CHECKPOINT_DIR 未指定は使わない）
+        #   足が確定する度にローソク足と逐次計算インジケータの状態を保存し、
+        #   起動時は保存後の足だけを取得して続きから計算する
+        #   _restore: 初回ロードでチェックポイントを読むか
+        #   _saved_indicators: 読み込んだインジケータの状態 [(識別子, タイムフレーム, timestamp, 状態), ...]
+        #   _indicator_keys: 登録したインジケータの識別子 {id(Indicator): 識別子}
+        # -------------------------------------------------------
+        self._checkpoint = (
+            Checkpoint(
+                self._config["CHECKPOINT_DIR"], self._config["SYMBOL"], self._logger
+            )
+            if self._config.get("CHECKPOINT_DIR") is not None
+            else None
+        )
+        self._restore = self._checkpoint is not None
+        self._saved_indicators = []
+        self._indicator_keys = {}
 
         # -------------------------------------------------------
         # 起動時に初回ロード
         # -------------------------------------------------------
-        self.__get_candle()
+        self.__load_candle()
 
         # -------------------------------------------------------
         # マルチタイムフレーム ローソク足 スレッド
@@ -129,13 +209,201 @@ class Candle:
 
     # ===========================================================
     # candle
+    #   コピーしないので、加工する場合は df.copy() してから使うこと
+    #   params:
+    #       span: タイムフレーム
+    #       closed_only: True(確定足のみ)、False(最新の未確定足を含む)
+    #                    未指定はCANDLEのPARTIAL指定に従う
+    # ===========================================================
+    def candle(self, span, closed_only=None):
+        return self.snapshot(span, closed_only).df
+
+    # ===========================================================
+    # snapshot
+    #   更新が無ければロックせずに公開済みの CandleSnapshot を戻す
+    #   （約定は受信時に集計済みなので、参照時は公開し直しが必要かだけを確認する）
+    #   公開済みの CandleSnapshot は変更しない（更新があれば新しい CandleSnapshot になる）
+    #   未確定足を含む場合、未確定足の更新でも新しい CandleSnapshot になるが、version は
+    #   足が確定した時だけ変わる
+    #   params:
+    #       span: タイムフレーム
+    #       closed_only: True(確定足のみ)、False(最新の未確定足を含む)
+    #                    未指定はCANDLEのPARTIAL指定に従う
+    # ===========================================================
+    def snapshot(self, span, closed_only=None):
+        if closed_only is None:
+            closed_only = self._config["CANDLE"]["PARTIAL"] != True
+        snapshots, dirty = (
+            (self._snapshots, self._dirty)
+            if closed_only
+            else (self._live_snapshots, self._live_dirty)
+        )
+
+        snapshot = snapshots[span]
+        if snapshot is not None and span not in self._dirty and span not in dirty:
+            return snapshot
+
+        self.__thread_lock()
+        try:
+            self.__drain_trades()
+            if span in self._dirty or self._snapshots[span] is None:
+                self.__publish(span)
+            if not closed_only and (
+                span in self._live_dirty or self._live_snapshots[span] is None
+            ):
+                self.__publish_live(span)
+            snapshot = snapshots[span]
+        finally:
+            self.__thread_unlock()
+
+        return snapshot
+
+    # ===========================================================
+    # 未確定足 [timestamp(ミリ秒), open, high, low, close, volume]（無ければNone）
+    #   下位足の未確定分を含む（15mなら、集計中の5mも含めた値）
+    # ===========================================================
+    def live_bar(self, span):
+        self.__thread_lock()
+        try:
+            self.__drain_trades()
+            return self._builders[span].live_bar()
+        finally:
+            self.__thread_unlock()
+
+    # ===========================================================
+    # 最後の確定足 [timestamp(ミリ秒), open, high, low, close, volume]（無ければNone）
+    # ===========================================================
+    def last_closed(self, span):
+        self.__thread_lock()
+        try:
+            self.__drain_trades()
+            return self._builders[span].last_closed()
+        finally:
+            self.__thread_unlock()
+
+    # ===========================================================
+    # バージョン（最後に足が確定した時のバージョン）
+    #   受信済みの約定を集計してから戻す
+    #   params:
+    #       span: タイムフレーム（未指定は全タイムフレーム）
+    # ===========================================================
+    def version(self, span=None):
+        if len(self._trades) != 0:
+            self.__thread_lock()
+            try:
+                self.__drain_trades()
+            finally:
+                self.__thread_unlock()
+        return self._version if span is None else self._versions[span]
+
+    # ===========================================================
+    # 指定したバージョン以降に足が確定したか
+    #   使い方:
+    #       if candle.changed_since(self._version):
+    #           self._version = candle.version()
+    #           ... 再計算 ...
+    # ===========================================================
+    def changed_since(self, version, span=None):
+        return self.version(span) > version
+
+    # ===========================================================
+    # 取引所の足が無い期間 [[start, end), ...]（ミリ秒）
+    #   バックグラウンドで取引所から取り直し、取り直せた期間は無くなる
     # ===========================================================
-    def candle(self, span):
+    def gaps(self):
         self.__thread_lock()
-        _candle = self._candle[span][:]  # コピー
-        self.__thread_unlock()
+        try:
+            self.__drain_trades()
+            return self._root.gaps()
+        finally:
+            self.__thread_unlock()
+
+    # ===========================================================
+    # 足の確定通知の登録
+    #   足が確定したら、ローソク足スレッドから callback(span, bar) を呼び出す
+    #   params:
+    #       callback: callback(span, bar)  bar = [timestamp(ミリ秒), open, high, low, close, volume]
+    #       spans: 通知するタイムフレームのリスト（未指定は全て）
+    # ===========================================================
+    def subscribe(self, callback, spans=None):
+        self._subscribers.append((set(spans) if spans is not None else None, callback))
 
-        return _candle
+    # ===========================================================
+    # 逐次計算インジケータの登録
+    #   確定足の履歴で初期化し、以降は足が確定する度に update() する（足1本あたりO(1)）
+    #   履歴を取り直した場合は、初期化し直す
+    #   使い方:
+    #       self._rsi = candle.attach("1h", RSI(14))
+    #       self._rsi.value                      # 最後の確定足での値
+    #       candle.preview("1h", self._rsi)      # 未確定足を含めた値
+    #   params:
+    #       span: タイムフレーム
+    #       indicator: indicators.streaming.Indicator
+    #   return:
+    #       indicator
+    # ===========================================================
+    def attach(self, span, indicator):
+        self.__thread_lock()
+        try:
+            self.__drain_trades()
+            indicator.reset()
+            key = indicator_key(indicator)
+            self._indicator_keys[id(indicator)] = key
+            bars = self._builders[span].closed()
+            # チェックポイントの状態があれば、保存後の確定足だけで更新する
+            bars = self.__restore_indicator(span, key, indicator, bars)
+            indicator.load(bars)
+            self._indicators.setdefault(span, []).append(indicator)
+        finally:
+            self.__thread_unlock()
+        return indicator
+
+    # ===========================================================
+    # 確定足のインジケータ（キャッシュする）
+    #   同じ足の間は、同じパラメータの2回目以降の参照は計算しない
+    #   戻り値の配列は共有するので、加工する場合は copy() してから使うこと
+    #   使い方:
+    #       rsi = candle.indicator("1h", "rsi", n=14)[-1]
+    #       upper, middle, lower = candle.indicator("1h", "bollinger", n=20, k=2.0)
+    #   params:
+    #       span: タイムフレーム
+    #       name: indicators.vectorized の関数名(sma, ema, rsi, atr, ...)
+    #       source: 1つの値から計算するインジケータに渡す列（未指定は close）
+    #       params: 関数のパラメータ
+    # ===========================================================
+    def indicator(self, span, name, source="close", **params):
+        snapshot = self.snapshot(span, closed_only=True)
+        key = dict(params, source=source)
+        return self._indicator_cache.get(
+            self._config["SYMBOL"],
+            span,
+            name,
+            key,
+            snapshot.timestamp,
+            lambda: evaluate(name, snapshot.df, source, **params),
+        )
+
+    # ===========================================================
+    # 添付したインジケータの参照
+    #   ローソク足スレッドの更新と排他して呼び出す
+    #   使い方:
+    #       value = candle.locked(lambda: indicator.value)
+    #   params:
+    #       func: 引数なしの関数
+    # ===========================================================
+    def locked(self, func):
+        self.__thread_lock()
+        try:
+            return func()
+        finally:
+            self.__thread_unlock()
+
+    # ===========================================================
+    # 未確定足を含めたインジケータの値（未確定足が無ければ確定足での値）
+    # ===========================================================
+    def preview(self, span, indicator):
+        live = self.live_bar(span)
+        return indicator.preview(live) if live is not None else indicator.value
 
     # ===========================================================
     # Lock取得
@@ -160,146 +428,665 @@ class Candle:
             return False
         return True
 
+    # ==========================================================
+    # 逐次集計オブジェクトの生成
+    #   各タイムフレームに、割り切れる最長の基準足を追加する（履歴の取得用）
+    #   親は自分より短い足のうち、期間を割り切れて足の起点が揃う最長の足
+    #   （1本あたりの集計数が最も少なく、中間の足は共有される）
+    # ==========================================================
+    def __create_builders(self):
+        maxlen = (
+            self._config["CANDLE"]["LIMIT"]
+            if self._config["CANDLE"]["LIMIT"] is not None
+            else 100
+        )
+
+        # -------------------------------------------------------
+        # タイムフレームの解析と基準足の追加
+        # -------------------------------------------------------
+        bases = dict([(b, parse_span(b)) for b in Candle.__BASE])
+        spans = {}
+        for span in self._config["MULTI_TIMEFRAME_CANDLE_SPAN_LIST"]:
+            try:
+                spans[span] = parse_span(span)
+            except ValueError as e:
+                self._logger.error("candle: {}".format(e))
+        for span, (period, offset) in list(spans.items()):
+            base = [
+                b
+                for b, (p, o) in bases.items()
+                if period % p == 0 and (offset - o) % p == 0
+            ]
+            if len(base) == 0:
+                self._logger.error("candle: span {} has no base candle".format(span))
+                del spans[span]
+            elif base[-1] not in spans:
+                spans[base[-1]] = bases[base[-1]]
+                self._config["MULTI_TIMEFRAME_CANDLE_SPAN_LIST"].insert(0, base[-1])
+
+        # -------------------------------------------------------
+        # 集計ツリーの作成（短い足から）
+        # -------------------------------------------------------
+        self._builders = {}
+        for span in sorted(spans.keys(), key=lambda span: spans[span][0]):
+            period, offset = spans[span]
+            builder = CandleBuilder(span, period, maxlen, offset)
+            parents = [b for b in self._builders.values() if b.can_aggregate(builder)]
+            if len(parents) != 0:
+                parents[-1].add_child(builder)
+            elif len(self._builders) != 0:
+                self._logger.error("candle: span {} has no base candle".format(span))
+                continue
+            self._builders[span] = builder
+
+        # ルート(最小の基準足)
+        self._root = list(self._builders.values())[0]
+
+        # -------------------------------------------------------
+        # ウォームアップで読み込む本数（CANDLE.WARMUP: {タイムフレーム: 本数}、未指定はLIMIT）
+        #   取引所から取得しない足の本数は、親に必要な本数として遡って加算する
+        # -------------------------------------------------------
+        warmup = self._config["CANDLE"].get("WARMUP") or {}
+        self._depth = dict(
+            [(span, max(maxlen, warmup.get(span, 0))) for span in self._builders]
+        )
+        for builder in reversed(list(self._builders.values())):
+            parent = builder._parent
+            if parent is None or builder.span in Candle.__BASE:
+                continue
+            ratio = builder.period // parent.period
+            self._depth[parent.span] = max(
+                self._depth[parent.span], (self._depth[builder.span] + 1) * ratio
+            )
+        for span, builder in self._builders.items():
+            builder.resize(self._depth[span])
+
     # ==========================================================
     # ローソク足取得(ccxt)
+    #   return:
+    #       closed: 確定足のリスト (Old->New)
+    #       partial: 未確定足（無ければNone）
     # ==========================================================
-    def __fetch_candle(self, resolution="1m"):
+    def __fetch_candle(self, resolution="1m", since=None, limit=None):
         # 引数チェック
-        if resolution not in ["1m", "5m", "1h", "1d"]:
-            return None
+        if resolution not in Candle.__BASE:
+            return [], None
 
         # -----------------------------------------------
-        # 1分ローソク足情報取得
+        # ローソク足情報取得
         # -----------------------------------------------
         candle = self._bitmex.ohlcv(
             symbol=self._config["SYMBOL"],  # シンボル
             timeframe=resolution,  # timeframe= 1m 5m 1h 1d
-            since=self._config["CANDLE"]["SINCE"],  # データ取得開始時刻(Unix Timeミリ秒)
-            limit=self._config["CANDLE"]["LIMIT"],  # 取得件数(未指定:100、MAX:500)
+            since=since,  # データ取得開始時刻(Unix Timeミリ秒)
+            limit=limit,  # 取得件数(未指定:100、MAX:500)
             params={
-                "reverse": self._config["CANDLE"][
-                    "REVERSE"
-                ],  # True(New->Old)、False(Old->New)　未指定時はFlase (注意：sineceを指定せずに、このフラグをTrueにすると最古のデータは2016年頃のデータが取れる)
-                "partial": self._config["CANDLE"][
-                    "PARTIAL"
-                ],  # True(最新の未確定足を含む)、False(含まない)　未指定はTrue　（注意：まだバグっているのか、Falseでも最新足が含まれる）
+                "reverse": False,  # Old->New
+                "partial": True,  # 未確定足はpartialとして分けて扱う
             },
         )
+
         # -----------------------------------------------
-        # Pandasのデータフレームに
+        # 確定足と未確定足に分ける
+        #   OHLCがNoneの足は飛ばす（後続の足は使う。抜けとして記録され、後で取り直す）
         # -----------------------------------------------
-        df = self._bitmex.to_candleDF(candle)
+        period, _ = parse_span(resolution)
+        now = int(time.time() * 1000)
+        current = now - now % period
 
+        closed, partial = [], None
+        for o in sorted(candle, key=lambda o: o[0]):
+            if None in o[:6]:
+                continue
+            if o[0] < current:
+                closed.append(o)
+            elif o[0] == current:
+                partial = o
+
+        return closed, partial
+
+    # ==========================================================
+    # 履歴の取得
+    #   ローカルキャッシュを使用する場合はキャッシュから読み、不足分だけを取引所から取得する。
+    #   使用しない場合は、1回最大500件ずつ遡って取得する
+    #   params:
+    #       span: 基準足
+    #       depth: 確定足の本数
+    #   return:
+    #       closed, partial
+    # ==========================================================
+    def __fetch_history(self, span, depth):
+        if (
+            self._config.get("OHLCV_CACHE_DIR") is not None
+            and self._config["CANDLE"]["SINCE"] is None
+        ):
+            return self.__fetch_candle(span, since=None, limit=depth + 1)
+
+        period, offset = parse_span(span)
+        now = int(time.time() * 1000)
+        current = now - now % period
+
+        # SINCE未指定の場合は、最新のdepth本(＋未確定足)を取得する
+        since = self._config["CANDLE"]["SINCE"]
+        if since is None:
+            since = current - depth * period
+
+        bars, partial = [], None
+        while since <= current:
+            closed, partial = self.__fetch_candle(
+                span,
+                since=since,
+                limit=min((current - since) // period + 1, Candle.__MAX_FETCH),
+            )
+            bars += closed
+            if len(closed) == 0 or partial is not None:
+                break
+            since = closed[-1][0] + period
+
+        return bars[-depth:], partial
+
+    # ==========================================================
+    # ローソク足の初回ロード（ギャップが大きい場合も再ロード）
+    #   基準足(1m, 5m, 1h, 1d)は取引所から並列に履歴を取得し、その他の足は親の確定足から作る
+    #   起動時にチェックポイントを読めた場合は、保存後の足だけを取得する
+    # ==========================================================
+    def __load_candle(self):
+        if self._restore:
+            self._restore = False
+            if self.__load_checkpoint():
+                return
+
+        start = time.time()
+        now = int(time.time() * 1000)
+
+        spans = [span for span in self._builders if span in Candle.__BASE]
+        with ThreadPoolExecutor(max_workers=len(spans)) as executor:
+            futures = dict(
+                [
+                    (span, executor.submit(self.__fetch_history, span, self._depth[span]))
+                    for span in spans
+                ]
+            )
+            fetched = dict([(span, f.result()) for span, f in futures.items()])
+
+        self.__thread_lock()
+        try:
+            for span, builder in self._builders.items():
+                builder.load(fetched[span][0] if span in fetched else [])
+                # 親の確定足から、履歴の続き(集計中の足を含む)を作る
+                if builder is not self._root:
+                    builder.sync()
+                if builder is self._root:
+                    self._root.update_partial(fetched[span][1])
+                elif span in fetched:
+                    # 親を持つ基準足の集計中の足は、取引所の未確定足から始める
+                    builder.load_partial(fetched[span][1])
+
+            self._trade_cutoff = now
+            self.__set_dirty()
+        finally:
+            self.__thread_unlock()
+
+        self._logger.info(
+            "multi timeframe candle warm-up: {:.2f}s ({})".format(
+                time.time() - start,
+                ", ".join(
+                    [
+                        "{}={}".format(span, len(builder.closed()))
+                        for span, builder in self._builders.items()
+                    ]
+                ),
+            )
+        )
+
+    # ==========================================================
+    # チェックポイントで照合する設定 [(タイムフレーム, 期間, 起点, 保持する本数), ...]
+    #   設定が変わっていたらチェックポイントは使わない
+    # ==========================================================
+    def __timeframes(self):
+        return [
+            (span, b.period, b.offset, self._depth[span])
+            for span, b in self._builders.items()
+        ]
+
+    # ==========================================================
+    # チェックポイントの読み込み
+    #   ローソク足の状態を戻し、保存後の足だけを取得して続きを集計する
+    #   return:
+    #       読み込んだか（無い、設定が異なる、保持している履歴より古い場合はFalse）
+    # ==========================================================
+    def __load_checkpoint(self):
+        start = time.time()
+        state = self._checkpoint.load()
+        if state is None:
+            return False
+        if state["timeframes"] != self.__timeframes():
+            self._logger.info("multi timeframe candle: checkpoint timeframes changed")
+            return False
+
+        root = self._root
+        last_ts = state["builders"][root.span]["bars"]["timestamp"][-1:]
+        now = int(time.time() * 1000)
+        if (
+            len(last_ts) == 0
+            or (root.bucket(now) - last_ts[0]) // root.period > self._depth[root.span]
+        ):
+            self._logger.info("multi timeframe candle: checkpoint is too old")
+            return False
+
+        self.__thread_lock()
+        try:
+            for span, builder in self._builders.items():
+                builder.restore(state["builders"][span])
+            self._saved_indicators = list(state["indicators"])
+            self.__set_dirty()
+        finally:
+            self.__thread_unlock()
+
+        # 保存後の足を取得して集計する
+        self.__update_candle()
+
+        self._logger.info(
+            "multi timeframe candle warm-up from checkpoint: {:.2f}s ({} bars)".format(
+                time.time() - start,
+                (root.last_timestamp() - last_ts[0]) // root.period,
+            )
+        )
+        return True
+
+    # ==========================================================
+    # チェックポイントの保存（足の確定後に呼び出す）
+    # ==========================================================
+    def __save_checkpoint(self):
+        if self._checkpoint is None:
+            return
+        self.__thread_lock()
+        try:
+            indicators = []
+            for span, items in self._indicators.items():
+                last_ts = self._builders[span].last_timestamp()
+                for indicator in items:
+                    key = self._indicator_keys.get(id(indicator))
+                    state = indicator_state(indicator) if key is not None else None
+                    if state is not None and last_ts is not None:
+                        indicators.append((key, span, last_ts, state))
+            state = {
+                "timeframes": self.__timeframes(),
+                "builders": dict(
+                    [(span, b.state()) for span, b in self._builders.items()]
+                ),
+                "indicators": indicators,
+            }
+        finally:
+            self.__thread_unlock()
+
+        size = self._checkpoint.save(state)
+        self._logger.debug("multi timeframe candle: checkpoint {} bytes".format(size))
+
+    # ==========================================================
+    # 逐次計算インジケータの状態をチェックポイントから戻す（ロック取得済みで呼び出すこと）
+    #   同じ識別子・タイムフレームの状態があり、その確定足を保持していれば状態を戻す
+    #   return:
+    #       状態を戻した場合は、それより新しい確定足。戻さなかった場合は bars
+    # ==========================================================
+    def __restore_indicator(self, span, key, indicator, bars):
+        if key is None:
+            return bars
+        for i, (k, s, last_ts, state) in enumerate(self._saved_indicators):
+            if k != key or s != span:
+                continue
+            del self._saved_indicators[i]
+            timestamps = [b[0] for b in bars]
+            j = bisect.bisect_left(timestamps, last_ts)
+            if j == len(timestamps) or timestamps[j] != last_ts:
+                return bars
+            restore_indicator(indicator, state)
+            return bars[j + 1 :]
+        return bars
+
+    # ==========================================================
+    # ローソク足の更新
+    #   ルートの最後の確定足以降だけを取得し、上位足は確定した下位足から逐次集計する
+    # ==========================================================
+    def __update_candle(self):
+        root = self._root
+        last_ts = root.last_timestamp()
+        now = int(time.time() * 1000)
+        current = root.bucket(now)
+
+        # 履歴が無い、もしくは保持している履歴より長いギャップは再ロード
+        if (
+            last_ts is None
+            or (current - last_ts) // root.period > self._depth[root.span]
+        ):
+            self._logger.warning("multi timeframe candle: reload")
+            self.__load_candle()
+            return
+
+        # 最後の確定足以降を、1回最大500件ずつ取得する
+        since = last_ts + root.period
+        bars, partial = [], None
+        while since <= current:
+            closed, partial = self.__fetch_candle(
+                root.span,
+                since=since,
+                limit=min((current - since) // root.period + 1, Candle.__MAX_FETCH),
+            )
+            bars += closed
+            if len(closed) == 0:
+                break
+            since = closed[-1][0] + root.period
+
+        self.__thread_lock()
+        try:
+            events = []
+            for bar in bars:
+                events += root.push(bar, root.period)
+            root.update_partial(partial)
+            self._trade_cutoff = now
+            self.__set_dirty(events)
+        finally:
+            self.__thread_unlock()
+
+    # ==========================================================
+    # 約定からのローソク足の更新（websocket使用時）
+    #   期間の切り替わりで未確定足を確定する。
+    #   websocketが止まっている(再接続を含む)場合は、RESTで確定足を取り直す
+    # ==========================================================
+    def __roll_candle(self):
+        if (
+            self._ws._ws_status in [2, 3]  # close, error
+            or time.time() - self._ws._ts > Candle.__WS_STALE_SEC
+        ):
+            self._resync = True
+        if self._resync:
+            self._logger.warning("multi timeframe candle: resync by REST")
+            self.__update_candle()
+            self._resync = False
+
+        self.__thread_lock()
+        try:
+            self.__drain_trades()
+            self.__set_dirty(self._root.roll(int(time.time() * 1000)))
+        finally:
+            self.__thread_unlock()
+
+    # ==========================================================
+    # websocket trade の受信
+    #   websocketのスレッドで受信時に集計する（参照時にロックして集計しなくて済むように）
+    #   初回ロードが終わるまでは溜めるだけにする
+    # ==========================================================
+    def __on_trade(self, action, data):
+        if action == "partial":
+            # 再接続。切断中の約定は受信できていない
+            self._resync = True
+        elif action == "insert":
+            self._trades.extend(data)
+            if self._trade_cutoff != 0:
+                self.__thread_lock()
+                try:
+                    self.__drain_trades()
+                finally:
+                    self.__thread_unlock()
+
+    # ==========================================================
+    # 溜まっている約定を集計する（ロック取得済みで呼び出すこと）
+    # ==========================================================
+    def __drain_trades(self):
+        closed = []
+        updated = False
+        while len(self._trades) != 0:
+            trade = self._trades.popleft()
+            ts = int(dateutil.parser.parse(trade["timestamp"]).timestamp() * 1000)
+            if ts <= self._trade_cutoff:
+                continue
+            closed += self._root.update_trade(ts, trade["price"], trade["size"])
+            updated = True
+        if updated:
+            self.__set_dirty(closed)
+
+    # ==========================================================
+    # 公開し直しが必要なタイムフレームを記録し、確定したタイムフレームのバージョンを上げる
+    # （ロック取得済みで呼び出すこと）
+    #   params:
+    #       closed: 確定した足のリスト（未指定は全タイムフレームを作り直した）
+    #   未確定足はルートの足の更新で全タイムフレームが変わるので、全て公開し直す
+    # ==========================================================
+    def __set_dirty(self, closed=None):
+        if closed is None:
+            spans = set(self._builders.keys())
+        else:
+            spans = set([builder.span for builder, _ in closed])
+        if len(spans) != 0:
+            self._version += 1
+            for span in spans:
+                self._versions[span] = self._version
+        if closed is not None and len(self._subscribers) != 0:
+            self._closed.extend(closed)
+
+        # 逐次計算インジケータの更新
+        if closed is None:
+            for span, indicators in self._indicators.items():
+                for indicator in indicators:
+                    indicator.reset()
+                    indicator.load(self._builders[span].closed())
+        else:
+            for builder, bar in closed:
+                for indicator in self._indicators.get(builder.span, []):
+                    indicator.update(bar)
+
+        self._dirty |= spans
+        self._live_dirty = set(self._builders.keys())
+
+    # ==========================================================
+    # 確定足の CandleSnapshot の公開（ロック取得済みで呼び出すこと）
+    # ==========================================================
+    def __publish(self, span):
+        builder = self._builders[span]
+        previous = self._snapshots[span]
+        self._snapshots[span] = CandleSnapshot(
+            span,
+            self._versions[span],
+            builder.last_timestamp(),
+            self.__to_candleDF(builder, builder.closed()),
+        )
+        self._dirty.discard(span)
+
+        # 以前の確定足で計算したインジケータを捨てる
+        # （足が確定せずに公開し直した場合は、履歴を取り直したので全て捨てる）
+        if previous is not None:
+            timestamp = builder.last_timestamp()
+            if previous.timestamp == timestamp:
+                timestamp = None
+            self._indicator_cache.invalidate(self._config["SYMBOL"], span, timestamp)
+
+    # ==========================================================
+    # DataFrameの作成（ロック取得済みで呼び出すこと）
+    #   gap列: 取引所の足が無い期間（約定が無く直前の終値で埋めた足、取得できなかった足）を
+    #          含む場合にTrue。バックグラウンドで取引所の足に置き換わるとFalseになる
+    # ==========================================================
+    def __to_candleDF(self, builder, bars):
+        df = self._bitmex.to_candleDF(bars)
+        ts = np.array([b[0] for b in bars], dtype=np.int64)
+        gap = np.zeros(len(bars), dtype=bool)
+        for start, end in self._root.gaps():
+            gap |= (ts < end) & (ts + builder.period > start)
+        df["gap"] = gap
         return df
 
     # ==========================================================
-    # get candle
+    # 未確定足を含む CandleSnapshot の公開（ロック取得済み、確定足の公開後に呼び出すこと）
+    #   確定足が変わらず、未確定足が同じ期間なら、公開済みの DataFrame をコピーして最後の行だけを
+    #   書き換える（公開済みの DataFrame は参照中のスレッドがあるので変更しない）
     # ==========================================================
-    def __get_candle(self):
-        # 1m, 3m, 5m, 10m, 15m, 30m, 1h, 2h, 3h, 4h, 6h, 12h, 1d
-        for resolution in self._config["MULTI_TIMEFRAME_CANDLE_SPAN_LIST"]:
-            if resolution in ["1m", "5m", "1h", "1d"]:
-                self._candle[resolution] = self.__fetch_candle(resolution)
-            elif resolution in ["3m"]:
-                self._candle[resolution] = self._bitmex.change_candleDF(
-                    self._candle["1m"], resolution
-                )
-            elif resolution in ["10m", "15m", "30m"]:
-                self._candle[resolution] = self._bitmex.change_candleDF(
-                    self._candle["5m"], resolution
-                )
-            elif resolution in ["2h", "3h", "4h", "6h", "12h"]:
-                self._candle[resolution] = self._bitmex.change_candleDF(
-                    self._candle["1h"], resolution
+    def __publish_live(self, span):
+        closed = self._snapshots[span]
+        snapshot = self._live_snapshots[span]
+        live = self._builders[span].live_bar()
+        live_ts = live[0] if live is not None else None
+
+        if (
+            snapshot is not None
+            and snapshot.version == closed.version
+            and snapshot.timestamp == closed.timestamp
+            and live_ts is not None
+            and live_ts == self._live_ts[span]
+        ):
+            df = snapshot.df.copy()
+            df.iloc[-1, :5] = [float(v) for v in live[1:6]]
+            self._live_snapshots[span] = CandleSnapshot(
+                span, closed.version, closed.timestamp, df
+            )
+        else:
+            df = closed.df
+            if live is not None:
+                df = pd.concat([df, self.__to_candleDF(self._builders[span], [live])])
+                ohlcv = ["open", "high", "low", "close", "volume"]
+                df = df.astype(dict([(c, "float64") for c in ohlcv]))
+            self._live_snapshots[span] = CandleSnapshot(
+                span, closed.version, closed.timestamp, df
+            )
+            self._live_ts[span] = live_ts
+        self._live_dirty.discard(span)
+
+    # ==========================================================
+    # 確定足の通知
+    # ==========================================================
+    def __dispatch(self):
+        while len(self._closed) != 0:
+            builder, bar = self._closed.popleft()
+            for spans, callback in self._subscribers:
+                if spans is not None and builder.span not in spans:
+                    continue
+                try:
+                    callback(builder.span, list(bar))
+                except Exception as e:
+                    self._logger.error(
+                        "multi timeframe candle: on_bar {} Exception {}".format(
+                            builder.span, e
+                        )
+                    )
+
+    # ==========================================================
+    # ギャップの取り直し
+    #   ルートの足が無い期間だけを取引所から取得して置き換え、上位足を集計し直す。
+    #   取得できなかった期間はギャップのまま残し、次の周期で取り直す
+    #   （取得できた場合、取引所にも無い足はそのままにしてギャップを消す）
+    # ==========================================================
+    def __backfill(self):
+        root = self._root
+        now = int(time.time() * 1000)
+        self.__thread_lock()
+        try:
+            gaps = root.gaps()
+        finally:
+            self.__thread_unlock()
+
+        for start, end in gaps:
+            end = min(end, root.bucket(now))
+            limit = min((end - start) // root.period, Candle.__MAX_FETCH)
+            if limit <= 0:
+                continue
+            closed, _ = self.__fetch_candle(root.span, since=start, limit=limit)
+            if len(closed) == 0:
+                continue
+            end = start + limit * root.period
+
+            self.__thread_lock()
+            try:
+                root.fill(closed, start, end)
+                self.__set_dirty()
+            finally:
+                self.__thread_unlock()
+
+            self._logger.info(
+                "multi timeframe candle: backfill {} bars ({} - {})".format(
+                    len(closed),
+                    dt.fromtimestamp(start / 1000, self._tz),
+                    dt.fromtimestamp(end / 1000, self._tz),
                 )
-            time.sleep(0.1)
-            # for DEBUG
-            # print(self._candle[resolution].tail(3))
+            )
+
+    # ==========================================================
+    # 指定した時刻(UNIX時間、秒)までスリープする
+    #   経過時間は単調増加の時計(monotonic)で計る
+    # ==========================================================
+    def __sleep_until(self, wakeup):
+        deadline = time.monotonic() + (wakeup - time.time())
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(remaining, 60))
 
     # ==========================================================
-    # get_wait_time
-    #   待ち時間を計算する
+    # 期間の区切りでルートの足を確定する
     #   params:
-    #       timeframe: 1分、5分、1時間、1日
-    #       diff:      あまりに使う時間（5秒前には処理に入ることにする）
-    # ==========================================================
-    def get_wait_time(self, timeframe=60, diff=5):
-        now_dt = dt.now(self._tz)
-        now_sec = now_dt.second
-        now_min = now_dt.minute
-        now_hour = now_dt.hour
-
-        # for DEBUG
-        # print('{}:{}:{}'.format(now_hour, now_min, now_sec))
-
-        if timeframe == 1 * 60:
-            # 1分
-            if now_sec >= (timeframe - diff):
-                return 0
-            else:
-                return timeframe - diff - now_sec
-        elif timeframe == 5 * 60:
-            # 5分
-            if now_sec >= ((5 - now_min % 5) * 60 - diff):
-                return 0
-            else:
-                return (5 - now_min % 5) * 60 - diff - now_sec
-        elif timeframe == 1 * 60 * 60:
-            # 1時間
-            if now_sec >= ((60 - now_min) * 60 - diff):
-                return 0
-            else:
-                return (60 - now_min) * 60 - diff - now_sec
-        elif timeframe == 24 * 60 * 60:
-            # 1日
-            if now_sec >= ((24 - now_hour) * 60 * 60 - now_min * 60 - diff):
-                return 0
-            else:
-                return (24 - now_hour) * 60 * 60 - now_min * 60 - diff - now_sec
+    #       boundary: 期間の区切り(ミリ秒)
+    # ==========================================================
+    def __close_candle(self, boundary):
+        if self._ws is not None:
+            self.__roll_candle()
+            return
+        for i in range(Candle.__CLOSE_RETRY_REST):
+            self.__update_candle()
+            last_ts = self._root.last_timestamp()
+            if last_ts is not None and last_ts >= boundary - self._root.period:
+                break
+            time.sleep(1)
 
     # ==========================================================
     # run
+    #   ルートの期間の区切り毎に足を確定し、確定した足を通知する
     # ==========================================================
     def __run(self, args):
 
-        # -------------------------------------------------------
-        # 毎時毎分0秒の5秒前までスリープしていることにする
-        # -------------------------------------------------------
-        sec = self.get_wait_time(self.__max_loop_time, Candle.__DIFF_TIME)
-        if sec > 0:
-            time.sleep(sec)
-
         # -------------------------------------------------------
         # 処理ループ（exit用のフラグを儲けるか？）
         # -------------------------------------------------------
         while True:
 
             # ---------------------------------------------------
-            # 時刻が0秒をすぎたら実行する
+            # 次の期間の区切りまでスリープする
             # ---------------------------------------------------
-            while dt.now(self._tz).second not in [0, 1, 2]:
-                time.sleep(1)
+            now = int(time.time() * 1000)
+            boundary = self._root.bucket(now) + self._root.period
+            delay = (
+                Candle.__CLOSE_DELAY_WS
+                if self._ws is not None
+                else Candle.__CLOSE_DELAY_REST
+            )
+            self.__sleep_until(boundary / 1000 + delay)
 
             # 開始
             start = time.time()
 
-            # Lock
-            self.__thread_lock()
-
             try:
-                # ローソク足取得
-                self.__get_candle()
+                # ローソク足更新
+                self.__close_candle(boundary)
             except Exception as e:
                 self._logger.error(
                     "multi timeframe candle thread Exception {}".format(e)
                 )
             finally:
-                pass
+                # 確定足の通知
+                self.__dispatch()
 
-            # unLock
-            self.__thread_unlock()
+            try:
+                # ギャップの取り直し
+                self.__backfill()
+            except Exception as e:
+                self._logger.warning(
+                    "multi timeframe candle: backfill Exception {}".format(e)
+                )
 
-            time.sleep(3)
+            try:
+                # チェックポイントの保存
+                self.__save_checkpoint()
+            except Exception as e:
+                self._logger.warning(
+                    "multi timeframe candle: checkpoint Exception {}".format(e)
+                )
 
             # 終了
             end = time.time()
@@ -313,8 +1100,3 @@ class Candle:
                 self._logger.warning(
                     "multi timeframe candle thread: use time {}".format(elapsed_time)
                 )
-            else:
-                # 毎時毎分0秒の5秒前までスリープしていることにする
-                sec = self.get_wait_time(self.__max_loop_time, Candle.__DIFF_TIME)
-                if sec > 0:
-                    time.sleep(sec)
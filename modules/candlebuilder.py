@@ -0,0 +1,498 @@
+# -*- coding: utf-8 -*-
+# ==========================================
+# CandleBuilder
+# ==========================================
+import re
+import bisect
+
+# タイムフレームの単位(ミリ秒)
+UNITS = {
+    "m": 60 * 1000,
+    "h": 60 * 60 * 1000,
+    "d": 24 * 60 * 60 * 1000,
+    "w": 7 * 24 * 60 * 60 * 1000,
+}
+
+# 週足の起点。UNIX時間0(1970-01-01)は木曜日なので、月曜日(1970-01-05)に合わせる
+WEEK_OFFSET = 4 * UNITS["d"]
+
+
+# ==============================================================
+# タイムフレーム名の解析
+#   param:
+#       span: タイムフレーム名（数字 + m, h, d, w 例: 7m, 45m, 8h, 1w, 2w）
+#   return:
+#       (period, offset): 1本の期間(ミリ秒), 足の起点(ミリ秒)
+#   raise:
+#       ValueError: 解析できない場合
+# ==============================================================
+def parse_span(span):
+    m = re.match(r"^([1-9][0-9]*)([mhdw])$", str(span))
+    if m is None:
+        raise ValueError("invalid timeframe: {}".format(span))
+    period = int(m.group(1)) * UNITS[m.group(2)]
+    offset = WEEK_OFFSET if m.group(2) == "w" else 0
+    return period, offset
+
+
+# ==============================================================
+# BarStore クラス
+#   上限付きの列指向ローソク足格納領域
+#   param:
+#       maxlen: 保持する最大本数
+#       columns: 列名（先頭はtimestamp）
+# ==============================================================
+class BarStore:
+
+    COLUMNS = ["timestamp", "open", "high", "low", "close", "volume"]
+
+    # ==========================================================
+    # 初期化
+    # ==========================================================
+    def __init__(self, maxlen, columns=COLUMNS):
+        self._maxlen = maxlen
+        self._columns = list(columns)
+        self.clear()
+
+    # ==========================================================
+    # 全削除
+    # ==========================================================
+    def clear(self):
+        self._data = dict([(c, []) for c in self._columns])
+
+    # ==========================================================
+    # 保持する最大本数の変更
+    # ==========================================================
+    def resize(self, maxlen):
+        self._maxlen = maxlen
+        for c in self._columns:
+            self._data[c] = self._data[c][-self._maxlen :]
+
+    # ==========================================================
+    # 1本追加（列の順番の配列）
+    #   保持数が上限の1.5倍を超えたら上限まで切り詰める（追加はならしてO(1)）
+    # ==========================================================
+    def append(self, bar):
+        for c, v in zip(self._columns, bar):
+            self._data[c].append(v)
+        if len(self) > self._maxlen * 1.5:
+            for c in self._columns:
+                self._data[c] = self._data[c][-self._maxlen :]
+
+    # ==========================================================
+    # timestamp が ts 以降の足を削除する
+    # ==========================================================
+    def truncate(self, ts):
+        i = bisect.bisect_left(self._data[self._columns[0]], ts)
+        for c in self._columns:
+            self._data[c] = self._data[c][:i]
+
+    # ==========================================================
+    # 入れ替え
+    # ==========================================================
+    def replace(self, bars):
+        self.clear()
+        for bar in bars[-self._maxlen :]:
+            self.append(bar)
+
+    # ==========================================================
+    # 最後の1本（無ければNone）
+    # ==========================================================
+    def last(self):
+        if len(self) == 0:
+            return None
+        return [self._data[c][-1] for c in self._columns]
+
+    # ==========================================================
+    # 最後の1本のtimestamp（無ければNone）
+    # ==========================================================
+    def last_timestamp(self):
+        return self._data[self._columns[0]][-1] if len(self) != 0 else None
+
+    # ==========================================================
+    # 列データ
+    # ==========================================================
+    def column(self, name):
+        return self._data[name][-self._maxlen :]
+
+    # ==========================================================
+    # 行データ [[timestamp, open, high, low, close, volume], ...]
+    # ==========================================================
+    def to_list(self):
+        return [list(row) for row in zip(*[self.column(c) for c in self._columns])]
+
+    # ==========================================================
+    # 状態（チェックポイント用） {列名: [値, ...]}
+    # ==========================================================
+    def state(self):
+        return dict([(c, list(self.column(c))) for c in self._columns])
+
+    # ==========================================================
+    # 状態の復元（保持する最大本数を超えた分は捨てる）
+    # ==========================================================
+    def restore(self, state):
+        self._data = dict([(c, list(state[c][-self._maxlen :])) for c in self._columns])
+
+    def __len__(self):
+        return len(self._data[self._columns[0]])
+
+
+# ==============================================================
+# CandleBuilder クラス
+#   1つのタイムフレームのローソク足を、下位足の確定足から逐次集計する。
+#   確定足は BarStore に、集計中の足は _live に持つ。
+#   確定した足は子(上位足)の CandleBuilder に渡すので、新しい下位足1本あたりO(1)で更新できる。
+#
+#   足は ccxt の ohlcv と同じ形式 [timestamp(ミリ秒), open, high, low, close, volume]
+#   param:
+#       span: タイムフレーム名(1m, 5m, ...)
+#       period: 1本の期間(ミリ秒)
+#       maxlen: 保持する最大本数
+#       offset: 足の起点(ミリ秒、週足は月曜日)
+# ==============================================================
+class CandleBuilder:
+
+    # ==========================================================
+    # 初期化
+    # ==========================================================
+    def __init__(self, span, period, maxlen, offset=0):
+        self.span = span
+        self.period = period
+        self.offset = offset
+        self._store = BarStore(maxlen)
+        self._live = None  # 集計中の足（下位足の確定足のみから集計）
+        self._partial = None  # 下位足の未確定足（ルートのみ使用）
+        self._seed = None  # 取引所の未確定足（親を持つ基準足のみ、load_partial参照）
+        self._cutoff = None  # 取引所の未確定足に含まれる親の足の終わり(ミリ秒)
+        self._parent = None
+        self._children = []
+        self._gaps = []  # 実データの無い期間 [[start, end), ...]（ルートのみ、ミリ秒）
+
+    # ==========================================================
+    # 子(上位足)の追加
+    # ==========================================================
+    def add_child(self, builder):
+        builder._parent = self
+        self._children.append(builder)
+
+    # ==========================================================
+    # 子(上位足)として集計できるか
+    #   期間が割り切れて、足の起点が揃っていること
+    # ==========================================================
+    def can_aggregate(self, builder):
+        return (
+            builder.period > self.period
+            and builder.period % self.period == 0
+            and (builder.offset - self.offset) % self.period == 0
+        )
+
+    # ==========================================================
+    # 保持する最大本数の変更
+    # ==========================================================
+    def resize(self, maxlen):
+        self._store.resize(maxlen)
+
+    # ==========================================================
+    # 足の開始時刻
+    # ==========================================================
+    def bucket(self, ts):
+        return ts - (ts - self.offset) % self.period
+
+    # ==========================================================
+    # 確定足の履歴をロード
+    # ==========================================================
+    def load(self, bars):
+        self._store.replace([list(b) for b in bars])
+        self._live = None
+        self._seed, self._cutoff = None, None
+
+        # 取引所の履歴の抜けを記録する（ルートのみ）
+        if self._parent is None:
+            self._gaps = []
+            timestamps = self._store.column("timestamp")
+            for prev, ts in zip(timestamps[:-1], timestamps[1:]):
+                if ts > prev + self.period:
+                    self.__add_gap(prev + self.period, ts)
+
+    # ==========================================================
+    # 下位足の確定足を集計
+    #   params:
+    #       bar: 下位足の確定足
+    #       period: 下位足の期間(ミリ秒)
+    #   return:
+    #       確定した足のリスト [(CandleBuilder, bar), ...]（子で確定したものを含む）
+    # ==========================================================
+    def push(self, bar, period):
+        closed = []
+        ts = self.bucket(bar[0])
+
+        # 足の抜けを記録する（ルートのみ）
+        if self._parent is None:
+            last_ts = self._store.last_timestamp()
+            if last_ts is not None and ts > last_ts + self.period:
+                self.__add_gap(last_ts + self.period, ts)
+
+        # 集計中の足と別の期間になったら、集計中の足を確定する
+        if self._live is not None and self._live[0] != ts:
+            closed += self.__close()
+
+        # 取引所の未確定足に含まれている親の足は集計しない
+        seeded = self._seed is not None and self._seed[0] == ts
+        merge = not (seeded and bar[0] < self._cutoff)
+
+        if self._live is None:
+            last_ts = self._store.last_timestamp()
+            if last_ts is not None and ts <= last_ts:
+                # 確定済みの期間（重複データ）は無視する
+                return closed
+            if seeded:
+                self._live = list(self._seed)
+            else:
+                self._live = [ts] + list(bar[1:6])
+                merge = False
+        if merge:
+            self._live[2] = max(self._live[2], bar[2])
+            self._live[3] = min(self._live[3], bar[3])
+            self._live[4] = bar[4]
+            self._live[5] += bar[5]
+
+        # 下位足が期間の最後の足なら確定する
+        if bar[0] + period >= ts + self.period:
+            closed += self.__close()
+
+        return closed
+
+    # ==========================================================
+    # 親の確定足のうち、自分の最後の確定足より新しいものを集計する
+    #   履歴が無い場合は親の全確定足から作る（期間の途中から始まる足は捨てる）
+    #   子への伝搬はしないので、親から順番に呼び出すこと
+    # ==========================================================
+    def sync(self):
+        children, self._children = self._children, []
+        try:
+            last_ts = self._store.last_timestamp()
+            started = last_ts is not None or self._live is not None
+            for bar in self._parent.closed():
+                if not started and bar[0] != self.bucket(bar[0]):
+                    continue
+                if last_ts is not None and bar[0] < last_ts + self.period:
+                    continue
+                started = True
+                self.push(bar, self._parent.period)
+        finally:
+            self._children = children
+
+    # ==========================================================
+    # 確定足
+    # ==========================================================
+    def closed(self):
+        return self._store.to_list()
+
+    # ==========================================================
+    # 実データの無い期間 [[start, end), ...]（ルートのみ、ミリ秒）
+    #   保持している確定足より古い期間は捨てる
+    # ==========================================================
+    def gaps(self):
+        if len(self._store) != 0:
+            first = self._store.column("timestamp")[0]
+            self._gaps = [g for g in self._gaps if g[1] > first]
+        return [list(g) for g in self._gaps]
+
+    # ==========================================================
+    # 取引所から取り直した足で、期間 [start, end) を置き換える（ルートのみ）
+    #   期間のギャップを消し、子(上位足)は start の期間から集計し直す
+    #   params:
+    #       bars: 取引所の確定足
+    #       start, end: 取り直した期間(ミリ秒)
+    # ==========================================================
+    def fill(self, bars, start, end):
+        merged = dict([(b[0], b) for b in self._store.to_list()])
+        for bar in bars:
+            if start <= bar[0] < end:
+                merged[bar[0]] = list(bar[:6])
+        self._store.replace([merged[ts] for ts in sorted(merged)])
+
+        gaps = []
+        for s, e in self._gaps:
+            if s < start:
+                gaps.append([s, min(e, start)])
+            if e > end:
+                gaps.append([max(s, end), e])
+        self._gaps = gaps
+
+        for child in self._children:
+            child.rebuild(start)
+
+    # ==========================================================
+    # 時刻tsの期間以降を親の確定足から集計し直す（子も集計し直す）
+    # ==========================================================
+    def rebuild(self, ts):
+        self._store.truncate(self.bucket(ts))
+        self._live = None
+        self.sync()
+        for child in self._children:
+            child.rebuild(ts)
+
+    # ==========================================================
+    # 状態（チェックポイント用、子は含まない）
+    # ==========================================================
+    def state(self):
+        return {
+            "bars": self._store.state(),
+            "live": list(self._live) if self._live is not None else None,
+            "partial": list(self._partial) if self._partial is not None else None,
+            "gaps": [list(g) for g in self._gaps],
+            "seed": list(self._seed) if self._seed is not None else None,
+            "cutoff": self._cutoff,
+        }
+
+    # ==========================================================
+    # 状態の復元
+    # ==========================================================
+    def restore(self, state):
+        self._store.restore(state["bars"])
+        self._live = list(state["live"]) if state["live"] is not None else None
+        self._partial = list(state["partial"]) if state["partial"] is not None else None
+        self._gaps = [list(g) for g in state["gaps"]]
+        self._seed = list(state["seed"]) if state.get("seed") is not None else None
+        self._cutoff = state.get("cutoff")
+
+    # ==========================================================
+    # 最後の確定足のtimestamp
+    # ==========================================================
+    def last_timestamp(self):
+        return self._store.last_timestamp()
+
+    # ==========================================================
+    # 最後の確定足（無ければNone）
+    # ==========================================================
+    def last_closed(self):
+        return self._store.last()
+
+    # ==========================================================
+    # 未確定足（下位足の未確定分を含む、無ければNone）
+    # ==========================================================
+    def live_bar(self):
+        lower = self._parent.live_bar() if self._parent is not None else self._partial
+        live = list(self._live) if self._live is not None else None
+        if lower is None:
+            return live
+
+        ts = self.bucket(lower[0])
+        if live is None:
+            last_ts = self._store.last_timestamp()
+            if last_ts is not None and ts <= last_ts:
+                return None
+            return [ts] + list(lower[1:6])
+        if live[0] == ts:
+            live[2] = max(live[2], lower[2])
+            live[3] = min(live[3], lower[3])
+            live[4] = lower[4]
+            live[5] += lower[5]
+        return live
+
+    # ==========================================================
+    # 未確定足の更新（ルートのみ）
+    # ==========================================================
+    def update_partial(self, bar):
+        self._partial = list(bar) if bar is not None else None
+
+    # ==========================================================
+    # 取引所の未確定足で集計中の足を置き換える（親を持つ基準足）
+    #   親は保持する本数分の確定足しか無いため、親から作ると期間の途中からの足になる。
+    #   親の最後の確定足までは取引所の未確定足に含まれているので集計しない。
+    #   親の集計中の足の分は、親の足が確定した時に加算されるので出来高から差し引いておく
+    #   （親を同期した後に呼び出すこと）
+    #   params:
+    #       bar: 取引所の未確定足（Noneは何もしない）
+    # ==========================================================
+    def load_partial(self, bar):
+        if bar is None or self._parent is None:
+            return
+        ts = self.bucket(bar[0])
+        last_ts = self._store.last_timestamp()
+        if last_ts is not None and ts <= last_ts:
+            return
+
+        parent_ts = self._parent.last_timestamp()
+        cutoff = parent_ts + self._parent.period if parent_ts is not None else ts
+        seed = [ts] + list(bar[1:6])
+        lower = self._parent.live_bar()
+        if lower is not None and lower[0] >= cutoff and self.bucket(lower[0]) == ts:
+            seed[5] = max(0, seed[5] - lower[5])
+
+        self._seed, self._cutoff = seed, cutoff
+        self._live = list(seed)
+
+    # ==========================================================
+    # 約定で未確定足を更新（ルートのみ）
+    #   params:
+    #       ts: 約定時刻(ミリ秒)
+    #       price: 約定価格
+    #       size: 約定数量
+    #   return:
+    #       確定した足のリスト [(CandleBuilder, bar), ...]
+    # ==========================================================
+    def update_trade(self, ts, price, size):
+        closed = self.roll(ts)
+
+        bucket = self.bucket(ts)
+        last_ts = self._store.last_timestamp()
+        if last_ts is not None and bucket <= last_ts:
+            # 確定済みの期間（遅れて届いた約定）は無視する
+            return closed
+
+        bar = self._partial
+        if bar is None:
+            self._partial = [bucket, price, price, price, price, size]
+        else:
+            bar[2] = max(bar[2], price)
+            bar[3] = min(bar[3], price)
+            bar[4] = price
+            bar[5] += size
+        return closed
+
+    # ==========================================================
+    # 時刻tsの期間より前の未確定足を確定する（ルートのみ）
+    #   約定の無かった期間は、直前の終値・出来高0の足で埋める
+    #   return:
+    #       確定した足のリスト [(CandleBuilder, bar), ...]
+    # ==========================================================
+    def roll(self, ts):
+        closed = []
+        bucket = self.bucket(ts)
+
+        if self._partial is not None and self._partial[0] < bucket:
+            bar, self._partial = self._partial, None
+            closed += self.push(bar, self.period)
+
+        last = self._store.last()
+        if last is None or self._partial is not None:
+            return closed
+        # 約定の無い期間はギャップとして記録し、取引所の足で置き換える
+        if last[0] + self.period < bucket:
+            self.__add_gap(last[0] + self.period, bucket)
+        while last[0] + self.period < bucket:
+            last = [last[0] + self.period] + [last[4]] * 4 + [0]
+            closed += self.push(last, self.period)
+        return closed
+
+    # ==========================================================
+    # ギャップの追加（直前のギャップと繋がっていればまとめる）
+    # ==========================================================
+    def __add_gap(self, start, end):
+        if len(self._gaps) != 0 and self._gaps[-1][1] >= start:
+            self._gaps[-1][1] = max(self._gaps[-1][1], end)
+        else:
+            self._gaps.append([start, end])
+
+    # ==========================================================
+    # 集計中の足を確定して子に渡す
+    # ==========================================================
+    def __close(self):
+        bar, self._live = self._live, None
+        self._store.append(bar)
+        closed = [(self, bar)]
+        for child in self._children:
+            closed += child.push(bar, self.period)
+        return closed
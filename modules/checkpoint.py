@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# ==========================================
+# Checkpoint
+# ==========================================
+import os
+import re
+import pickle
+import zlib
+
+# for logging
+import logging
+
+
+# ==============================================================
+# Checkpoint クラス
+#   マルチタイムフレーム ローソク足と逐次計算インジケータの状態を、ローカルファイルに保存する。
+#   起動時に読み込み、保存後の足だけを取得して続きから計算する（履歴を取り直さない）
+#
+#   ファイル: <path>/candle_<symbol>.ckpt（pickleをzlibで圧縮。一時ファイルに書いてから置き換える）
+#   param:
+#       path: チェックポイントを格納するディレクトリ
+#       symbol: シンボル
+# ==============================================================
+class Checkpoint:
+
+    # 形式のバージョン（変えたら古いファイルは読まない）
+    VERSION = 1
+
+    # ==================================
+    # 初期化
+    # ==================================
+    def __init__(self, path, symbol, logger=None):
+        self._path = path
+        os.makedirs(self._path, exist_ok=True)
+        name = re.sub(r"[^0-9A-Za-z]", "", symbol)  # BTC/USD -> BTCUSD
+        self._file = os.path.join(self._path, "candle_{}.ckpt".format(name))
+
+        self._logger = logger if logger is not None else logging.getLogger(__name__)
+
+    # ==================================
+    # 保存
+    #   param:
+    #       state: 保存する状態（pickleできる値）
+    #   return:
+    #       ファイルサイズ(バイト)
+    # ==================================
+    def save(self, state):
+        data = zlib.compress(
+            pickle.dumps(
+                {"version": Checkpoint.VERSION, "state": state},
+                protocol=pickle.HIGHEST_PROTOCOL,
+            ),
+            1,
+        )
+        with open(self._file + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(self._file + ".tmp", self._file)
+        return len(data)
+
+    # ==================================
+    # 読み込み
+    #   return:
+    #       保存した状態（無い、読めない、形式が異なる場合はNone）
+    # ==================================
+    def load(self):
+        if not os.path.exists(self._file):
+            return None
+        try:
+            with open(self._file, "rb") as f:
+                data = pickle.loads(zlib.decompress(f.read()))
+        except Exception as e:
+            self._logger.warning("checkpoint: load failed {}".format(e))
+            return None
+        if data.get("version") != Checkpoint.VERSION:
+            return None
+        return data["state"]
+
+
+# ==============================================================
+# 逐次計算インジケータの識別子
+#   クラス名と、初期状態(reset直後の属性)で識別する。パラメータが異なれば識別子も異なる
+#   （reset直後に呼び出すこと）
+#   return:
+#       識別子（pickleできない属性を持つ場合はNone）
+# ==============================================================
+def indicator_key(indicator):
+    cls = type(indicator)
+    try:
+        blank = pickle.dumps(indicator.__dict__, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        return None
+    return "{}.{}".format(cls.__module__, cls.__qualname__), blank
+
+
+# ==============================================================
+# 逐次計算インジケータの状態（pickleできなければNone）
+# ==============================================================
+def indicator_state(indicator):
+    try:
+        return pickle.dumps(indicator.__dict__, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        return None
+
+
+# ==============================================================
+# 逐次計算インジケータの状態を戻す
+# ==============================================================
+def restore_indicator(indicator, state):
+    indicator.__dict__.update(pickle.loads(state))
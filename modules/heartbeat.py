@@ -18,6 +18,9 @@ import threading
 # ==============================================================
 class Heartbeat:
 
+    # REST API 計測結果をINFOで出力する間隔(秒)（それ以外はDEBUG）
+    STATS_INTERVAL = 60 * 60
+
     # ==========================================================
     # 初期化
     #   param:
@@ -41,6 +44,7 @@ class Heartbeat:
         # -------------------------------------------------------
         self._tz = timezone.utc
         self._ts = datetime.now(self._tz).timestamp()
+        self._stats_ts = time.time()  # 最後にREST API 計測結果をINFOで出力した時刻
 
         # -------------------------------------------------------
         # 資産状況通知スレッド
@@ -106,6 +110,15 @@ class Heartbeat:
             except Exception as e:
                 self._logger.error("check heart beat thread: Exception: {}".format(e))
 
+            # ---------------------------------------------------
+            # REST API 計測結果（STATS_INTERVAL 毎にINFO、それ以外はDEBUG）
+            # ---------------------------------------------------
+            if time.time() - self._stats_ts >= Heartbeat.STATS_INTERVAL:
+                self._stats_ts = time.time()
+                self._logger.info("api stats: {}".format(self._bitmex.stats_summary()))
+            else:
+                self._logger.debug("api stats: {}".format(self._bitmex.stats_summary()))
+
             time.sleep(5)
 
             # 終了
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+# ==========================================
+# OrderManager
+# ==========================================
+import time
+import copy
+from collections import OrderedDict
+
+# thred操作
+import threading
+
+# from puppeteer import Puppeteer
+
+
+# ==============================================================
+# OrderManager クラス
+#   RESTの注文結果(limit_order等)と websocket の order / execution を
+#   orderID, clOrdID で突き合わせて、ローカルの注文状態を一つに保つ。
+#   websocketが止まっている場合だけ REST(open_orders) で同期し直す。
+#   param:
+#       puppeteer: Puppeteerオブジェクト
+# ==============================================================
+class OrderManager:
+
+    __STALE_SEC = 10  # websocketの受信がこの秒数止まっていたらRESTで同期する
+    __MAX_CLOSED_ORDERS = 1000  # 約定・キャンセル済み注文の保持数
+
+    # ==========================================================
+    # 初期化
+    #   param:
+    #       puppeteer: Puppeteerオブジェクト
+    # ==========================================================
+    def __init__(self, Puppeteer):
+        self._exchange = Puppeteer._exchange  # 取引所オブジェクト(ccxt.bitmex)
+        self._logger = Puppeteer._logger  # logger
+        self._config = Puppeteer._config  # 定義ファイル
+        self._ws = Puppeteer._ws  # websocket
+        self._bitmex = Puppeteer._bitmex  # ccxt.bimexラッパーオブジェクト
+        self._discord = Puppeteer._discord  # discord
+
+        # -------------------------------------------------------
+        # Threadのロック用オブジェクト
+        # -------------------------------------------------------
+        self._lock = threading.Lock()
+
+        # -------------------------------------------------------
+        # 注文状態
+        #   _orders:    orderID -> 注文(BitMEX形式)
+        #   _clOrdIDs:  clOrdID -> orderID
+        #   _fills:     orderID -> 約定リスト
+        # -------------------------------------------------------
+        self._orders = OrderedDict()
+        self._clOrdIDs = {}
+        self._fills = {}
+        self._exec_ids = set()
+        self._synced = False  # partial or RESTで全体を同期済みか
+
+        # -------------------------------------------------------
+        # 通知先の登録
+        # -------------------------------------------------------
+        self._bitmex.add_order_listener(self.__on_rest)
+        if self._ws is not None:
+            self._ws.add_listener("order", self.__on_ws_order)
+            self._ws.add_listener("execution", self.__on_ws_execution)
+
+        self._logger.debug("OrderManager initialized")
+
+    # ==========================================================
+    # オープンオーダ（BitMEX形式）
+    #   websocketが止まっている場合はRESTで同期し直してから戻す
+    #   params:
+    #       clOrdID: 指定した文字列を含む注文のみ（find_ordersと同じ条件）
+    # ==========================================================
+    def open_orders(self, clOrdID=None):
+        if self.is_stale():
+            self.sync()
+        with self._lock:
+            orders = [
+                copy.copy(o) for o in self._orders.values() if self.__is_open(o)
+            ]
+        if clOrdID is not None:
+            orders = [o for o in orders if 0 < str(o.get("clOrdID")).find(clOrdID)]
+        return orders
+
+    # ==========================================================
+    # 注文を検索
+    #   params:
+    #       orderID or clOrdID
+    # ==========================================================
+    def order(self, orderID=None, clOrdID=None):
+        with self._lock:
+            if orderID is None:
+                orderID = self._clOrdIDs.get(clOrdID)
+            o = self._orders.get(orderID)
+            return copy.copy(o) if o is not None else None
+
+    # ==========================================================
+    # 約定リスト
+    #   return:
+    #       [{'execID', 'price', 'qty', 'side', 'timestamp'}, ...]
+    # ==========================================================
+    def fills(self, orderID):
+        with self._lock:
+            return list(self._fills.get(orderID, []))
+
+    # ==========================================================
+    # websocketの情報が古いか（RESTで同期が必要か）
+    # ==========================================================
+    def is_stale(self):
+        if self._ws is None or not self._synced:
+            return True
+        if self._ws._ws_status in [2, 3]:  # close, error
+            return True
+        return time.time() - self._ws._ts > OrderManager.__STALE_SEC
+
+    # ==========================================================
+    # RESTで同期
+    # ==========================================================
+    def sync(self):
+        orders = self._bitmex.open_orders()
+        if not isinstance(orders, list):
+            self._logger.error("OrderManager sync: open orders error={}".format(orders))
+            return False
+        with self._lock:
+            # RESTに無いオープン注文は終了しているので、オープン状態を外す
+            self.__close_missing(set([o["info"]["orderID"] for o in orders]))
+            for o in orders:
+                self.__merge(o["info"])
+            self._synced = True
+        return True
+
+    # ==========================================================
+    # 全体像に無いオープン注文を終了状態にする（ロック取得済みで呼び出すこと）
+    #   注文数量まで約定していれば Filled、それ以外（一部約定を含む）は Canceled とする
+    #   params:
+    #       ids: オープン注文の orderID の set
+    # ==========================================================
+    def __close_missing(self, ids):
+        for o in self._orders.values():
+            if self.__is_open(o) and o["orderID"] not in ids:
+                filled = o.get("cumQty") or 0
+                full = 0 < filled and o.get("orderQty") in (None, filled)
+                o["leavesQty"] = 0
+                o["ordStatus"] = "Filled" if full else "Canceled"
+
+    # ==========================================================
+    # 注文がオープンか
+    # ==========================================================
+    def __is_open(self, order):
+        return order.get("leavesQty", 0) > 0 and order.get("ordStatus") not in [
+            "Filled",
+            "Canceled",
+            "Rejected",
+        ]
+
+    # ==========================================================
+    # 注文情報をマージする（ロック取得済みで呼び出すこと）
+    #   受信済みの情報より古い(timestamp)データは、不足している項目だけを補う
+    # ==========================================================
+    def __merge(self, data):
+        orderID = data.get("orderID")
+        if orderID is None:
+            return
+        order = self._orders.get(orderID)
+        if order is None:
+            order = {}
+            self._orders[orderID] = order
+        if str(order.get("timestamp", "")) > str(data.get("timestamp", "")):
+            for k, v in data.items():
+                order.setdefault(k, v)
+        else:
+            order.update(data)
+        if order.get("clOrdID"):
+            self._clOrdIDs[order["clOrdID"]] = orderID
+        self.__prune()
+
+    # ==========================================================
+    # 終了した注文を古い順に削除する
+    # ==========================================================
+    def __prune(self):
+        if len(self._orders) <= OrderManager.__MAX_CLOSED_ORDERS * 1.5:
+            return
+        for orderID in list(self._orders.keys()):
+            if len(self._orders) <= OrderManager.__MAX_CLOSED_ORDERS:
+                break
+            order = self._orders[orderID]
+            if not self.__is_open(order):
+                del self._orders[orderID]
+                self._clOrdIDs.pop(order.get("clOrdID"), None)
+                for f in self._fills.pop(orderID, []):
+                    self._exec_ids.discard(f["execID"])
+
+    # ==========================================================
+    # REST注文結果の受信
+    # ==========================================================
+    def __on_rest(self, orders):
+        with self._lock:
+            for o in orders:
+                self.__merge(o)
+
+    # ==========================================================
+    # websocket order の受信
+    # ==========================================================
+    def __on_ws_order(self, action, data):
+        with self._lock:
+            if action == "partial":
+                # 接続(再接続)時の全体像
+                self.__close_missing(set([o["orderID"] for o in data]))
+                self._synced = True
+            for o in data:
+                self.__merge(o)
+
+    # ==========================================================
+    # websocket execution の受信
+    # ==========================================================
+    def __on_ws_execution(self, action, data):
+        with self._lock:
+            for e in data:
+                if e.get("execType") != "Trade" or e.get("execID") in self._exec_ids:
+                    continue
+                self._exec_ids.add(e["execID"])
+                self._fills.setdefault(e["orderID"], []).append(
+                    {
+                        "execID": e["execID"],
+                        "price": e.get("lastPx"),
+                        "qty": e.get("lastQty"),
+                        "side": e.get("side"),
+                        "timestamp": e.get("timestamp"),
+                    }
+                )
+                # 約定で変化する項目だけを反映する（orderの更新が遅れて届いても上書きしない）
+                self.__merge(
+                    {
+                        k: e[k]
+                        for k in [
+                            "orderID",
+                            "clOrdID",
+                            "ordStatus",
+                            "leavesQty",
+                            "cumQty",
+                            "avgPx",
+                            "timestamp",
+                        ]
+                        if k in e
+                    }
+                )
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+# ==========================================
+# Vwap
+# ==========================================
+import json
+import os
+import re
+import time
+
+# thred操作
+import threading
+
+# 約定時刻の変換
+import dateutil.parser
+
+# セッションVWAP・TWAP
+from indicators.session_vwap import SessionVWAP
+
+# from .. import Puppeteer
+
+
+# ==============================================================
+# Vwap クラス
+#   websocketの約定、もしくはマルチタイムフレームの確定足から、セッション・直近の期間の
+#   VWAP・TWAPを集計する
+#   定義ファイル:
+#       "VWAP": {"day": {"SESSION": "day"}, "5m": {"WINDOW": 300},
+#                "funding_1m": {"SESSION": "funding", "SPAN": "1m"}}
+#       SESSION: day(UTCの日付), funding(UTC 4時, 12時, 20時), null(区切らない)
+#       WINDOW: 直近の期間(秒)、null(区切らない)
+#       SPAN: 確定足から集計するタイムフレーム（未指定はwebsocketの約定から集計する）
+#       "VWAP_STATE_DIR": 約定から集計した状態の保存先（null は保存しない）
+#   param:
+#       puppeteer: Puppeteerオブジェクト
+# ==============================================================
+class Vwap:
+
+    # 状態を保存する最短の間隔(秒)
+    SAVE_INTERVAL = 60
+
+    # ==========================================================
+    # 初期化
+    #   param:
+    #       puppeteer: Puppeteerオブジェクト
+    # ==========================================================
+    def __init__(self, Puppeteer):
+        self._logger = Puppeteer._logger  # logger
+        self._config = Puppeteer._config  # 定義ファイル
+        self._ws = Puppeteer._ws  # websocket
+        self._candle = Puppeteer._candle  # マルチタイムフレーム ローソク足
+
+        self._path = self._config["VWAP_STATE_DIR"]
+        if self._path is not None:
+            os.makedirs(self._path, exist_ok=True)
+
+        # -------------------------------------------------------
+        # Threadのロック用オブジェクト
+        # -------------------------------------------------------
+        self._lock = threading.Lock()
+        self._saved_at = 0  # 最後に保存した時刻
+
+        # -------------------------------------------------------
+        # 集計オブジェクト（trades: 約定から集計するもの）
+        # -------------------------------------------------------
+        self._vwaps = {}
+        self._trades = {}
+        for name, spec in self._config["VWAP"].items():
+            vwap = SessionVWAP(spec.get("SESSION"), spec.get("WINDOW"))
+            if spec.get("SPAN") is not None:
+                # 確定足の履歴で初期化される
+                self._candle.attach(spec["SPAN"], vwap)
+            elif self._ws is not None:
+                self.__load(name, vwap)
+                self._trades[name] = vwap
+            else:
+                self._logger.error(
+                    "vwap {}: SPAN or websocket is required".format(name)
+                )
+                continue
+            self._vwaps[name] = vwap
+
+        # -------------------------------------------------------
+        # websocketの約定を受信する
+        # -------------------------------------------------------
+        if len(self._trades) != 0:
+            self._ws.add_listener("trade", self.__on_trade)
+
+        self._logger.debug("Vwap initialized {}".format(list(self._vwaps)))
+
+    # ==========================================================
+    # VWAP（データが無ければNaN）
+    #   params:
+    #       name: 定義ファイルの VWAP の名前
+    # ==========================================================
+    def vwap(self, name):
+        return self.__read(name, lambda v, now: v.vwap(now))
+
+    # ==========================================================
+    # TWAP（データが無ければNaN）
+    # ==========================================================
+    def twap(self, name):
+        return self.__read(name, lambda v, now: v.twap(now))
+
+    # ==========================================================
+    # 約定から集計した状態の保存
+    #   一時ファイルに書いてから置き換えるので、途中で終了しても壊れない
+    #   メインループから毎回呼び出されるので、SAVE_INTERVAL 秒に1回だけ書き込む
+    #   params:
+    #       force: True は間隔に関わらず保存する（終了時）
+    # ==========================================================
+    def save(self, force=False):
+        if self._path is None:
+            return
+        now = time.time()
+        if not force and now - self._saved_at < Vwap.SAVE_INTERVAL:
+            return
+        self._saved_at = now
+        with self._lock:
+            states = dict([(name, v.state()) for name, v in self._trades.items()])
+        for name, state in states.items():
+            file = self.__file(name)
+            try:
+                with open(file + ".tmp", "w") as f:
+                    json.dump(state, f)
+                os.replace(file + ".tmp", file)
+            except Exception as e:
+                self._logger.error("vwap save {}: {}".format(name, e))
+
+    # ==========================================================
+    # 集計値の参照
+    #   約定から集計するものは、現在時刻までセッション・期間を進めて自分のロックで参照する
+    #   確定足から集計するものは、ローソク足スレッドが更新するので進めずにローソク足のロックで参照する
+    #   params:
+    #       name: 定義ファイルの VWAP の名前
+    #       func: func(集計オブジェクト, 参照時刻(ミリ秒))
+    # ==========================================================
+    def __read(self, name, func):
+        vwap = self._vwaps[name]
+        if name in self._trades:
+            with self._lock:
+                return func(vwap, int(time.time() * 1000))
+        return self._candle.locked(lambda: func(vwap, None))
+
+    # ==========================================================
+    # 状態ファイル名
+    # ==========================================================
+    def __file(self, name):
+        symbol = re.sub(r"[^0-9A-Za-z]", "", self._config["SYMBOL"])
+        return os.path.join(self._path, "vwap_{}_{}.json".format(symbol, name))
+
+    # ==========================================================
+    # 保存した状態の読み込み（セッションが替わっていれば、参照時に0からになる）
+    # ==========================================================
+    def __load(self, name, vwap):
+        if self._path is None or not os.path.exists(self.__file(name)):
+            return
+        try:
+            with open(self.__file(name)) as f:
+                if vwap.restore(json.load(f)):
+                    self._logger.info("vwap {}: state restored".format(name))
+        except Exception as e:
+            self._logger.error("vwap load {}: {}".format(name, e))
+            vwap.reset()
+
+    # ==========================================================
+    # websocket trade の受信
+    #   接続時の partial は過去の約定なので使わない
+    # ==========================================================
+    def __on_trade(self, action, data):
+        if action != "insert":
+            return
+        with self._lock:
+            for trade in data:
+                ts = int(dateutil.parser.parse(trade["timestamp"]).timestamp() * 1000)
+                for vwap in self._trades.values():
+                    vwap.add(ts, trade["price"], trade["size"])
@@ -5,6 +5,7 @@
 import sys
 import ccxt
 import time
+import inspect
 from importlib import machinery
 import json
 import pprint
@@ -32,6 +33,10 @@ from modules.discord import Discord  # Discordクラス
 from modules.balance import Balance  # Balanceクラス
 from modules.heartbeat import Heartbeat  # Heartbeatクラス
 from modules.candle import Candle  # Candleクラス
+from modules.bars import TradeBars  # TradeBarsクラス
+from modules.ordermanager import OrderManager  # OrderManagerクラス
+from modules.vwap import Vwap  # Vwapクラス
+from indicators.pipeline import IndicatorPipeline  # IndicatorPipelineクラス
 
 # ==========================================
 # python pupeteer <実行ファイルのフルパス> <実行定義JSONファイルのフルパス>
@@ -135,6 +140,21 @@ class Puppeteer:
         if "USE_WEBSOCKET" not in self._config:
             self._config["USE_WEBSOCKET"] = False
         # ------------------------------
+        # websocketのオーダーフローの集計期間(秒)
+        # ------------------------------
+        if "ORDER_FLOW_WINDOW" not in self._config:
+            self._config["ORDER_FLOW_WINDOW"] = 60
+        # ------------------------------
+        # OHLCVローカルキャッシュのディレクトリ（未指定はキャッシュしない）
+        # ------------------------------
+        if "OHLCV_CACHE_DIR" not in self._config:
+            self._config["OHLCV_CACHE_DIR"] = None
+        # ------------------------------
+        # ローソク足・インジケータのチェックポイントのディレクトリ（未指定は保存しない）
+        # ------------------------------
+        if "CHECKPOINT_DIR" not in self._config:
+            self._config["CHECKPOINT_DIR"] = None
+        # ------------------------------
         # bitmexラッパー
         # ------------------------------
         self._bitmex = BitMEX(
@@ -143,6 +163,7 @@ class Puppeteer:
             secret=self._config["SECRET"],
             logger=self._logger,
             use_testnet=self._config["USE_TESTNET"],
+            ohlcv_cache_dir=self._config["OHLCV_CACHE_DIR"],
         )
         # ------------------------------
         # 取引所オブジェクト(ccxt.bitmex)
@@ -161,6 +182,12 @@ class Puppeteer:
                 api_secret=self._config["SECRET"],
                 logger=self._logger,
                 use_timemark=False,
+                # 5秒足のギャップを約定履歴で取り直す
+                trade_fetcher=lambda since, limit: self._bitmex.trades(
+                    symbol=self._config["SYMBOL"], since=since, limit=limit
+                ),
+                # 約定・板から集計するオーダーフローの期間
+                order_flow_window=self._config["ORDER_FLOW_WINDOW"],
             )
             if self._config["USE_WEBSOCKET"] == True
             else None
@@ -173,15 +200,55 @@ class Puppeteer:
         # ----------------------------------
         self._discord = Discord(self._config["DISCORD_WEBHOOK_URL"])
         # ------------------------------
+        # 注文状態管理（websocketのorder/executionとRESTの注文結果を統合する）
+        # ------------------------------
+        self._order_manager = (
+            OrderManager(self) if self._config["USE_WEBSOCKET"] == True else None
+        )
+        # ------------------------------
         # 資産状況通知を使うか
         # ------------------------------
         if "USE_SEND_BALANCE" not in self._config:
             self._config["USE_SEND_BALANCE"] = False
         # ------------------------------
+        # 注文バッチを使うか（Puppet.run中の注文をまとめてbulk発行する）
+        # ------------------------------
+        if "USE_ORDER_BATCH" not in self._config:
+            self._config["USE_ORDER_BATCH"] = False
+        # ------------------------------
         # マルチタイムフレームを使うかどうか
         # ------------------------------
         if "MULTI_TIMEFRAME_CANDLE_SPAN_LIST" not in self._config:
             self._config["MULTI_TIMEFRAME_CANDLE_SPAN_LIST"] = []
+        # ------------------------------
+        # Puppet.on_bar に確定足を通知するタイムフレーム（未指定はマルチタイムフレームの全て）
+        # ------------------------------
+        if "ON_BAR_SPAN_LIST" not in self._config:
+            self._config["ON_BAR_SPAN_LIST"] = None
+        # ------------------------------
+        # 約定から作る足（ティック・ボリューム・ダラー・レンジバー、websocket使用時のみ）
+        # ------------------------------
+        if "TRADE_BARS" not in self._config:
+            self._config["TRADE_BARS"] = {}
+        # ------------------------------
+        # 足が確定する度に計算するインジケータ（タイムフレームはマルチタイムフレームに追加する）
+        # ------------------------------
+        if "INDICATORS" not in self._config:
+            self._config["INDICATORS"] = []
+        # ------------------------------
+        # セッション・直近の期間のVWAP・TWAP（SPAN指定はマルチタイムフレームに追加する）
+        # ------------------------------
+        if "VWAP" not in self._config:
+            self._config["VWAP"] = {}
+        if "VWAP_STATE_DIR" not in self._config:
+            self._config["VWAP_STATE_DIR"] = None
+        spans = self._config["MULTI_TIMEFRAME_CANDLE_SPAN_LIST"]
+        for spec in self._config["INDICATORS"]:
+            if spec.get("span") is not None and spec["span"] not in spans:
+                spans.append(spec["span"])
+        for spec in self._config["VWAP"].values():
+            if spec.get("SPAN") is not None and spec["SPAN"] not in spans:
+                spans.append(spec["SPAN"])
 
         # ------------------------------
         # マルチタイムフレーム ローソク足オブジェクト
@@ -191,6 +258,27 @@ class Puppeteer:
             if len(self._config["MULTI_TIMEFRAME_CANDLE_SPAN_LIST"]) != 0
             else None
         )
+        # ------------------------------
+        # 約定から作る足オブジェクト
+        # ------------------------------
+        self._trade_bars = (
+            TradeBars(self)
+            if self._config["USE_WEBSOCKET"] == True
+            and len(self._config["TRADE_BARS"]) != 0
+            else None
+        )
+        # ------------------------------
+        # インジケータのパイプライン
+        # ------------------------------
+        self._indicators = (
+            IndicatorPipeline(self._candle, self._config["INDICATORS"], self._logger)
+            if len(self._config["INDICATORS"]) != 0
+            else None
+        )
+        # ------------------------------
+        # VWAP・TWAPオブジェクト
+        # ------------------------------
+        self._vwap = Vwap(self) if len(self._config["VWAP"]) != 0 else None
 
         # ----------------------------------
         # ストラテジのロードと生成
@@ -198,6 +286,18 @@ class Puppeteer:
         module = machinery.SourceFileLoader("Puppet", args[1]).load_module()
         self._Puppet = module.Puppet(self)
         # ----------------------------------
+        # Puppet.run にインジケータを渡すか（run に indicators 引数がある場合）
+        # ----------------------------------
+        self._run_indicators = (
+            self._indicators is not None
+            and "indicators" in inspect.signature(self._Puppet.run).parameters
+        )
+        # ----------------------------------
+        # 足の確定通知（Puppetにon_bar(span, bar)が定義されている場合）
+        # ----------------------------------
+        if self._candle is not None and hasattr(self._Puppet, "on_bar"):
+            self._candle.subscribe(self.on_bar, self._config["ON_BAR_SPAN_LIST"])
+        # ----------------------------------
         # 起動メッセージ
         # ----------------------------------
         message = "[傀儡師] 起動しました。Puppet={}, Config={}, 対象通貨ペア={}, RUN周期={}(秒)".format(
@@ -206,6 +306,20 @@ class Puppeteer:
         self._logger.info(message)
         self._discord.send(message)
 
+    # ======================================
+    # 足の確定通知
+    #   ローソク足スレッドから呼ばれる。注文バッチが有効な場合、on_bar中の注文はまとめて発行する
+    # ======================================
+    def on_bar(self, span, bar):
+        if self._config["USE_ORDER_BATCH"]:
+            self._bitmex.begin_batch()
+            try:
+                self._Puppet.on_bar(span, bar)
+            finally:
+                self._bitmex.end_batch()
+        else:
+            self._Puppet.on_bar(span, bar)
+
 
 # ==========================================
 # メイン
@@ -224,9 +338,19 @@ if __name__ == "__main__":
                 run(Puppeteer=puppeteer)
             except KeyboardInterrupt:
                 puppeteer._logger.info("[傀儡師] Ctrl-C検出: 処理を終了します")
+                puppeteer._logger.info(
+                    "api stats: {}".format(puppeteer._bitmex.stats_summary())
+                )
                 puppeteer._discord.send("[傀儡師] Ctrl-C検出: 処理を終了します")
+                if puppeteer._vwap is not None:
+                    puppeteer._vwap.save(force=True)
                 # 注文が存在したらキャンセルする
-                if len(puppeteer._bitmex.open_orders()):
+                open_orders = (
+                    puppeteer._order_manager.open_orders()
+                    if puppeteer._order_manager is not None
+                    else puppeteer._bitmex.open_orders()
+                )
+                if len(open_orders):
                     puppeteer._bitmex.cancel_orders()
                     puppeteer._logger.info("[傀儡師] Ctrl-C検出: 既出注文をキャンセルしました")
                     puppeteer._discord.send("[傀儡師] Ctrl-C検出: 既出注文をキャンセルしました")
@@ -234,6 +358,9 @@ if __name__ == "__main__":
                 exit()
             except Exception as e:
                 puppeteer._logger.error("[傀儡師] 例外発生[{}]: 処理を再起動します".format(e))
+                puppeteer._logger.info(
+                    "api stats: {}".format(puppeteer._bitmex.stats_summary())
+                )
                 puppeteer._discord.send("[傀儡師] 例外発生[{}]: 処理を再起動します".format(e))
                 # websocket再接続
                 if puppeteer._config["USE_WEBSOCKET"]:
@@ -349,8 +476,31 @@ if __name__ == "__main__":
                 raise Exception("websocket force exit")
             # ----------------------------------
             # ストラテジ呼び出し
+            #   注文バッチが有効な場合、run中の注文はrun終了時にまとめて発行する
+            #   インジケータのパイプラインを使う場合、計算済みの値を indicators={id: 値} で渡す
+            # ----------------------------------
+            params = (
+                {"indicators": Puppeteer._indicators.values()}
+                if Puppeteer._run_indicators
+                else {}
+            )
+            if Puppeteer._config["USE_ORDER_BATCH"]:
+                Puppeteer._bitmex.begin_batch()
+                try:
+                    Puppeteer._Puppet.run(
+                        ticker, orderbook, position, balance, candle, **params
+                    )
+                finally:
+                    Puppeteer._bitmex.end_batch()
+            else:
+                Puppeteer._Puppet.run(
+                    ticker, orderbook, position, balance, candle, **params
+                )
+            # ----------------------------------
+            # 約定から集計したVWAPの状態を保存（再起動時に読み込む、1分に1回）
             # ----------------------------------
-            Puppeteer._Puppet.run(ticker, orderbook, position, balance, candle)
+            if Puppeteer._vwap is not None:
+                Puppeteer._vwap.save()
             # ----------------------------------
             # 処理終了
             # ----------------------------------
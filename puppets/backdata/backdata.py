@@ -30,6 +30,15 @@ class Puppet:
         self._discord = Puppeteer._discord  # discord
         self._candle = Puppeteer._candle  # Candleクラス
 
+    # ==========================================================
+    # 足の確定通知
+    #   param:
+    #       span: タイムフレーム
+    #       bar: 確定足 [timestamp(ミリ秒), open, high, low, close, volume]
+    # ==========================================================
+    def on_bar(self, span, bar):
+        self._logger.info("on_bar {}: {}".format(span, bar))
+
     # ==========================================================
     # 売買実行
     #   param:
@@ -85,8 +94,9 @@ class Puppet:
         # ------------------------------------------------------
         # ローソク足
         # ------------------------------------------------------
-        df = self._candle.candle("1m")
+        df = self._candle.candle("1m", closed_only=True)
         self._logger.info(df.tail(5))
+        self._logger.info("live 1m: {}".format(self._candle.live_bar("1m")))
 
         # ------------------------------------------------------
         # 処理時間計測終了
@@ -5,9 +5,10 @@
 import time
 from datetime import datetime as dt, timezone as tz, timedelta as delta
 
-import pandas as pd
+import numpy as np
 
 from puppeteer import Puppeteer
+from indicators.doten import doten_signal, BUY, SELL
 
 
 # ==========================================
@@ -47,17 +48,12 @@ class Puppet:
         # self._logger.info('pos_qty:{}'.format(pos_qty))
 
         # ------------------------------------------------------
-        # ローソク足
+        # ローソク足 [timestamp, open, high, low, close, volume] の配列
         # ------------------------------------------------------
-        df = self.__get_candleDF(candle)
+        ohlcv = np.asarray(candle, dtype=np.float64)
 
-        range_mean = self.__calc_range_mean(
-            df[:-1], self._config["RANGE_MEAN_NUM"]
-        )  # 直近の足は未確定足だから計算に渡さない
-
-        doten = self.__calc_doten(
-            df.iloc[-1], range_mean, self._config["DOTEN_K"]
-        )  # 直近の足からopen, high, lowを取得する
+        # 直近の足(未確定足)のシグナル。値幅の平均は直前の確定足から計算する
+        doten = self.__calc_doten(ohlcv)
         # for DEBUG
         # self._logger.info('doten: {}'.format(doten))
 
@@ -99,45 +95,23 @@ class Puppet:
                 # ----------------------------------------------
                 self.__market_order("buy", self._config["LOT"] * 2)
 
-    # ==========================================================
-    # ローソク足 DataFrame 取得
-    # ==========================================================
-    def __get_candleDF(self, candle):
-        # -----------------------------------------------
-        # Pandasのデータフレームに
-        # -----------------------------------------------
-        df = pd.DataFrame(
-            candle, columns=["timestamp", "open", "high", "low", "close", "volume"]
-        )
-        # -----------------------------------------------
-        # 日時データをDataFrameのインデックスにする
-        # -----------------------------------------------
-        df["timestamp"] = pd.to_datetime(
-            df["timestamp"], unit="ms", utc=True, infer_datetime_format=True
-        )  # UNIX時間(ミリ秒)を変換, UTC=TrueでタイムゾーンがUTCに設定される, infer_datetime_format=Trueは高速化に寄与するとのこと。
-        df = df.set_index("timestamp")
-
-        return df
-
-    # ==========================================================
-    # RANGE計算
-    # ==========================================================
-    def __calc_range_mean(self, df, range_mean_num):
-        diff = 0
-        for index, row in df[-range_mean_num:].iterrows():
-            diff += row["high"] - row["low"]
-        return diff / range_mean_num
-
     # ==========================================================
     # ドテン計算
+    #   indicators.doten.doten_signal で、直近の足のシグナルを計算する
+    #   return:
+    #       buy, sell, none
     # ==========================================================
-    def __calc_doten(self, last, range_mean, k):
-        ret = "none"
-        if last["high"] > (last["open"] + range_mean * k):
-            ret = "buy"
-        elif last["low"] < (last["open"] - range_mean * k):
-            ret = "sell"
-        return ret
+    def __calc_doten(self, ohlcv):
+        n = self._config["RANGE_MEAN_NUM"]
+        last = ohlcv[-(n + 1) :]  # 直近の足と、値幅の平均を計算する直前の n 本
+        signal = doten_signal(
+            last[:, 1], last[:, 2], last[:, 3], n, self._config["DOTEN_K"]
+        )[-1]
+        if signal == BUY:
+            return "buy"
+        if signal == SELL:
+            return "sell"
+        return "none"
 
     # ==========================================================
     # 成行注文
@@ -25,6 +25,7 @@ class Puppet:
         self._config = Puppeteer._config  # 定義ファイル
         self._ws = Puppeteer._ws  # websocket
         self._bitmex = Puppeteer._bitmex  # ccxt.bimexラッパーオブジェクト
+        self._order_manager = Puppeteer._order_manager  # 注文状態管理
 
     # ==========================================================
     # 売買実行
@@ -110,8 +111,13 @@ class Puppet:
 
         # ------------------------------------------------------
         # オープンオーダー
+        #   websocket使用時は、注文状態管理から取得する（毎回RESTで取得しない）
         # ------------------------------------------------------
-        self._logger.info("open orders = {}".format(self._ws.open_orders()))
+        if self._order_manager is not None:
+            orders = self._order_manager.open_orders()
+        else:
+            orders = self._bitmex.open_orders()
+        self._logger.info("open orders = {}".format(orders))
 
         # ------------------------------------------------------
         # 資産
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+# ==========================================
+# 足幅変換のベンチマーク（pytestの対象外）
+#   python -m tests.exchanges.bench_resample
+# ==========================================
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from exchanges.resample import resample
+
+HOW = {"open": "first", "high": "max", "low": "min", "close": "last", "volume": "sum"}
+
+
+def make_df(count):
+    rng = np.random.RandomState(0)
+    index = pd.date_range("2019-06-01", periods=count, freq="60s", tz="UTC")
+    close = 10000 + rng.randn(count).cumsum()
+    return pd.DataFrame(
+        {
+            "open": close,
+            "high": close + 5,
+            "low": close - 5,
+            "close": close,
+            "volume": rng.rand(count) * 100,
+        },
+        index=index,
+    )
+
+
+def bench(count, rule, number):
+    df = make_df(count)
+    t_pandas = timeit.timeit(
+        lambda: df.resample(rule, label="left", closed="left").agg(HOW), number=number
+    )
+    t_numpy = timeit.timeit(lambda: resample(df, rule, HOW), number=number)
+    print(
+        "{:>7} bars -> {:<5} pandas {:8.3f}ms  numpy {:8.3f}ms  x{:.1f}".format(
+            count,
+            rule,
+            t_pandas / number * 1000,
+            t_numpy / number * 1000,
+            t_pandas / t_numpy,
+        )
+    )
+
+
+if __name__ == "__main__":
+    for count, number in [(500, 200), (100000, 10)]:
+        for rule in ["300s", "3600s"]:
+            bench(count, rule, number)
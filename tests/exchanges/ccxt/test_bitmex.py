@@ -1,8 +1,75 @@
-# bitmexラッパー
-from exchanges.ccxt.bitmex import BitMEX
-
-def test_fail():
-    assert 1 == 0
-
-def test_ok():
-    assert 1 == 1
+# bitmexラッパー
+from exchanges.ccxt.bitmex import BitMEX
+
+def test_fail():
+    assert 1 == 0
+
+def test_ok():
+    assert 1 == 1
+
+
+def test_client_pool_is_per_thread():
+    import threading
+
+    bitmex = BitMEX(pool_size=2)
+    bitmex._create_client = lambda: object()
+    used = []
+    ready = threading.Barrier(2)
+
+    def borrow():
+        with bitmex.client() as exchange:
+            used.append(exchange)
+            ready.wait(timeout=3)
+
+    threads = [threading.Thread(target=borrow) for i in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # 同時に借りたオブジェクトは別物
+    assert used[0] is not used[1]
+    with bitmex.client() as exchange:
+        assert exchange in used
+
+
+def test_stats_records_latency_and_errors():
+    import ccxt
+
+    class FakeExchange:
+        last_response_headers = {"x-ratelimit-remaining": "59"}
+
+        def fetch_ticker(self, symbol):
+            raise ccxt.RequestTimeout("timeout")
+
+        def fetch_balance(self):
+            return {"info": [{"walletBalance": 1}]}
+
+    bitmex = BitMEX()
+    bitmex._create_client = FakeExchange
+    assert bitmex.ticker() is None
+    assert bitmex.balance() is not None
+
+    stats = bitmex.stats()
+    assert stats["methods"]["ticker"]["timeouts"] == 1
+    assert stats["methods"]["ticker"]["errors"] == {"RequestTimeout": 1}
+    assert stats["methods"]["balance"]["count"] == 1
+    assert stats["ratelimit"]["remaining"] == "59"
+    assert "ticker: n=1" in bitmex.stats_summary()
+
+
+def test_pooled_clients_share_one_throttle():
+    import time
+    from exchanges.ccxt.throttle import SharedThrottle
+
+    bitmex = BitMEX(pool_size=2)
+    assert isinstance(bitmex._throttle, SharedThrottle)
+    clients = [bitmex._exchange] + [bitmex._create_client() for i in range(2)]
+    assert all(exchange.enableRateLimit for exchange in clients)
+    for exchange in clients:
+        exchange.rateLimit = 50
+
+    # 別のオブジェクトでも、続けて送信する場合は rateLimit の間隔を空ける
+    start = time.time()
+    for exchange in clients * 2:
+        exchange.throttle()
+    assert time.time() - start >= 0.24
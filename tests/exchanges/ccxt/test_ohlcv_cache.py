@@ -0,0 +1,101 @@
+# OHLCVローカルキャッシュ
+from exchanges.ccxt.ohlcv_cache import OhlcvCache
+from exchanges.ccxt.bitmex import BitMEX
+
+import calendar
+from datetime import datetime
+
+
+def test_append_and_read(tmp_path):
+    cache = OhlcvCache(str(tmp_path))
+    bars = [[i * 60000, 1.0, 2.0, 0.5, 1.5, 10.0] for i in range(5)]
+    assert cache.append("BTC/USD", "1m", bars) == 5
+    # 保存済みの足は追記されない
+    # Noneを含む足は値のある足が続く場合だけ保存し、末尾のものは次回取得し直す
+    more = bars[3:] + [
+        [5 * 60000, 1, 2, 0, 1, 1],
+        [6 * 60000, None, None, None, None, 0],
+        [7 * 60000, 1, 2, 0, 1, 1],
+        [8 * 60000, None, None, None, None, 0],
+    ]
+    assert cache.append("BTC/USD", "1m", more) == 3
+    assert cache.last_timestamp("BTC/USD", "1m") == 7 * 60000
+    assert cache.read("BTC/USD", "1m", count=4)[0] == [4 * 60000, 1.0, 2.0, 0.5, 1.5, 10.0]
+    empty = cache.read("BTC/USD", "1m", count=2)[0]
+    assert empty == [6 * 60000, None, None, None, None, 0.0]
+    assert len(cache.read("BTC/USD", "1m", since=2 * 60000)) == 6
+    cache.clear("BTC/USD", "1m")
+    assert cache.last_timestamp("BTC/USD", "1m") is None
+
+
+class FakeExchange:
+    def __init__(self):
+        self.calls = []
+
+    def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None, params={}):
+        self.calls.append((since, limit))
+        now = calendar.timegm(datetime.utcnow().utctimetuple())
+        current = (now - now % 60) * 1000
+        return [
+            [ts, 1.0, 2.0, 0.5, 1.5, 1.0]
+            for ts in range(since, current + 60000, 60000)
+        ][:limit]
+
+
+def test_ohlcv_fetches_only_missing_tail(tmp_path):
+    bitmex = BitMEX(ohlcv_cache_dir=str(tmp_path))
+    bitmex._exchange = FakeExchange()
+    bitmex._create_client = lambda: bitmex._exchange
+    params = {"partial": False, "reverse": False}
+
+    first = bitmex.ohlcv(timeframe="1m", limit=10, params=params)
+    assert len(first) == 10
+    second = bitmex.ohlcv(timeframe="1m", limit=10, params=params)
+    assert second[-1][0] >= first[-1][0]
+    # 2回目はキャッシュの最新足以降だけを取得する
+    assert bitmex._exchange.calls[-1][1] <= 2
+
+
+def test_prepend(tmp_path):
+    cache = OhlcvCache(str(tmp_path))
+    bars = [[i * 60000, 1.0, 2.0, 0.5, 1.5, 10.0] for i in range(10)]
+    cache.append("BTC/USD", "1m", bars[5:])
+    # 保存済みの最古の足より古い足だけを追加する
+    assert cache.prepend("BTC/USD", "1m", bars[:7]) == 5
+    assert cache.first_timestamp("BTC/USD", "1m") == 0
+    assert [o[0] for o in cache.read("BTC/USD", "1m")] == [b[0] for b in bars]
+
+
+def test_ohlcv_backfills_older_history(tmp_path):
+    bitmex = BitMEX(ohlcv_cache_dir=str(tmp_path))
+    bitmex._exchange = FakeExchange()
+    bitmex._create_client = lambda: bitmex._exchange
+    params = {"partial": False, "reverse": False}
+
+    bitmex.ohlcv(timeframe="1m", limit=10, params=params)
+    # キャッシュよりも深い履歴を要求すると、古い足を遡って取得する
+    deep = bitmex.ohlcv(timeframe="1m", limit=700, params=params)
+    assert len(deep) == 700
+    assert all(b[0] - a[0] == 60000 for a, b in zip(deep, deep[1:]))
+
+
+class NoneExchange(FakeExchange):
+    # 取引の無かった足(各ページの先頭と末尾)はOHLCがNone
+    def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None, params={}):
+        ohlcvs = super().fetch_ohlcv(symbol, timeframe, since, limit, params)
+        empty = [since, ohlcvs[-1][0]] if len(ohlcvs) == limit else [since]
+        return [[o[0]] + [None] * 5 if o[0] in empty else o for o in ohlcvs]
+
+
+def test_ohlcv_keeps_paging_past_none_bars(tmp_path):
+    bitmex = BitMEX(ohlcv_cache_dir=str(tmp_path))
+    bitmex._exchange = NoneExchange()
+    bitmex._create_client = lambda: bitmex._exchange
+    params = {"partial": False, "reverse": False}
+
+    # Noneの足があっても、キャッシュから読んだ足は抜けなく連続している
+    ohlcvs = bitmex.ohlcv(timeframe="1m", limit=1200, params=params)
+    assert len(bitmex._exchange.calls) >= 3
+    assert len(ohlcvs) == 1200
+    assert all(b[0] - a[0] == 60000 for a, b in zip(ohlcvs, ohlcvs[1:]))
+    assert ohlcvs[0][1] is None
@@ -0,0 +1,77 @@
+# 注文バッチ
+import json
+
+from exchanges.ccxt.bitmex import BitMEX
+from exchanges.ccxt.order_batch import BatchOrder
+
+
+class FakeExchange:
+    def __init__(self):
+        self.calls = []
+
+    def parse_order(self, order):
+        return {"id": order["orderID"], "info": order}
+
+    def privatePostOrderBulk(self, params):
+        self.calls.append("bulk create")
+        return [
+            dict(o, orderID="id{}".format(i), error=None)
+            for i, o in enumerate(json.loads(params["orders"]))
+        ]
+
+    def privatePutOrderBulk(self, params):
+        self.calls.append("bulk amend")
+        return [dict(o, error=None) for o in json.loads(params["orders"])]
+
+    def privateDeleteOrder(self, params):
+        self.calls.append("cancel")
+        return [
+            {"orderID": i, "error": None if i != "bad" else "Not Found"}
+            for i in params["orderID"].split(",")
+        ]
+
+
+def test_batch_maps_results_back():
+    bitmex = BitMEX()
+    bitmex._exchange = FakeExchange()
+    bitmex._create_client = lambda: bitmex._exchange
+
+    bitmex.begin_batch()
+    creates = [bitmex.limit_order("buy", 100 + i, 10) for i in range(5)]
+    amends = [bitmex.amend_order(orderID="a{}".format(i), price=1) for i in range(3)]
+    cancels = [bitmex.cancel_order(orderID="c{}".format(i)) for i in range(4)]
+    assert all(isinstance(o, BatchOrder) and not o.done for o in creates)
+    bitmex.end_batch()
+
+    assert bitmex._exchange.calls == ["bulk create", "bulk amend", "cancel"]
+    assert [o.result["info"]["price"] for o in creates] == [100, 101, 102, 103, 104]
+    assert [o.result["orderID"] for o in amends] == ["a0", "a1", "a2"]
+    assert all(o.done and not o.is_error() for o in cancels)
+
+
+def test_batch_cancel_not_found_is_returned():
+    bitmex = BitMEX()
+    bitmex._exchange = FakeExchange()
+    bitmex._create_client = lambda: bitmex._exchange
+
+    bitmex.begin_batch()
+    ok = bitmex.cancel_order(orderID="ok")
+    bad = bitmex.cancel_order(orderID="bad")
+    # 呼び出し元(finally)の例外を置き換えないように、例外にしない
+    assert bitmex.end_batch() == [ok, bad]
+    assert not ok.is_error() and bad.is_error()
+    assert bad.result["error"]["message"] == "Not Found"
+
+
+def test_batch_orders_in_same_millisecond_have_unique_ids(monkeypatch):
+    bitmex = BitMEX()
+    bitmex._exchange = FakeExchange()
+    bitmex._create_client = lambda: bitmex._exchange
+    monkeypatch.setattr("time.time", lambda: 1562112000.0)
+
+    bitmex.begin_batch()
+    orders = [bitmex.limit_order("buy", 100 + i, 10) for i in range(3)]
+    bitmex.end_batch()
+
+    assert len(set(o.params["clOrdID"] for o in orders)) == 3
+    assert [o.result["info"]["price"] for o in orders] == [100, 101, 102]
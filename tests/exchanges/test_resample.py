@@ -0,0 +1,53 @@
+# NumPy 足幅変換
+import numpy as np
+import pandas as pd
+
+from exchanges.resample import resample
+
+HOW = {"open": "first", "high": "max", "low": "min", "close": "last", "volume": "sum"}
+
+
+def make_df(count, step="1min", tz="UTC", gaps=False, seed=0):
+    rng = np.random.RandomState(seed)
+    index = pd.date_range("2019-06-01 00:03", periods=count, freq=step, tz=tz)
+    if gaps:
+        index = index[rng.rand(count) > 0.3]
+    close = 10000 + rng.randn(len(index)).cumsum()
+    df = pd.DataFrame(
+        {
+            "open": close + rng.randn(len(index)),
+            "high": close + 5,
+            "low": close - 5,
+            "close": close,
+            "volume": rng.randint(0, 100, len(index)),
+        },
+        index=index,
+    )
+    df.index.name = "timestamp"
+    return df
+
+
+def expected(df, rule):
+    return df.resample(rule, label="left", closed="left").agg(HOW)
+
+
+def test_matches_pandas():
+    for tz in ["UTC", None, "Asia/Tokyo"]:
+        for gaps in [False, True]:
+            df = make_df(3000, tz=tz, gaps=gaps)
+            for rule in ["1min", "3min", "5min", "7min", "45min", "1h", "4h", "8h", "1D"]:
+                pd.testing.assert_frame_equal(
+                    resample(df, rule, HOW), expected(df, rule)
+                )
+
+
+def test_seconds_and_fallback():
+    df = make_df(500, step="5s")
+    for rule in ["10s", "15s", "30s"]:
+        pd.testing.assert_frame_equal(resample(df, rule, HOW), expected(df, rule))
+
+    # NaNを含むデータ、固定長でない足幅は pandas で計算する
+    df = make_df(5000, step="1h")
+    df.iloc[3, 0] = np.nan
+    pd.testing.assert_frame_equal(resample(df, "4h", HOW), expected(df, "4h"))
+    pd.testing.assert_frame_equal(resample(df, "W", HOW), expected(df, "W"))
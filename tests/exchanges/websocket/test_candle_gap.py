@@ -0,0 +1,91 @@
+# websocket 5秒足のギャップ
+import logging
+import threading
+
+from exchanges.websocket.inmemorydb_bitmex_websocket import BitMEXWebsocket
+from indicators import SMA
+
+
+def make_ws(candles):
+    # 接続せずに5秒足だけを使う
+    ws = BitMEXWebsocket.__new__(BitMEXWebsocket)
+    ws.logger = logging.getLogger(__name__)
+    ws._lock = threading.Lock()
+    ws._candle = candles
+    ws._candle_gaps = []
+    ws._indicators = []
+    ws.exited = True
+    return ws
+
+
+def candle(ts, price, gap=False):
+    return {
+        "timestamp": ts,
+        "open": price,
+        "high": price,
+        "low": price,
+        "close": price,
+        "volume": 0 if gap else 1,
+        "buy": 0,
+        "sell": 0,
+        "gap": gap,
+    }
+
+
+def test_gap_candles_are_flagged_and_filled():
+    ws = make_ws([candle(100, 10.0)])
+    ws._BitMEXWebsocket__append_gap_candle(105)
+    ws._BitMEXWebsocket__append_gap_candle(110)
+    ws._BitMEXWebsocket__append_gap_candle(115)
+    assert ws.candle_gaps() == [[105, 120]]
+    assert [c["gap"] for c in ws.candle(1)] == [False, True, True, True]
+
+    trades = [
+        {"timestamp": 106000, "price": 11.0, "amount": 2, "side": "buy"},
+        {"timestamp": 110000, "price": 12.0, "amount": 1, "side": "sell"},
+        {"timestamp": 117000, "price": 9.0, "amount": 3, "side": "sell"},
+    ]
+    # 115の足は取り直さない
+    ws.fill_candle(trades, 105, 115)
+    assert ws.candle_gaps() == [[115, 120]]
+
+    c = ws.candle(1)
+    assert c[1]["open"] == 10.0 and c[1]["high"] == 12.0 and c[1]["close"] == 12.0
+    assert (c[1]["volume"], c[1]["buy"], c[1]["sell"]) == (3, 2, 1)
+    # 約定の無い足は作り直した直前の足の終値で埋め直し、ギャップではなくなる
+    assert c[2]["volume"] == 0 and not c[2]["gap"]
+    assert [c[2][k] for k in ["open", "high", "low", "close"]] == [12.0] * 4
+    # 取り直していない足はギャップのまま、直前の終値から続く
+    assert c[3]["gap"] and c[3]["open"] == c[3]["close"] == 12.0
+    for prev, bar in zip(c[:-1], c[1:]):
+        assert bar["open"] == prev["close"]
+
+
+def test_fill_fixes_next_live_candle_open():
+    ws = make_ws([candle(100, 10.0)])
+    ws._BitMEXWebsocket__append_gap_candle(105)
+    ws._candle.append(candle(110, 10.0))
+    ws._candle[-1]["high"], ws._candle[-1]["close"] = 10.5, 10.5
+
+    trades = [{"timestamp": 107000, "price": 13.0, "amount": 1, "side": "buy"}]
+    ws.fill_candle(trades, 105, 110)
+    c = ws.candle(1)
+    assert c[2]["open"] == 13.0 and c[2]["high"] == 13.0 and c[2]["close"] == 10.5
+    assert not c[1]["gap"] and not c[2]["gap"]
+
+
+def test_indicator_updates_on_close_and_fill():
+    ws = make_ws([candle(100, 10.0), candle(105, 20.0)])
+    indicator = ws.attach(SMA(2))
+    # 未確定足(105)は含めない
+    assert indicator.count == 1
+
+    ws._BitMEXWebsocket__append_gap_candle(110)
+    ws._BitMEXWebsocket__append_gap_candle(115)
+    assert indicator.value == 20.0
+
+    # 取り直したら初期化し直す
+    trades = [{"timestamp": 112000, "price": 30.0, "amount": 1, "side": "buy"}]
+    ws.fill_candle(trades, 110, 115)
+    assert indicator.count == 3
+    assert indicator.value == 25.0
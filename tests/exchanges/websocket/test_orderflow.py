@@ -0,0 +1,89 @@
+# websocket オーダーフロー
+import json
+import logging
+import sqlite3
+import threading
+
+from exchanges.websocket.inmemorydb_bitmex_websocket import BitMEXWebsocket
+from exchanges.websocket.orderbook import OrderBook
+from exchanges.websocket.orderflow import OrderFlow, RingAccumulator
+
+
+def test_ring_accumulator():
+    ring = RingAccumulator(window=10, bucket=1, size=1)
+    ring.add(100.2, 0, 1.0)
+    ring.add(104.5, 0, 2.0)
+    ring.add(104.9, 0, 3.0)
+    assert ring.total(0, 105.0) == 6.0
+    # 100秒台のバケツが期間外になる
+    assert ring.total(0, 110.0) == 5.0
+    # 時刻が戻った場合は最新のバケツに加える
+    ring.add(109.0, 0, 1.0)
+    assert ring.total(0, 110.5) == 6.0
+    assert ring.total(0, 115.0) == 1.0
+    # 全て期間外
+    assert ring.total(0, 1000.0) == 0.0
+
+
+def test_order_flow_features():
+    flow = OrderFlow(window=10)
+    flow.on_trades(
+        [
+            {"side": "Buy", "size": 100},
+            {"side": "Buy", "size": 50},
+            {"side": "Sell", "size": 50},
+        ],
+        now=100.0,
+    )
+    flow.reset_quote({"bidPrice": 10.0, "bidSize": 5, "askPrice": 10.5, "askSize": 7})
+    flow.on_quotes(
+        [
+            # 買い気配が増えた: +3
+            {"bidPrice": 10.0, "bidSize": 8, "askPrice": 10.5, "askSize": 7},
+            # 売り気配が上がった: +7(直前のaskSize) +8(bidSize) -8(直前のbidSize)
+            {"bidPrice": 10.0, "bidSize": 8, "askPrice": 11.0, "askSize": 2},
+            # 買い気配が下がった: -8(直前のbidSize) -2(askSize) +2(直前のaskSize)
+            {"bidPrice": 9.5, "bidSize": 4, "askPrice": 11.0, "askSize": 2},
+        ],
+        now=101.0,
+    )
+    flow.on_book(40, now=102.0)
+
+    f = flow.features(now=105.0)
+    assert (f["buy_volume"], f["sell_volume"], f["trades"]) == (150, 50, 3)
+    assert f["trade_intensity"] == 0.3
+    assert f["volume_imbalance"] == 0.5
+    assert f["ofi"] == 3 + 7 - 8
+    assert (f["quotes"], f["book_updates"], f["quote_to_trade"]) == (3, 40, 40 / 3.0)
+
+    f = flow.features(now=111.5)
+    assert f["trades"] == 0 and f["quote_to_trade"] is None
+    assert f["volume_imbalance"] == 0.0 and f["book_updates"] == 40
+
+
+def test_websocket_ingest():
+    # 接続せずに受信処理だけを使う
+    ws = BitMEXWebsocket.__new__(BitMEXWebsocket)
+    ws.logger = logging.getLogger(__name__)
+    ws._lock = threading.Lock()
+    ws._listeners = {}
+    ws._use_timemark = False
+    ws._tz = None
+    ws.data = {}
+    ws._orderbook = OrderBook(sqlite3.connect(":memory:"), ws.logger)
+    ws._order_flow = OrderFlow(window=60)
+    ws.exited = True
+
+    def receive(table, action, data):
+        message = {"table": table, "action": action, "data": data}
+        ws._BitMEXWebsocket__on_message(None, json.dumps(message))
+
+    quote = {"bidPrice": 10.0, "bidSize": 5, "askPrice": 10.5, "askSize": 7}
+    receive("quote", "partial", [quote])
+    receive("quote", "insert", [dict(quote, bidSize=9)])
+    level = {"symbol": "XBTUSD", "id": 1, "side": "Buy", "size": 5, "price": 10.0}
+    receive("orderBookL2", "partial", [level])
+    receive("orderBookL2", "update", [{"symbol": "XBTUSD", "id": 1, "side": "Buy", "size": 9}])
+
+    f = ws.order_flow()
+    assert f["ofi"] == 4 and f["quotes"] == 1 and f["book_updates"] == 1
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+# ==========================================
+# インジケータのベンチマーク（pytestの対象外）
+#   python -m tests.indicators.bench_indicators [本数 ...]
+#   一括計算(numpy, pandas, TA-Lib)と逐次計算(足1本ずつ update)の処理速度(本/秒)と、
+#   numpy との最大の相対誤差を表示する。TA-Lib はインストールされている場合のみ
+#   パラメータ一括計算(indicators.sweep)は、期間毎に計算した場合との処理時間を表示する
+# ==========================================
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from indicators import backend, streaming, sweep
+
+COUNTS = [500, 10000, 1000000]
+
+# 逐次計算は足1本毎の処理(Python)なので、この本数までにする（100万本は計測しない）
+STREAM_MAX = 10000
+
+
+# ==============================================================
+# pandas の rolling / ewm による計算（値の定義が異なるものは差として表示される）
+# ==============================================================
+def _ewm(s, alpha):
+    return s.ewm(alpha=alpha, adjust=False).mean()
+
+
+def _pandas_rsi(close, n=14):
+    diff = pd.Series(close).diff()
+    gain = _ewm(diff.clip(lower=0), 1.0 / n)
+    loss = _ewm(-diff.clip(upper=0), 1.0 / n)
+    return (100.0 * gain / (gain + loss)).values
+
+
+def _pandas_true_range(high, low, close):
+    prev = pd.Series(close).shift()
+    return (
+        pd.concat(
+            [
+                pd.Series(high - low),
+                (pd.Series(high) - prev).abs(),
+                (pd.Series(low) - prev).abs(),
+            ],
+            axis=1,
+        )
+        .max(axis=1, skipna=False)
+        .values
+    )
+
+
+def _pandas_macd(close, fast=12, slow=26, signal=9):
+    s = pd.Series(close)
+    line = _ewm(s, 2.0 / (fast + 1)) - _ewm(s, 2.0 / (slow + 1))
+    sig = _ewm(line, 2.0 / (signal + 1))
+    return line.values, sig.values, (line - sig).values
+
+
+def _pandas_bollinger(x, n=20, k=2.0):
+    r = pd.Series(x).rolling(n)
+    middle, width = r.mean(), k * r.std(ddof=0)
+    return (middle + width).values, middle.values, (middle - width).values
+
+
+def _pandas_donchian(high, low, n=20):
+    upper = pd.Series(high).rolling(n).max()
+    lower = pd.Series(low).rolling(n).min()
+    return upper.values, ((upper + lower) / 2.0).values, lower.values
+
+
+def _pandas_vwap(high, low, close, volume):
+    pv = pd.Series((high + low + close) / 3.0 * volume)
+    return (pv.cumsum() / pd.Series(volume).cumsum()).values
+
+
+PANDAS = {
+    "sma": lambda x, n: pd.Series(x).rolling(n).mean().values,
+    "ema": lambda x, n: _ewm(pd.Series(x), 2.0 / (n + 1)).values,
+    "stddev": lambda x, n: pd.Series(x).rolling(n).std(ddof=0).values,
+    "bollinger": _pandas_bollinger,
+    "rsi": _pandas_rsi,
+    "true_range": _pandas_true_range,
+    "atr": lambda high, low, close, n=14: _ewm(
+        pd.Series(_pandas_true_range(high, low, close)), 1.0 / n
+    ).values,
+    "macd": _pandas_macd,
+    "donchian": _pandas_donchian,
+    "vwap": _pandas_vwap,
+}
+
+# 逐次計算インジケータ（n は backend.arguments と同じ14）
+STREAMING = {
+    "sma": lambda: streaming.SMA(14),
+    "ema": lambda: streaming.EMA(14),
+    "wma": lambda: streaming.WMA(14),
+    "stddev": lambda: streaming.StdDev(14),
+    "bollinger": lambda: streaming.Bollinger(),
+    "rsi": lambda: streaming.RSI(),
+    "atr": lambda: streaming.ATR(),
+    "macd": lambda: streaming.MACD(),
+    "donchian": lambda: streaming.Donchian(),
+    "vwap": lambda: streaming.VWAP(),
+}
+
+
+# ==============================================================
+# numpy との最大の相対誤差（NaN の位置が異なる部分は比較しない）
+# ==============================================================
+def difference(expected, actual):
+    if not isinstance(expected, tuple):
+        expected, actual = (expected,), (actual,)
+    diff = 0.0
+    for e, a in zip(expected, actual):
+        e, a = np.asarray(e, dtype=np.float64), np.asarray(a, dtype=np.float64)
+        mask = ~np.isnan(e) & ~np.isnan(a)
+        if mask.any():
+            error = np.abs(e[mask] - a[mask]) / np.maximum(np.abs(e[mask]), 1.0)
+            diff = max(diff, float(error.max()))
+    return diff
+
+
+def rate(count, elapsed):
+    if elapsed <= 0:
+        return "{:>14}".format("-")
+    return "{:>12,.0f}/s".format(count / elapsed)
+
+
+def bench(name, count, data, bars):
+    args, params = backend.arguments(name, data)
+    number = max(1, 100000 // count)
+    expected = backend.function(name, "numpy")(*args, **params)
+
+    functions = [("numpy", backend.function(name, "numpy"))]
+    if name in PANDAS:
+        functions.append(("pandas", PANDAS[name]))
+    if name in backend.BACKENDS.get("talib", {}):
+        functions.append(("talib", backend.function(name, "talib")))
+
+    for label, func in functions:
+        elapsed = timeit.timeit(lambda: func(*args, **params), number=number)
+        diff = difference(expected, func(*args, **params))
+        print(
+            "{:<10} {:>8} {:<10} {}  diff {:.2e}".format(
+                name, count, label, rate(count * number, elapsed), diff
+            )
+        )
+
+    if name in STREAMING and count <= STREAM_MAX:
+        indicator = STREAMING[name]()
+        start = timeit.default_timer()
+        values = [indicator.update(bar) for bar in bars]
+        elapsed = timeit.default_timer() - start
+        last = expected[-1] if not isinstance(expected, tuple) else expected[0][-1]
+        value = values[-1] if not isinstance(values[-1], tuple) else values[-1][0]
+        print(
+            "{:<10} {:>8} {:<10} {}  diff {:.2e}".format(
+                name,
+                count,
+                "streaming",
+                rate(count, elapsed),
+                abs(value - last) / max(abs(last), 1.0),
+            )
+        )
+
+
+# ==============================================================
+# パラメータ一括計算と、パラメータ毎の計算の比較
+# ==============================================================
+def bench_sweep(count, data):
+    close = data["close"]
+    periods = list(range(5, 205, 2))
+    for name, batch, single in [
+        ("sma_sweep", sweep.sma_sweep, backend.BACKENDS["numpy"]["sma"]),
+        (
+            "ema_sweep",
+            lambda x, p: sweep.ema_sweep(x, periods=p),
+            backend.BACKENDS["numpy"]["ema"],
+        ),
+    ]:
+        number = max(1, 10000 // count)
+        t_batch = timeit.timeit(lambda: batch(close, periods), number=number)
+        t_loop = timeit.timeit(
+            lambda: [single(close, n) for n in periods], number=number
+        )
+        print(
+            "{:<10} {:>8} x{:<4} loop {:9.3f}ms  sweep {:9.3f}ms  x{:.1f}".format(
+                name,
+                count,
+                len(periods),
+                t_loop / number * 1000,
+                t_batch / number * 1000,
+                t_loop / t_batch,
+            )
+        )
+
+
+if __name__ == "__main__":
+    counts = [int(c) for c in sys.argv[1:]] or COUNTS
+    for count in counts:
+        data = backend.sample(count)
+        bars = np.column_stack(
+            [
+                np.arange(count),
+                data["open"],
+                data["high"],
+                data["low"],
+                data["close"],
+                data["volume"],
+            ]
+        ).tolist()
+        for name in backend.NAMES:
+            bench(name, count, data, bars)
+        bench_sweep(count, data)
+    print("auto: {}".format(dict([(n, backend.select(n)) for n in backend.NAMES])))
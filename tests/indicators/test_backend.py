@@ -0,0 +1,110 @@
+# インジケータの計算方法(backend)
+import math
+
+import numpy as np
+import pytest
+
+from indicators import backend
+
+
+def test_numpy_backend():
+    data = backend.sample(300)
+    for name in backend.NAMES:
+        args, params = backend.arguments(name, data)
+        assert backend.difference(name, "numpy", 300) == 0.0
+        assert backend.function(name, "numpy") is backend.BACKENDS["numpy"][name]
+        backend.function(name, "numpy")(*args, **params)
+    with pytest.raises(ValueError):
+        backend.function("unknown")
+    with pytest.raises(ValueError):
+        backend.function("sma", "unknown")
+
+
+def test_auto_selects_fastest_matching_backend(monkeypatch):
+    numpy = backend.BACKENDS["numpy"]
+
+    def wrong(x, n):
+        return numpy["sma"](x, n) + 1.0
+
+    monkeypatch.setattr(
+        backend,
+        "BACKENDS",
+        {"numpy": numpy, "fast": {"ema": numpy["ema"], "sma": wrong}},
+    )
+    monkeypatch.setattr(backend, "_selected", {})
+    times = {"numpy": 2.0, "fast": 1.0}
+    monkeypatch.setattr(backend, "measure", lambda name, b: times[b])
+
+    # 値が一致する中で最も速いもの
+    assert backend.select("ema") == "fast"
+    # 値が異なるものは選ばない
+    assert backend.select("sma") == "numpy"
+    # 他の計算方法が無いものは計測しない
+    assert backend.select("vwap") == "numpy"
+    # 無いインジケータは numpy で計算する
+    assert backend.function("vwap", "fast") is numpy["vwap"]
+
+
+def test_talib_parity():
+    # TA-Lib がインストールされている環境のみ（無い環境では下の定義との一致だけを確認する）
+    pytest.importorskip("talib")
+    for name in backend.BACKENDS["talib"]:
+        if name != "macd":
+            assert backend.difference(name, "talib") < 1e-9, name
+
+
+# ==============================================================
+# TA-Lib の定義どおりに1本ずつ計算した値（TA-Lib が無い環境でも定義との一致を確認する）
+#   EMA は先頭 n 本の SMA、RSI・ATR は先頭 n 本の平均を初期値とする Wilder の平滑化
+# ==============================================================
+def reference(name, high, low, close, n):
+    out = [math.nan] * len(close)
+    if name == "sma":
+        for i in range(n - 1, len(close)):
+            out[i] = sum(close[i - n + 1 : i + 1]) / n
+    elif name == "ema":
+        out[n - 1] = sum(close[:n]) / n
+        for i in range(n, len(close)):
+            out[i] = out[i - 1] + 2.0 / (n + 1) * (close[i] - out[i - 1])
+    elif name == "wma":
+        for i in range(n - 1, len(close)):
+            window = close[i - n + 1 : i + 1]
+            weighted = sum([(k + 1) * v for k, v in enumerate(window)])
+            out[i] = weighted / (n * (n + 1) / 2)
+    elif name == "stddev":
+        for i in range(n - 1, len(close)):
+            window = close[i - n + 1 : i + 1]
+            mean = sum(window) / n
+            out[i] = math.sqrt(sum([(v - mean) ** 2 for v in window]) / n)
+    elif name == "rsi":
+        diff = [close[i] - close[i - 1] for i in range(1, len(close))]
+        gain = sum([max(d, 0.0) for d in diff[:n]]) / n
+        loss = sum([max(-d, 0.0) for d in diff[:n]]) / n
+        out[n] = 100.0 * gain / (gain + loss)
+        for i in range(n + 1, len(close)):
+            gain = (gain * (n - 1) + max(diff[i - 1], 0.0)) / n
+            loss = (loss * (n - 1) + max(-diff[i - 1], 0.0)) / n
+            out[i] = 100.0 * gain / (gain + loss)
+    elif name == "atr":
+        tr = [math.nan] + [
+            max(high[i], close[i - 1]) - min(low[i], close[i - 1])
+            for i in range(1, len(close))
+        ]
+        out[n] = sum(tr[1 : n + 1]) / n
+        for i in range(n + 1, len(close)):
+            out[i] = (out[i - 1] * (n - 1) + tr[i]) / n
+    return np.array(out)
+
+
+def test_numpy_matches_talib_definitions():
+    data = backend.sample(80)
+    high, low, close = [list(data[c]) for c in ["high", "low", "close"]]
+    for name in ["sma", "ema", "wma", "stddev", "rsi", "atr"]:
+        expected = reference(name, high, low, close, 14)
+        if name == "atr":
+            actual = backend.function(name, "numpy")(high, low, close, 14)
+        else:
+            actual = backend.function(name, "numpy")(close, 14)
+        assert (np.isnan(actual) == np.isnan(expected)).all(), name
+        mask = ~np.isnan(expected)
+        assert np.allclose(actual[mask], expected[mask], rtol=1e-9), name
@@ -0,0 +1,67 @@
+# インジケータのキャッシュ
+import numpy as np
+import pandas as pd
+
+from indicators import rsi
+from indicators.cache import IndicatorCache, evaluate
+
+
+def test_lru_and_stats():
+    cache = IndicatorCache(maxsize=2)
+    calls = []
+
+    def compute(value):
+        calls.append(value)
+        return np.array([value])
+
+    a = cache.get("BTC/USD", "1h", "sma", {"n": 20}, 100, lambda: compute(1.0))
+    b = cache.get("BTC/USD", "1h", "sma", {"n": 20}, 100, lambda: compute(2.0))
+    assert a is b and calls == [1.0]
+    # 共有する配列は書き込み不可
+    assert not a.flags.writeable
+
+    cache.get("BTC/USD", "1h", "sma", {"n": 50}, 100, lambda: compute(3.0))
+    cache.get("BTC/USD", "1h", "sma", {"n": 20}, 100, lambda: compute(4.0))
+    cache.get("BTC/USD", "5m", "sma", {"n": 20}, 100, lambda: compute(5.0))
+    # 最も古く参照された n=50 が捨てられる
+    cache.get("BTC/USD", "1h", "sma", {"n": 50}, 100, lambda: compute(6.0))
+    assert calls == [1.0, 3.0, 5.0, 6.0]
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (2, 4, 2)
+    assert stats["size"] == 2 and stats["hit_rate"] == 2 / 6.0
+
+
+def test_invalidate_older_bars():
+    cache = IndicatorCache()
+    for ts in [100, 200]:
+        cache.get("BTC/USD", "1h", "rsi", {"n": 14}, ts, lambda: 1)
+    cache.get("BTC/USD", "5m", "rsi", {"n": 14}, 100, lambda: 1)
+    cache.invalidate("BTC/USD", "1h", 200)
+    assert len(cache) == 2
+    cache.invalidate("BTC/USD", "1h")
+    assert len(cache) == 1
+
+
+def test_evaluate():
+    close = np.linspace(100.0, 200.0, 50) + np.sin(np.arange(50))
+    df = pd.DataFrame(
+        {
+            "open": close,
+            "high": close + 1,
+            "low": close - 1,
+            "close": close,
+            "volume": np.ones(50),
+        }
+    )
+    assert np.allclose(evaluate("rsi", df, n=14)[14:], rsi(close, 14)[14:])
+    upper, middle, lower = evaluate("donchian", df, n=5)
+    assert upper[-1] == close[-5:].max() + 1
+    expected = pd.Series(close + 1).rolling(5).mean().values
+    assert np.allclose(evaluate("sma", df, source="high", n=5)[4:], expected[4:])
+    for name in ["_smooth", "unknown", "np"]:
+        try:
+            evaluate(name, df)
+            assert False
+        except ValueError:
+            pass
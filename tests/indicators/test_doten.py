@@ -0,0 +1,59 @@
+# ドテン君のシグナル
+import numpy as np
+
+from indicators import Doten, doten_signal, range_mean
+
+
+def make_ohlc(count=500, seed=3):
+    rng = np.random.RandomState(seed)
+    close = 10000.0 + np.cumsum(rng.normal(0, 10, count))
+    open = close + rng.normal(0, 3, count)
+    high = np.maximum(open, close) + rng.uniform(0, 15, count)
+    low = np.minimum(open, close) - rng.uniform(0, 15, count)
+    return open, high, low, close
+
+
+def naive_signal(open, high, low, n, k):
+    # 以前の Puppet の計算（直前の n 本の値幅の平均）
+    out = [0] * len(open)
+    for i in range(n, len(open)):
+        mean = sum(high[i - n : i] - low[i - n : i]) / n
+        if high[i] > open[i] + mean * k:
+            out[i] = 1
+        elif low[i] < open[i] - mean * k:
+            out[i] = -1
+    return np.array(out)
+
+
+def test_vectorized_signal():
+    open, high, low, close = make_ohlc()
+    for n, k in [(18, 1.6), (1, 1.0), (5, 0.5)]:
+        expected = naive_signal(open, high, low, n, k)
+        signal = doten_signal(open, high, low, n, k)
+        assert (signal == expected).all()
+    assert set(signal) == set([-1, 0, 1])
+    mean = range_mean(high, low, 18)
+    assert np.isnan(mean[:18]).all()
+    assert np.isclose(mean[-1], (high[-19:-1] - low[-19:-1]).mean())
+    # 本数が足りない場合はシグナル無し
+    assert (doten_signal(open[:5], high[:5], low[:5], 18, 1.6) == 0).all()
+
+
+def test_streaming_signal():
+    open, high, low, close = make_ohlc()
+    bars = [[i, open[i], high[i], low[i], close[i], 1.0] for i in range(len(open))]
+    expected = doten_signal(open, high, low, 18, 1.6)
+
+    doten = Doten(18, 1.6)
+    signals = []
+    for bar in bars:
+        # 未確定足のシグナルは、確定した時のシグナルと同じ
+        preview = doten.preview(bar)
+        signals.append(doten.update(bar))
+        assert preview == signals[-1]
+    assert signals == list(expected)
+
+    doten.reset()
+    assert doten.load(bars[:-1]) == expected[-2]
+    live = {"open": open[-1], "high": high[-1], "low": low[-1]}
+    assert doten.preview(live) == expected[-1]
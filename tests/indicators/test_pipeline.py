@@ -0,0 +1,112 @@
+# インジケータのパイプライン
+import numpy as np
+import pandas as pd
+
+from indicators import ema, rsi, bollinger
+from indicators.cache import evaluate
+from indicators.pipeline import IndicatorPipeline
+
+
+class FakeCandle:
+    def __init__(self, n=100):
+        self.calls = []
+        self.subscribers = []
+        self._versions = {"15m": 1, "1h": 1}
+        self.set_close(100.0 + np.cumsum(np.sin(np.arange(n))))
+
+    def set_close(self, close):
+        self.close = close
+        self.df = pd.DataFrame(
+            {
+                "open": close,
+                "high": close + 1,
+                "low": close - 1,
+                "close": close,
+                "volume": np.ones(len(close)),
+            }
+        )
+
+    def close_bar(self, price, span):
+        self.set_close(np.append(self.close, price))
+        self._versions[span] += 1
+        for spans, callback in self.subscribers:
+            if span in spans:
+                callback(span, None)
+
+    def version(self, span=None):
+        return self._versions[span]
+
+    def subscribe(self, callback, spans=None):
+        self.subscribers.append((set(spans), callback))
+
+    def indicator(self, span, name, source="close", **params):
+        self.calls.append((span, name))
+        return evaluate(name, self.df, source, **params)
+
+
+def test_pipeline():
+    candle = FakeCandle()
+    pipeline = IndicatorPipeline(
+        candle,
+        [
+            {"name": "ema", "span": "1h", "period": 50},
+            {"id": "rsi", "name": "rsi", "span": "15m", "period": 14},
+            {"id": "rsi_ema", "name": "ema", "span": "15m", "n": 9, "source": "rsi"},
+            {"id": "bb", "name": "bollinger", "span": "15m", "n": 20, "k": 2.0},
+            {"id": "bb_upper", "name": "sma", "span": "15m", "n": 3, "source": "bb"},
+            {"id": "rsi_bb", "name": "bollinger", "span": "15m", "source": "rsi"},
+            # 同じ計算は1回だけ
+            {"id": "rsi14", "name": "rsi", "span": "15m", "n": 14},
+        ],
+    )
+    values = pipeline.values()
+    assert sorted(values.keys()) == sorted(
+        ["ema_50_1h", "rsi", "rsi_ema", "bb", "bb_upper", "rsi_bb", "rsi14"]
+    )
+    close = candle.close
+    assert np.allclose(values["ema_50_1h"][49:], ema(close, 50)[49:])
+    assert values["rsi"] is values["rsi14"]
+    assert np.allclose(values["rsi_ema"][22:], ema(rsi(close, 14)[14:], 9)[8:])
+    upper = bollinger(close, 20, 2.0)[0]
+    expected = (upper[19:-2] + upper[20:-1] + upper[21:]) / 3
+    assert np.allclose(values["bb_upper"][21:], expected)
+    assert np.isclose(values["rsi_bb"][2][-1], bollinger(rsi(close, 14)[14:])[2][-1])
+    assert not values["rsi_ema"].flags.writeable
+    calls = [("15m", "bollinger"), ("15m", "rsi"), ("1h", "ema")]
+    assert sorted(candle.calls) == calls
+
+    # 確定していなければ計算しない
+    assert pipeline.values() is values
+    assert len(candle.calls) == 3
+
+    # 足が確定したタイムフレームだけ計算し直す
+    candle.close_bar(200.0, "15m")
+    values = pipeline.values()
+    assert len(values["rsi"]) == 101 and len(candle.calls) == 5
+    assert np.isclose(values["rsi"][-1], rsi(candle.close, 14)[-1])
+
+
+def test_invalid_specs():
+    for specs in [
+        [{"name": "unknown", "span": "1h"}],
+        [{"name": "ema", "span": "1h", "period": 5, "m": 1}],
+        [{"name": "ema", "span": "1h", "source": "rsi"}],
+        [
+            {"id": "a", "name": "ema", "span": "1h", "source": "b"},
+            {"id": "b", "name": "ema", "span": "1h", "source": "a"},
+        ],
+        [
+            {"id": "a", "name": "rsi", "span": "1h"},
+            {"name": "ema", "span": "15m", "source": "a"},
+        ],
+        [
+            {"id": "a", "name": "rsi", "span": "1h"},
+            {"name": "atr", "span": "1h", "source": "a"},
+        ],
+        [{"name": "ema", "span": "1h"}, {"name": "ema", "span": "1h"}],
+    ]:
+        try:
+            IndicatorPipeline(FakeCandle(), specs)
+            assert False, specs
+        except ValueError:
+            pass
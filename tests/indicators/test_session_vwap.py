@@ -0,0 +1,101 @@
+# セッションVWAP・TWAP
+import json
+import math
+
+import pytest
+
+from indicators import SessionVWAP, vwap
+from indicators.session_vwap import HOUR
+
+DAY = 24 * HOUR
+
+
+def test_trades_vwap_and_twap():
+    v = SessionVWAP()
+    assert math.isnan(v.vwap()) and math.isnan(v.twap())
+    v.add(1000, 100.0, 1)
+    assert v.twap() == 100.0
+    v.add(11000, 110.0, 3)
+    assert v.vwap() == v.value == (100.0 + 330.0) / 4
+    # 100 を10秒、110 を参照時刻まで10秒保持した
+    assert v.twap() == 100.0
+    assert v.twap(21000) == 105.0
+
+
+def test_session_reset():
+    v = SessionVWAP("day")
+    v.add(DAY - 1000, 100.0, 1)
+    v.add(DAY + 1000, 200.0, 1)
+    assert v.vwap() == 200.0
+    # 前日の最後の約定価格は、セッションの開始から保持したとみなす
+    assert v.twap() == 100.0
+    assert math.isnan(v.vwap(2 * DAY))
+    assert v.twap(2 * DAY + 1000) == 200.0
+
+    # Funding は UTC 4時, 12時, 20時 に替わる
+    f = SessionVWAP("funding")
+    f.add(3 * HOUR, 100.0, 1)
+    f.add(5 * HOUR, 200.0, 1)
+    f.add(11 * HOUR, 300.0, 1)
+    assert f.vwap() == 250.0
+    assert math.isnan(f.vwap(12 * HOUR))
+
+    with pytest.raises(ValueError):
+        SessionVWAP("week")
+
+
+def test_rolling_window():
+    v = SessionVWAP(window=60)
+    v.add(1000, 100.0, 1)
+    v.add(30000, 110.0, 1)
+    assert v.vwap(60000) == 105.0
+    assert v.vwap(61000) == 110.0
+    assert math.isnan(v.vwap(90000))
+
+
+def test_bars_match_cumulative_vwap():
+    bars = [
+        [i * 60000, 0.0, 100.0 + i, 90.0 + i, 95.0 + i, 1.0 + i % 3]
+        for i in range(50)
+    ]
+    v = SessionVWAP()
+    v.load(bars)
+    h, l, c, vol = [[b[k] for b in bars] for k in range(2, 6)]
+    assert v.value == pytest.approx(vwap(h, l, c, vol)[-1])
+    typical = [(a + b + d) / 3.0 for a, b, d in zip(h, l, c)]
+    assert v.twap() == pytest.approx(sum(typical) / 50)
+
+    # 直近5本（5分）と、未確定足を含めた値
+    w = SessionVWAP(window=300)
+    w.load(bars)
+    assert w.value == pytest.approx(vwap(h[-5:], l[-5:], c[-5:], vol[-5:])[-1])
+    live = [50 * 60000, 0.0, 200.0, 190.0, 195.0, 2.0]
+    expected = SessionVWAP(window=300)
+    expected.load(bars + [live])
+    assert w.preview(live) == pytest.approx(expected.value)
+    assert w.value == pytest.approx(vwap(h[-5:], l[-5:], c[-5:], vol[-5:])[-1])
+
+    # websocketの5秒足（timestampは秒）
+    d = SessionVWAP("day")
+    bar = {"high": 2, "low": 1, "close": 3, "volume": 1}
+    d.update(dict(bar, timestamp=DAY / 1000 - 5))
+    d.update(dict(bar, timestamp=DAY / 1000, high=4, low=5, close=6))
+    assert d.value == 5.0
+
+
+def test_state_round_trip():
+    v = SessionVWAP("day", window=3600)
+    for i in range(10):
+        v.add(DAY + i * 1000, 100.0 + i, 1 + i)
+    state = json.loads(json.dumps(v.state()))
+
+    restored = SessionVWAP("day", window=3600)
+    assert restored.restore(state)
+    assert restored.vwap() == v.vwap()
+    assert restored.twap(DAY + 20000) == v.twap(DAY + 20000)
+    restored.add(DAY + 30000, 120.0, 1)
+    v.add(DAY + 30000, 120.0, 1)
+    assert restored.vwap() == v.vwap()
+
+    # 設定が異なる状態は復元しない
+    assert not SessionVWAP("funding", window=3600).restore(state)
@@ -0,0 +1,105 @@
+# 逐次計算インジケータ（ベクトル化インジケータとの比較）
+import math
+
+import numpy as np
+
+from indicators import (
+    ATR,
+    EMA,
+    MACD,
+    RSI,
+    SMA,
+    VWAP,
+    WMA,
+    Bollinger,
+    Donchian,
+    StdDev,
+    atr,
+    bollinger,
+    donchian,
+    ema,
+    macd,
+    rsi,
+    sma,
+    stddev,
+    vwap,
+    wma,
+)
+
+
+def make_bars(count=300, seed=2):
+    rng = np.random.RandomState(seed)
+    close = 10000.0 + np.cumsum(rng.normal(0, 10, count))
+    high = close + rng.uniform(0, 5, count)
+    low = close - rng.uniform(0, 5, count)
+    volume = rng.uniform(0, 100, count)
+    bars = [
+        [i * 60000, close[i], high[i], low[i], close[i], volume[i]]
+        for i in range(count)
+    ]
+    return bars, high, low, close, volume
+
+
+def same(a, b, tol=1e-6):
+    if isinstance(a, tuple):
+        return all([same(x, y, tol) for x, y in zip(a, b)])
+    if math.isnan(a) or math.isnan(b):
+        return math.isnan(a) and math.isnan(b)
+    return abs(a - b) <= tol * max(1.0, abs(b))
+
+
+def check(indicator, expected, bars):
+    for i, bar in enumerate(bars):
+        # 未確定足として渡した値と、確定足で更新した値は同じ
+        preview = indicator.preview(bar)
+        value = indicator.update(bar)
+        if isinstance(expected, tuple):
+            want = tuple([e[i] for e in expected])
+        else:
+            want = expected[i]
+        assert same(value, want), (i, value, want)
+        assert same(preview, value), (i, preview, value)
+
+
+def test_matches_vectorized():
+    bars, high, low, close, volume = make_bars()
+    check(SMA(20), sma(close, 20), bars)
+    check(EMA(20), ema(close, 20), bars)
+    check(WMA(10), wma(close, 10), bars)
+    check(StdDev(20), stddev(close, 20), bars)
+    check(StdDev(20, ddof=1), stddev(close, 20, ddof=1), bars)
+    check(Bollinger(20, 2.0), bollinger(close, 20, 2.0), bars)
+    check(RSI(14), rsi(close, 14), bars)
+    check(ATR(14), atr(high, low, close, 14), bars)
+    check(MACD(12, 26, 9), macd(close, 12, 26, 9), bars)
+    check(Donchian(20), donchian(high, low, 20), bars)
+    check(VWAP(), vwap(high, low, close, volume), bars)
+    check(VWAP(30), vwap(high, low, close, volume, 30), bars)
+
+
+def test_stddev_on_long_trending_series():
+    noise = np.random.RandomState(3).normal(0, 0.01, 50000)
+    close = 1e6 + np.arange(50000) * 1.0 + noise
+    close[40000:40020] = close[40000]
+    indicator = StdDev(20)
+    values = [indicator.update([i, c, c, c, c, 1.0]) for i, c in enumerate(close)]
+    assert values[40019] < 1e-6
+    assert same(values[-1], stddev(close, 20)[-1], 1e-9)
+
+
+def test_preview_does_not_change_state():
+    bars, high, low, close, volume = make_bars(50)
+    indicator = EMA(10)
+    indicator.load(bars[:-1])
+    value = indicator.value
+    partial = list(bars[-1])
+    for price in [9000.0, 11000.0, partial[4]]:
+        partial[4] = price
+        indicator.preview(partial)
+    assert indicator.value == value
+    assert indicator.count == 49
+    assert same(indicator.update(bars[-1]), ema(close, 10)[-1])
+
+    # websocketの5秒足(辞書)も渡せる
+    candle = {"open": 1.0, "high": 3.0, "low": 0.5, "close": 2.0, "volume": 1.0}
+    assert Donchian(1).update(candle) == (3.0, 1.75, 0.5)
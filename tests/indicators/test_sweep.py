@@ -0,0 +1,51 @@
+# インジケータのパラメータ一括計算
+import numpy as np
+import pytest
+
+from indicators import ema, sma, ema_sweep, range_mean_sweep, sma_sweep
+
+
+def make_close(count=3000, seed=2):
+    rng = np.random.RandomState(seed)
+    return 10000.0 + np.cumsum(rng.normal(0, 10, count))
+
+
+def assert_rows(actual, expected):
+    assert actual.shape == (len(expected), len(expected[0]))
+    for a, e in zip(actual, expected):
+        assert (np.isnan(a) == np.isnan(e)).all()
+        mask = ~np.isnan(e)
+        assert np.allclose(a[mask], e[mask], rtol=1e-10, atol=1e-8)
+
+
+def test_sma_sweep():
+    close = make_close()
+    periods = list(range(5, 201))
+    assert_rows(sma_sweep(close, periods), [sma(close, n) for n in periods])
+    # 本数より長い期間は NaN
+    assert np.isnan(sma_sweep(close[:10], [20])).all()
+
+    high, low = close + 3.0, close - 2.0
+    assert np.allclose(range_mean_sweep(high, low, [5, 18])[:, 17:], 5.0)
+
+
+def test_ema_sweep():
+    close = make_close()
+    # ブロックの長さが異なる期間(1: 入力そのもの, 2: 短いブロック, 1000: 長いブロック)
+    periods = [1, 2, 3, 9, 20, 50, 200, 1000, 5000]
+    assert_rows(ema_sweep(close, periods=periods), [ema(close, n) for n in periods])
+
+    alphas = [1.0, 0.5, 0.01]
+    expected = []
+    for alpha in alphas:
+        y = [close[0]]
+        for v in close[1:]:
+            y.append(alpha * v + (1 - alpha) * y[-1])
+        expected.append(y)
+    assert_rows(ema_sweep(close, alphas=alphas), np.array(expected))
+
+    for kwargs in [{}, {"periods": [5], "alphas": [0.1]}, {"alphas": [0.0]}]:
+        with pytest.raises(ValueError):
+            ema_sweep(close, **kwargs)
+    with pytest.raises(ValueError):
+        sma_sweep(close, [0])
@@ -0,0 +1,114 @@
+# ベクトル化インジケータ（pandas・素朴な実装との比較）
+import numpy as np
+import pandas as pd
+
+from indicators import (
+    atr,
+    bollinger,
+    donchian,
+    ema,
+    macd,
+    rsi,
+    sma,
+    stddev,
+    vwap,
+    wma,
+)
+
+
+def make_ohlcv(count=600, seed=1):
+    rng = np.random.RandomState(seed)
+    close = 10000.0 + np.cumsum(rng.normal(0, 10, count))
+    high = close + rng.uniform(0, 5, count)
+    low = close - rng.uniform(0, 5, count)
+    volume = rng.uniform(0, 100, count)
+    return high, low, close, volume
+
+
+def seeded(x, n, alpha):
+    # TA-Lib と同じ初期値(先頭 n 本の平均)の指数平滑
+    out = [np.nan] * len(x)
+    out[n - 1] = np.mean(x[:n])
+    for i in range(n, len(x)):
+        out[i] = alpha * x[i] + (1 - alpha) * out[i - 1]
+    return np.array(out)
+
+
+def assert_close(actual, expected, tol=1e-8):
+    actual, expected = np.asarray(actual), np.asarray(expected)
+    assert actual.shape == expected.shape
+    assert (np.isnan(actual) == np.isnan(expected)).all()
+    mask = ~np.isnan(expected)
+    assert np.allclose(actual[mask], expected[mask], rtol=tol, atol=tol)
+
+
+def test_stddev_on_long_trending_series():
+    # 大きな値とトレンドがあっても、値が一定の窓は0（累積和の差では桁落ちする）
+    rng = np.random.RandomState(3)
+    close = 1e6 + np.arange(200000) * 1.0 + rng.normal(0, 0.01, 200000)
+    close[150000:150020] = close[150000]
+    assert stddev(close, 20)[150019] < 1e-6
+    # 窓毎に計算した値と一致する（pandas の rolling も長い系列では誤差が溜まる）
+    last = range(len(close) - 1000, len(close))
+    expected = [close[i - 19 : i + 1].std() for i in last]
+    assert_close(stddev(close, 20)[-1000:], expected, tol=1e-9)
+
+
+def test_moving_averages():
+    high, low, close, volume = make_ohlcv()
+    s = pd.Series(close)
+    assert_close(sma(close, 20), s.rolling(20).mean())
+    assert_close(stddev(close, 20), s.rolling(20).std(ddof=0))
+    assert_close(stddev(list(close), 20, ddof=1), s.rolling(20).std())
+    weights = np.arange(1, 11)
+    assert_close(
+        wma(close, 10),
+        s.rolling(10).apply(lambda w: (w * weights).sum() / weights.sum(), raw=True),
+    )
+    # 平滑化係数が大きい(ブロックが短い)場合も同じ
+    for n in [2, 14, 200]:
+        assert_close(ema(close, n), seeded(close, n, 2.0 / (n + 1)))
+
+    upper, middle, lower = bollinger(close, 20, 2.0)
+    assert_close(upper - middle, 2.0 * s.rolling(20).std(ddof=0))
+
+
+def test_oscillators():
+    high, low, close, volume = make_ohlcv()
+    diff = np.diff(close)
+    gain = seeded(np.maximum(diff, 0), 14, 1 / 14.0)
+    loss = seeded(np.maximum(-diff, 0), 14, 1 / 14.0)
+    expected = np.concatenate(([np.nan], 100 * gain / (gain + loss)))
+    assert_close(rsi(close, 14), expected)
+
+    prev = np.concatenate(([np.nan], close[:-1]))
+    tr = np.maximum(high - low, np.maximum(abs(high - prev), abs(low - prev)))
+    assert_close(atr(high, low, close, 14)[1:], seeded(tr[1:], 14, 1 / 14.0))
+
+    line, signal, hist = macd(close)
+    expected = seeded(close, 12, 2 / 13.0) - seeded(close, 26, 2 / 27.0)
+    assert_close(line, expected)
+    assert_close(signal[25:], seeded(expected[25:], 9, 0.2))
+    assert_close(hist, line - signal)
+
+
+def test_channels_and_vwap():
+    high, low, close, volume = make_ohlcv()
+    upper, middle, lower = donchian(high, low, 20)
+    assert_close(upper, pd.Series(high).rolling(20).max())
+    assert_close(lower, pd.Series(low).rolling(20).min())
+
+    tp = (high + low + close) / 3
+    expected = np.cumsum(tp * volume) / np.cumsum(volume)
+    assert_close(vwap(high, low, close, volume), expected)
+    assert_close(
+        vwap(high, low, close, volume, 30),
+        pd.Series(tp * volume).rolling(30).sum() / pd.Series(volume).rolling(30).sum(),
+    )
+
+
+def test_short_input():
+    assert np.isnan(sma([1.0, 2.0], 5)).all()
+    assert np.isnan(ema([1.0, 2.0], 5)).all()
+    assert np.isnan(rsi([1.0, 2.0], 14)).all()
+    assert len(donchian([], [], 3)[0]) == 0
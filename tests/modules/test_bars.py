@@ -0,0 +1,116 @@
+# 約定から作る足
+import logging
+
+import pytest
+
+from modules.bars import DollarBar, RangeBar, TickBar, TradeBar, TradeBars, VolumeBar
+
+
+class FakeWebsocket:
+    def __init__(self):
+        self.listeners = {}
+
+    def add_listener(self, table, callback):
+        self.listeners.setdefault(table, []).append(callback)
+
+    def send(self, action, trades):
+        data = [
+            {
+                "timestamp": "2019-07-01T00:00:{:06.3f}Z".format(i),
+                "price": price,
+                "size": size,
+                "side": "Buy",
+                "foreignNotional": size,
+                "homeNotional": size / price,
+            }
+            for i, (price, size) in enumerate(trades)
+        ]
+        for callback in self.listeners["trade"]:
+            callback(action, data)
+
+
+class FakePuppeteer:
+    def __init__(self, config):
+        self._exchange = None
+        self._logger = logging.getLogger(__name__)
+        self._config = {"TRADE_BARS": config}
+        self._ws = FakeWebsocket()
+        self._bitmex = None
+        self._discord = None
+
+
+def test_tick_bar():
+    bar = TickBar(3)
+    closed = [bar.update(i, 100.0 + i, 1, 100.0) for i in range(7)]
+    assert [b is not None for b in closed] == [False, False, True] * 2 + [False]
+    assert bar.closed()[0] == [0, 100.0, 102.0, 100.0, 102.0, 3, 300.0, 3, 2]
+    assert bar.live_bar() == [6, 106.0, 106.0, 106.0, 106.0, 1, 100.0, 1, 6]
+    assert bar.last_timestamp() == 3
+    assert bar.column("close") == [102.0, 105.0]
+
+    # 基底クラスは確定条件が無いので生成できない
+    with pytest.raises(TypeError):
+        TradeBar(3)
+
+
+def test_volume_and_dollar_bar():
+    volume = VolumeBar(10)
+    dollar = DollarBar(1000.0)
+    for i, size in enumerate([4, 4, 5, 20, 1]):
+        volume.update(i, 100.0, size, size * 100.0)
+        dollar.update(i, 100.0, size, size * 100.0)
+
+    # 閾値を超えた約定は分割せずに確定する
+    assert volume.column("volume") == [13, 20]
+    assert dollar.column("notional") == [1300.0, 2000.0]
+    assert volume.live_bar()[5] == 1
+
+
+def test_range_bar():
+    bar = RangeBar(5.0)
+    for i, price in enumerate([100.0, 102.0, 98.0, 95.0, 96.0, 100.5]):
+        bar.update(i, price, 1)
+    assert bar.closed() == [[0, 100.0, 102.0, 95.0, 95.0, 4, 0, 4, 3]]
+    assert bar.live_bar()[1:5] == [96.0, 100.5, 96.0, 100.5]
+
+
+def test_trade_bars_from_websocket():
+    puppeteer = FakePuppeteer(
+        {"TICK": 2, "DOLLAR": 0.05, "NOTIONAL": "homeNotional", "LIMIT": 10}
+    )
+    bars = TradeBars(puppeteer)
+
+    # 接続時の partial は使わない
+    puppeteer._ws.send("partial", [(100.0, 1)] * 5)
+    assert bars.live_bar("tick") is None
+
+    puppeteer._ws.send("insert", [(100.0, 2), (110.0, 3), (105.0, 1)])
+    assert bars.closed("tick") == [
+        [
+            1561939200000,
+            100.0,
+            110.0,
+            100.0,
+            110.0,
+            5,
+            0.02 + 3 / 110.0,
+            2,
+            1561939201000,
+        ]
+    ]
+    # ダラーバーは homeNotional(XBT) で集計する
+    assert bars.column("dollar", "volume") == [6]
+    assert bars.live_bar("tick")[1] == 105.0
+
+    df = bars.candle("tick")
+    assert list(df.columns) == [
+        "open",
+        "high",
+        "low",
+        "close",
+        "volume",
+        "notional",
+        "trades",
+        "end",
+    ]
+    assert df.index[0].year == 2019
@@ -0,0 +1,340 @@
+# マルチタイムフレーム ローソク足
+import time
+import logging
+from datetime import datetime, timezone, timedelta
+
+import pandas as pd
+
+from indicators import SMA, sma
+from modules.candle import Candle
+
+MINUTE = 60 * 1000
+PERIOD = {"1m": MINUTE, "5m": 5 * MINUTE, "1h": 60 * MINUTE, "1d": 1440 * MINUTE}
+
+
+class FakeBitMEX:
+    def __init__(self):
+        self.calls = []
+        self.missing = set()  # 取引所に無い足のtimestamp
+        self.empty = set()  # OHLCがNoneの足のtimestamp
+
+    def ohlcv(self, symbol, timeframe, since, limit, params):
+        self.calls.append((timeframe, since, limit))
+        period = PERIOD[timeframe]
+        now = int(time.time() * 1000)
+        current = now - now % period
+        bars, ts = [], since
+        while ts <= current and len(bars) < limit:
+            if ts in self.empty:
+                bars.append([ts, None, None, None, None, 0.0])
+            elif ts not in self.missing:
+                bars.append([ts, 1.0, 2.0, 0.5, 1.5, 1.0])
+            ts += period
+        return bars
+
+    def to_candleDF(self, candle):
+        df = pd.DataFrame(
+            candle, columns=["timestamp", "open", "high", "low", "close", "volume"]
+        )
+        df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms", utc=True)
+        return df.set_index("timestamp")
+
+
+class FakeWebsocket:
+    def __init__(self):
+        self.listeners = {}
+        self._ws_status = 4
+        self._ts = time.time()
+
+    def add_listener(self, table, callback):
+        self.listeners.setdefault(table, []).append(callback)
+
+    def trade(self, ts, price, size):
+        data = [
+            {
+                "timestamp": ts.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z",
+                "price": price,
+                "size": size,
+                "side": "Buy",
+            }
+        ]
+        for callback in self.listeners["trade"]:
+            callback("insert", data)
+
+
+class FakePuppeteer:
+    def __init__(self, spans, ws=None, warmup=None):
+        self._exchange = None
+        self._logger = logging.getLogger(__name__)
+        self._config = {
+            "SYMBOL": "BTC/USD",
+            "CANDLE": {
+                "SINCE": None,
+                "LIMIT": 100,
+                "REVERSE": False,
+                "PARTIAL": True,
+                "WARMUP": warmup,
+            },
+            "MULTI_TIMEFRAME_CANDLE_SPAN_LIST": spans,
+        }
+        self._ws = ws
+        self._bitmex = FakeBitMEX()
+        self._discord = None
+
+
+def test_snapshot_is_shared_until_changed():
+    puppeteer = FakePuppeteer(["1m", "3m", "15m"], ws=FakeWebsocket())
+    candle = Candle(puppeteer)
+
+    # 15mのために5mが追加され、5mと1mだけを取引所から取得する
+    assert sorted([c[0] for c in puppeteer._bitmex.calls]) == ["1m", "5m"]
+    # 集計する足もLIMIT本の履歴を持つ
+    assert len(candle.candle("3m")) >= 100
+
+    # 更新が無ければ同じものを戻す（コピーしない）
+    snapshot = candle.snapshot("1m")
+    assert candle.snapshot("1m") is snapshot
+    assert candle.candle("1m") is snapshot.df
+
+    # 約定で未確定足が変わっても、足が確定するまでバージョンは変わらない
+    version = candle.version()
+    # ロード直後(同じ期間内)の約定
+    now = datetime.fromtimestamp((candle._trade_cutoff + 1) / 1000, timezone.utc)
+    puppeteer._ws.trade(now, 9.0, 5)
+    # 約定は受信時に集計され、参照時はロックしない
+    assert len(candle._trades) == 0 and "1m" in candle._live_dirty
+    # 未確定足の更新は新しい CandleSnapshot になり、公開済みのものは変わらない
+    high = snapshot.df["high"].iloc[-1]
+    updated = candle.snapshot("1m")
+    assert updated is not snapshot and updated.version == snapshot.version
+    assert updated.df["high"].iloc[-1] == 9.0
+    assert snapshot.df["high"].iloc[-1] == high
+    assert not candle.changed_since(version)
+
+    # 次の期間の約定で足が確定する
+    puppeteer._ws.trade(now + timedelta(minutes=1), 3.0, 1)
+    assert candle.changed_since(version, "1m")
+    assert candle.snapshot("1m").version == candle.version("1m")
+    assert candle.candle("1m")["close"].iloc[-1] == 3.0
+
+
+def test_arbitrary_timeframes():
+    puppeteer = FakePuppeteer(["7m", "15m", "45m", "8h", "2w", "1w"])
+    candle = Candle(puppeteer)
+    builders = candle._builders
+
+    # 足りない基準足が追加され、ルートは最小の基準足
+    assert set(puppeteer._config["MULTI_TIMEFRAME_CANDLE_SPAN_LIST"]) >= set(
+        ["1m", "5m", "1h", "1d"]
+    )
+    assert candle._root is builders["1m"]
+
+    # 親は割り切れる最長の足（中間の足を共有する）
+    assert builders["7m"]._parent is builders["1m"]
+    assert builders["45m"]._parent is builders["15m"]
+    assert builders["15m"]._parent is builders["5m"]
+    assert builders["8h"]._parent is builders["1h"]
+    assert builders["1w"]._parent is builders["1d"]
+    assert builders["2w"]._parent is builders["1w"]
+
+    # 週足は月曜日始まり
+    ts = candle.candle("1w").index[-1]
+    assert ts.dayofweek == 0
+
+
+def test_subscribe_on_bar():
+    puppeteer = FakePuppeteer(["1m", "3m"], ws=FakeWebsocket())
+    candle = Candle(puppeteer)
+    bars = []
+    candle.subscribe(lambda span, bar: bars.append((span, bar)), ["1m"])
+
+    # ロード直後(同じ期間内)の約定
+    now = datetime.fromtimestamp((candle._trade_cutoff + 1) / 1000, timezone.utc)
+    puppeteer._ws.trade(now, 9.0, 5)
+    puppeteer._ws.trade(now + timedelta(minutes=1), 3.0, 1)
+    candle.version()  # 約定を集計
+
+    # 確定足はローソク足スレッドから通知する
+    candle._Candle__dispatch()
+    assert [span for span, _ in bars] == ["1m"]
+    assert bars[0][1][2] == 9.0
+
+
+def test_warmup_depth():
+    puppeteer = FakePuppeteer(["5m", "4h"], warmup={"4h": 200})
+    candle = Candle(puppeteer)
+
+    # 4hの200本のために、1hを500件ずつ遡って取得する
+    calls = [c for c in puppeteer._bitmex.calls if c[0] == "1h"]
+    assert len(calls) == 2
+    assert len(candle.candle("1h")) >= 800
+    assert len(candle.candle("4h")) >= 200
+    assert len(candle.candle("5m")) == 101
+
+
+class DailyPartialBitMEX(FakeBitMEX):
+    # 日足の未確定足は、1mの保持本数より長い期間の約定を含む
+    def ohlcv(self, symbol, timeframe, since, limit, params):
+        bars = super().ohlcv(symbol, timeframe, since, limit, params)
+        if timeframe == "1d" and len(bars) != 0:
+            bars[-1] = [bars[-1][0], 10.0, 50.0, 0.1, 1.5, 1000.0]
+        return bars
+
+
+def test_base_span_live_bar_starts_from_rest_partial():
+    puppeteer = FakePuppeteer(["1m", "1d"], ws=FakeWebsocket())
+    puppeteer._bitmex = DailyPartialBitMEX()
+    candle = Candle(puppeteer)
+
+    # 1mの100本から作らずに、取引所の日足の未確定足を使う
+    day = candle.live_bar("1d")
+    assert day[1:] == [10.0, 50.0, 0.1, 1.5, 1000.0]
+
+    # 集計中の1mが確定しても、出来高は二重に数えない
+    now = datetime.fromtimestamp((candle._trade_cutoff + 1) / 1000, timezone.utc)
+    puppeteer._ws.trade(now, 60.0, 5)
+    puppeteer._ws.trade(now + timedelta(minutes=1), 1.0, 2)
+    if (now + timedelta(minutes=1)).date() == now.date():
+        assert candle.live_bar("1d")[1:] == [10.0, 60.0, 0.1, 1.0, 1007.0]
+
+
+def test_closed_only_and_live_bar():
+    puppeteer = FakePuppeteer(["1m", "3m", "15m"], ws=FakeWebsocket())
+    candle = Candle(puppeteer)
+
+    now = datetime.fromtimestamp((candle._trade_cutoff + 1) / 1000, timezone.utc)
+    puppeteer._ws.trade(now, 9.0, 5)
+
+    for span in ["1m", "3m", "15m"]:
+        closed = candle.candle(span, closed_only=True)
+        live = candle.live_bar(span)
+        # 上位足の確定足には未確定の下位足を含めない
+        assert closed.index[-1].value // 10 ** 6 == candle.last_closed(span)[0]
+        assert live[0] > candle.last_closed(span)[0]
+        assert live[2] == 9.0
+
+        # 未確定足を含む足は確定足 + 未確定足の1行
+        df = candle.candle(span, closed_only=False)
+        assert len(df) == len(closed) + 1
+        assert df["high"].iloc[-1] == 9.0
+        assert candle.candle(span, closed_only=False) is df
+
+    # 確定足は約定で作り直さない
+    closed = candle.candle("15m", closed_only=True)
+    puppeteer._ws.trade(now, 11.0, 1)
+    assert candle.candle("15m", closed_only=True) is closed
+    assert candle.live_bar("15m")[2] == 11.0
+
+
+def test_gap_backfill():
+    puppeteer = FakePuppeteer(["1m", "3m"])
+    now = int(time.time() * 1000)
+    start = now - now % (3 * MINUTE) - 30 * MINUTE
+    puppeteer._bitmex.missing = set([start, start + MINUTE])
+    candle = Candle(puppeteer)
+
+    # 取引所の足の抜けを記録し、含む上位足に印を付ける
+    assert candle.gaps() == [[start, start + 2 * MINUTE]]
+    count = len(candle.candle("1m", closed_only=True))
+    df = candle.candle("3m", closed_only=True)
+    assert [ts.value // 10 ** 6 for ts in df.index[df["gap"]]] == [start]
+    version = candle.version("3m")
+
+    # 抜けた期間だけを取り直す
+    puppeteer._bitmex.missing = set()
+    candle._Candle__backfill()
+    assert puppeteer._bitmex.calls[-1] == ("1m", start, 2)
+    assert candle.gaps() == []
+    assert len(candle.candle("1m", closed_only=True)) == count + 2
+    assert not candle.candle("3m", closed_only=True)["gap"].any()
+    assert candle.changed_since(version, "3m")
+
+
+def test_none_bar_is_skipped_as_gap():
+    puppeteer = FakePuppeteer(["1m"])
+    now = int(time.time() * 1000)
+    empty = now - now % MINUTE - 30 * MINUTE
+    puppeteer._bitmex.empty = set([empty])
+    candle = Candle(puppeteer)
+
+    # OHLCがNoneの足だけを飛ばし、以降の足は取得する（抜けとして取り直す）
+    last = candle.last_closed("1m")[0]
+    assert last == candle._root.bucket(int(time.time() * 1000)) - MINUTE
+    assert candle.gaps() == [[empty, empty + MINUTE]]
+
+
+def test_attach_streaming_indicator():
+    puppeteer = FakePuppeteer(["1m", "3m"], ws=FakeWebsocket())
+    candle = Candle(puppeteer)
+    indicator = candle.attach("1m", SMA(5))
+    assert indicator.count == len(candle.candle("1m", closed_only=True))
+
+    # 未確定足を含めた値
+    now = datetime.fromtimestamp((candle._trade_cutoff + 1) / 1000, timezone.utc)
+    puppeteer._ws.trade(now, 11.5, 1)
+    assert abs(candle.preview("1m", indicator) - (1.5 * 4 + 11.5) / 5) < 1e-9
+    assert indicator.value == 1.5
+    assert candle.locked(lambda: indicator.value) == 1.5
+    assert not candle._lock.locked()
+
+    # 足が確定したら更新する
+    puppeteer._ws.trade(now + timedelta(minutes=1), 3.0, 1)
+    candle.version()
+    closes = candle.candle("1m", closed_only=True)["close"].values
+    assert abs(indicator.value - sma(closes, 5)[-1]) < 1e-9
+
+
+def test_indicator_cache():
+    puppeteer = FakePuppeteer(["1m", "3m"], ws=FakeWebsocket())
+    candle = Candle(puppeteer)
+    candle._indicator_cache.clear()
+
+    a = candle.indicator("3m", "sma", n=5)
+    b = candle.indicator("3m", "sma", n=5)
+    assert a is b
+    assert candle._indicator_cache.stats()["hits"] == 1
+    assert len(a) == len(candle.candle("3m", closed_only=True))
+
+    # 足が確定したら計算し直す
+    now = datetime.fromtimestamp((candle._trade_cutoff + 1) / 1000, timezone.utc)
+    puppeteer._ws.trade(now + timedelta(minutes=3), 3.0, 1)
+    c = candle.indicator("3m", "sma", n=5)
+    assert c is not a
+    assert len(candle._indicator_cache) == 1
+
+
+class CountingSMA(SMA):
+    def load(self, bars):
+        self.loaded = len(bars)
+        return SMA.load(self, bars)
+
+
+def test_checkpoint_restore(tmp_path):
+    puppeteer = FakePuppeteer(["1m", "3m"])
+    puppeteer._config["CHECKPOINT_DIR"] = str(tmp_path)
+    candle = Candle(puppeteer)
+    assert candle._checkpoint.load() is None
+    sma3 = candle.attach("3m", CountingSMA(10))
+    candle.attach("3m", SMA(20))
+    candle._Candle__save_checkpoint()
+
+    # 再起動: 保存後の足だけを取得し、インジケータは続きから計算する
+    restarted = FakePuppeteer(["1m", "3m"])
+    restarted._config["CHECKPOINT_DIR"] = str(tmp_path)
+    candle2 = Candle(restarted)
+    assert [c[0] for c in restarted._bitmex.calls] == ["1m"]
+    assert restarted._bitmex.calls[0][1] > candle._root.last_timestamp()
+    assert candle2.candle("3m").index[-1] >= candle.candle("3m").index[-1]
+
+    restored = candle2.attach("3m", CountingSMA(10))
+    assert restored.loaded <= 1
+    assert restored.value == sma3.value
+    # パラメータが異なるインジケータは履歴から計算する
+    other = candle2.attach("3m", CountingSMA(30))
+    assert other.loaded == len(candle2._builders["3m"].closed())
+
+    # タイムフレームが変わったらチェックポイントは使わない
+    changed = FakePuppeteer(["1m", "5m"])
+    changed._config["CHECKPOINT_DIR"] = str(tmp_path)
+    Candle(changed)
+    assert sorted([c[0] for c in changed._bitmex.calls]) == ["1m", "5m"]
@@ -0,0 +1,201 @@
+# マルチタイムフレーム 逐次集計
+import random
+
+from modules.candlebuilder import BarStore, CandleBuilder, parse_span
+
+MINUTE = 60 * 1000
+
+
+def make_bars(start, count, period=MINUTE):
+    random.seed(1)
+    bars = []
+    price = 100.0
+    for i in range(count):
+        o = price
+        c = o + random.uniform(-1, 1)
+        h = max(o, c) + random.uniform(0, 1)
+        l = min(o, c) - random.uniform(0, 1)
+        bars.append([start + i * period, o, h, l, c, random.uniform(1, 10)])
+        price = c
+    return bars
+
+
+def resample(bars, period):
+    # 単純な全件集計（比較用）
+    result = {}
+    for b in bars:
+        ts = b[0] - b[0] % period
+        if ts not in result:
+            result[ts] = [ts] + list(b[1:6])
+        else:
+            r = result[ts]
+            r[2] = max(r[2], b[2])
+            r[3] = min(r[3], b[3])
+            r[4] = b[4]
+            r[5] += b[5]
+    return [result[ts] for ts in sorted(result)]
+
+
+def tree():
+    root = CandleBuilder("1m", MINUTE, 1000)
+    m3 = CandleBuilder("3m", 3 * MINUTE, 1000)
+    m5 = CandleBuilder("5m", 5 * MINUTE, 1000)
+    m15 = CandleBuilder("15m", 15 * MINUTE, 1000)
+    root.add_child(m3)
+    root.add_child(m5)
+    m5.add_child(m15)
+    return root, m3, m5, m15
+
+
+def assert_bars(actual, expected):
+    assert len(actual) == len(expected)
+    for a, e in zip(actual, expected):
+        assert a[0] == e[0]
+        for x, y in zip(a[1:], e[1:]):
+            assert abs(x - y) < 1e-9
+
+
+def test_push_matches_resample():
+    root, m3, m5, m15 = tree()
+    bars = make_bars(0, 95)
+    events = []
+    for bar in bars:
+        events += root.push(bar, MINUTE)
+
+    assert_bars(root.closed(), bars)
+    for builder in [m3, m5, m15]:
+        expected = resample(bars, builder.period)
+        # 最後の期間が揃っていなければ未確定
+        if (bars[-1][0] + MINUTE) % builder.period != 0:
+            expected = expected[:-1]
+        assert_bars(builder.closed(), expected)
+
+    # 15分足は15分毎に1回だけ確定する
+    assert len([b for b, _ in events if b is m15]) == 6
+
+
+def test_live_bar_includes_partial():
+    root, m3, m5, m15 = tree()
+    bars = make_bars(0, 8)
+    for bar in bars[:-1]:
+        root.push(bar, MINUTE)
+    root.update_partial(bars[-1])
+
+    expected = resample(bars, 5 * MINUTE)[-1]
+    assert_bars([m5.live_bar()], [expected])
+    assert_bars([m15.live_bar()], [resample(bars, 15 * MINUTE)[-1]])
+    assert_bars([root.live_bar()], [bars[-1]])
+
+
+def test_duplicate_bars_are_ignored():
+    root, m3, m5, m15 = tree()
+    bars = make_bars(0, 10)
+    for bar in bars:
+        root.push(bar, MINUTE)
+    for bar in bars[-3:]:
+        root.push(bar, MINUTE)
+    assert_bars(root.closed(), bars)
+    assert_bars(m5.closed(), resample(bars, 5 * MINUTE))
+
+
+def test_sync_from_parent_history():
+    root, m3, m5, m15 = tree()
+    # 期間の途中から始まる履歴
+    bars = make_bars(2 * MINUTE, 40)
+    root.load(bars)
+    for builder in [m3, m5, m15]:
+        builder.load([])
+        builder.sync()
+
+    # 先頭の半端な期間は捨てる
+    aligned = [b for b in bars if b[0] >= 5 * MINUTE]
+    assert_bars(m5.closed(), resample(aligned, 5 * MINUTE)[:-1])
+    assert m5.live_bar()[0] == 40 * MINUTE
+
+    # 続きを逐次集計
+    more = make_bars(42 * MINUTE, 5)
+    for bar in more:
+        root.push(bar, MINUTE)
+    assert m5.closed()[-1][0] == 40 * MINUTE
+    assert m15.closed()[-1][0] == 30 * MINUTE
+
+
+def test_bar_store_trim():
+    store = BarStore(10)
+    for i in range(100):
+        store.append([i, 1, 1, 1, 1, 1])
+    assert store.last_timestamp() == 99
+    assert len(store.to_list()) == 10
+    assert store.column("timestamp")[0] == 90
+
+
+def test_update_trade_and_roll():
+    root, m3, m5, m15 = tree()
+    root.load(make_bars(0, 5))
+
+    root.update_trade(5 * MINUTE + 1000, 10.0, 2)
+    root.update_trade(5 * MINUTE + 2000, 12.0, 1)
+    root.update_trade(5 * MINUTE + 3000, 9.0, 1)
+    assert root.live_bar() == [5 * MINUTE, 10.0, 12.0, 9.0, 9.0, 4]
+
+    # 確定済みの期間の約定は無視する
+    root.update_trade(4 * MINUTE, 100.0, 1)
+    assert root.live_bar()[2] == 12.0
+
+    # 約定の無い期間は直前の終値で埋める
+    events = root.update_trade(8 * MINUTE + 1000, 11.0, 1)
+    assert [b[0] for b in root.closed()[-3:]] == [5 * MINUTE, 6 * MINUTE, 7 * MINUTE]
+    assert root.closed()[-1] == [7 * MINUTE, 9.0, 9.0, 9.0, 9.0, 0]
+    assert len([b for b, _ in events if b is root]) == 3
+
+    # 期間の切り替わりで確定する
+    events = root.roll(9 * MINUTE)
+    assert root.live_bar() is None
+    assert root.closed()[-1] == [8 * MINUTE, 11.0, 11.0, 11.0, 11.0, 1]
+    assert m3.closed()[-1][0] == 6 * MINUTE
+
+
+def test_parse_span():
+    assert parse_span("7m") == (7 * MINUTE, 0)
+    assert parse_span("8h") == (8 * 60 * MINUTE, 0)
+    assert parse_span("2w")[0] == 14 * 1440 * MINUTE
+    for span in ["0m", "1y", "m", "1.5h"]:
+        try:
+            parse_span(span)
+            assert False
+        except ValueError:
+            pass
+
+    # 週足は月曜日(1970-01-05)始まりで、日足から集計できる
+    period, offset = parse_span("1w")
+    week = CandleBuilder("1w", period, 10, offset)
+    day = CandleBuilder("1d", 1440 * MINUTE, 10)
+    assert week.bucket(10 * 1440 * MINUTE) == 4 * 1440 * MINUTE
+    assert day.can_aggregate(week)
+    assert not CandleBuilder("7m", 7 * MINUTE, 10).can_aggregate(week)
+
+
+def test_gap_fill_rebuilds_children():
+    root, m3, m5, m15 = tree()
+    bars = make_bars(0, 30)
+    root.load(bars[:10])
+    for builder in [m3, m5, m15]:
+        builder.load([])
+        builder.sync()
+
+    # 約定の無い期間は直前の終値で埋め、ギャップとして記録する
+    root.update_trade(13 * MINUTE + 1000, 50.0, 1)
+    assert root.gaps() == [[10 * MINUTE, 13 * MINUTE]]
+    assert root.closed()[-1][5] == 0
+
+    # 取引所の足(抜けを含む)を取得しても、ギャップとして記録する
+    root.roll(14 * MINUTE)
+    root.push(bars[20], MINUTE)
+    assert root.gaps() == [[10 * MINUTE, 13 * MINUTE], [14 * MINUTE, 20 * MINUTE]]
+
+    # 取り直した足で置き換え、上位足を集計し直す
+    root.fill(bars[10:20], 10 * MINUTE, 20 * MINUTE)
+    assert root.gaps() == []
+    assert_bars(root.closed(), bars[:21])
+    assert_bars(m5.closed(), resample(bars[:20], 5 * MINUTE))
+    assert_bars(m3.closed(), resample(bars[:21], 3 * MINUTE))
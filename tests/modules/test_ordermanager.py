@@ -0,0 +1,124 @@
+# 注文状態管理
+import time
+import logging
+
+from modules.ordermanager import OrderManager
+
+
+class FakeBitMEX:
+    def __init__(self):
+        self.listeners = []
+        self.rest_calls = 0
+
+    def add_order_listener(self, callback):
+        self.listeners.append(callback)
+
+    def open_orders(self):
+        self.rest_calls += 1
+        return []
+
+
+class FakeWebsocket:
+    def __init__(self):
+        self.listeners = {}
+        self._ws_status = 4
+        self._ts = time.time()
+
+    def add_listener(self, table, callback):
+        self.listeners.setdefault(table, []).append(callback)
+
+    def push(self, table, action, data):
+        for callback in self.listeners[table]:
+            callback(action, data)
+
+
+class FakePuppeteer:
+    def __init__(self):
+        self._exchange = None
+        self._logger = logging.getLogger(__name__)
+        self._config = {}
+        self._ws = FakeWebsocket()
+        self._bitmex = FakeBitMEX()
+        self._discord = None
+
+
+def test_rest_and_websocket_are_merged():
+    p = FakePuppeteer()
+    manager = OrderManager(p)
+    p._ws.push("order", "partial", [])
+
+    # RESTの注文結果
+    order = {
+        "orderID": "A",
+        "clOrdID": "1_limit_buy",
+        "leavesQty": 10,
+        "ordStatus": "New",
+        "timestamp": "2019-01-01T00:00:01.000Z",
+    }
+    p._bitmex.listeners[0]([order])
+    assert [o["orderID"] for o in manager.open_orders()] == ["A"]
+    assert manager.order(clOrdID="1_limit_buy")["leavesQty"] == 10
+
+    # 約定
+    p._ws.push(
+        "execution",
+        "insert",
+        [
+            {
+                "execID": "E1",
+                "execType": "Trade",
+                "orderID": "A",
+                "lastPx": 100,
+                "lastQty": 10,
+                "leavesQty": 0,
+                "ordStatus": "Filled",
+                "timestamp": "2019-01-01T00:00:02.000Z",
+            }
+        ],
+    )
+    assert manager.open_orders() == []
+    assert manager.fills("A")[0]["qty"] == 10
+    assert p._bitmex.rest_calls == 0
+
+
+def test_stale_websocket_falls_back_to_rest():
+    p = FakePuppeteer()
+    manager = OrderManager(p)
+    p._ws.push("order", "partial", [])
+    p._ws._ts = time.time() - 60
+    manager.open_orders()
+    assert p._bitmex.rest_calls == 1
+
+
+def test_missing_orders_get_terminal_status():
+    p = FakePuppeteer()
+    manager = OrderManager(p)
+    p._ws.push(
+        "order",
+        "partial",
+        [
+            {"orderID": "A", "leavesQty": 10, "cumQty": 0, "ordStatus": "New"},
+            {
+                "orderID": "B",
+                "orderQty": 10,
+                "leavesQty": 5,
+                "cumQty": 5,
+                "ordStatus": "PartiallyFilled",
+            },
+            {
+                "orderID": "C",
+                "orderQty": 10,
+                "leavesQty": 10,
+                "cumQty": 10,
+                "ordStatus": "New",
+            },
+        ],
+    )
+    assert len(manager.open_orders()) == 3
+
+    # 再接続時の全体像に無い注文は終了している
+    p._ws.push("order", "partial", [])
+    assert manager.open_orders() == []
+    assert manager.order(orderID="A")["ordStatus"] == "Canceled"
+    assert manager.order(orderID="B")["ordStatus"] == "Canceled"
+    assert manager.order(orderID="C")["ordStatus"] == "Filled"
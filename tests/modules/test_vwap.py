@@ -0,0 +1,67 @@
+# VWAP・TWAP
+import logging
+import math
+
+from modules.vwap import Vwap
+from tests.modules.test_bars import FakeWebsocket
+
+
+class FakeCandle:
+    def __init__(self):
+        self.attached = {}
+
+    def attach(self, span, indicator):
+        self.attached[span] = indicator
+        return indicator
+
+    def locked(self, func):
+        self.locked_calls = getattr(self, "locked_calls", 0) + 1
+        return func()
+
+
+class FakePuppeteer:
+    def __init__(self, config, path=None):
+        self._logger = logging.getLogger(__name__)
+        self._config = {"SYMBOL": "BTC/USD", "VWAP": config, "VWAP_STATE_DIR": path}
+        self._ws = FakeWebsocket()
+        self._candle = FakeCandle()
+
+
+def test_vwap_from_websocket_and_candle():
+    puppeteer = FakePuppeteer({"all": {}, "1m": {"SPAN": "1m"}})
+    vwap = Vwap(puppeteer)
+    assert puppeteer._candle.attached["1m"] is vwap._vwaps["1m"]
+
+    # 接続時の partial は使わない
+    puppeteer._ws.send("partial", [(100.0, 1)] * 3)
+    assert math.isnan(vwap.vwap("all"))
+    puppeteer._ws.send("insert", [(100.0, 1), (110.0, 3)])
+    assert vwap.vwap("all") == 107.5
+    assert 100.0 <= vwap.twap("all") <= 110.0
+    # 確定足から集計するものは、ローソク足のロックで参照する
+    assert math.isnan(vwap.vwap("1m"))
+    assert puppeteer._candle.locked_calls == 1
+
+
+def test_vwap_state_is_restored(tmp_path):
+    config = {"all": {}, "day": {"SESSION": "day"}}
+    puppeteer = FakePuppeteer(config, str(tmp_path))
+    vwap = Vwap(puppeteer)
+    puppeteer._ws.send("insert", [(100.0, 1), (110.0, 3)])
+    vwap.save()
+    # 保存は SAVE_INTERVAL 秒に1回（終了時は force で保存する）
+    puppeteer._ws.send("insert", [(200.0, 4)])
+    vwap.save()
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "vwap_BTCUSD_all.json",
+        "vwap_BTCUSD_day.json",
+    ]
+
+    # 再起動（2019-07-01 のセッションは替わっているので day は0から）
+    restarted = Vwap(FakePuppeteer(config, str(tmp_path)))
+    assert restarted.vwap("all") == 107.5
+    assert math.isnan(restarted.vwap("day"))
+
+    vwap.save(force=True)
+    restarted = Vwap(FakePuppeteer(config, str(tmp_path)))
+    assert restarted.vwap("all") == (100.0 + 330.0 + 800.0) / 8